@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+"""
+Compare the hand-written codec in docstore.models with cattrs, for
+converting documents to and from plain dicts.
+
+Usage: python benchmarks/codec.py
+"""
+
+import json
+import time
+
+import cattr
+from fake_documents import create_documents
+
+from docstore.models import (
+    DocstoreEncoder,
+    Document,
+    structure_document,
+    unstructure_document,
+)
+
+
+def best_of(func, *, repeat: int = 5) -> float:  # type: ignore
+    timings = []
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    return min(timings)
+
+
+if __name__ == "__main__":
+    documents = create_documents(10_000)
+    unstructured = json.loads(
+        json.dumps(cattr.unstructure(documents), cls=DocstoreEncoder)
+    )
+
+    print(f"{'':>12} {'cattrs':>10} {'codec':>10} {'speedup':>8}")
+
+    for name, slow, fast in [
+        (
+            "structure",
+            lambda: cattr.structure(unstructured, list[Document]),
+            lambda: [structure_document(d) for d in unstructured],
+        ),
+        # cattrs leaves datetimes as-is, and they get serialised by the
+        # JSON encoder, so compare the time to get all the way to JSON.
+        (
+            "unstructure",
+            lambda: json.dumps(cattr.unstructure(documents), cls=DocstoreEncoder),
+            lambda: json.dumps([unstructure_document(d) for d in documents]),
+        ),
+    ]:
+        slow_time = best_of(slow)
+        fast_time = best_of(fast)
+        print(
+            f"{name:>12} {slow_time:>9.3f}s {fast_time:>9.3f}s "
+            f"{slow_time / fast_time:>7.1f}x"
+        )
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+"""
+Compare the time to load a collection of documents from a cold start,
+with and without the binary snapshot cache.
+
+Usage: python benchmarks/cold_load.py
+"""
+
+import os
+import pathlib
+import tempfile
+import time
+
+from fake_documents import create_documents
+
+from docstore.documents import db_path, write_documents
+from docstore.models import from_json
+from docstore.snapshot_cache import cache_path, read_snapshot
+
+
+def best_of(func, *, repeat: int = 3) -> float:  # type: ignore
+    timings = []
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    return min(timings)
+
+
+if __name__ == "__main__":
+    print(f"{'documents':>10} {'from_json':>10} {'cached':>10} {'speedup':>8}")
+
+    for count in (1_000, 10_000, 100_000):
+        root = pathlib.Path(tempfile.mkdtemp())
+        write_documents(root=root, documents=create_documents(count))
+
+        uncached = best_of(lambda root=root: from_json(db_path(root).read_text()))
+
+        # Populate the cache, then time reading from it
+        read_snapshot(root, path=db_path(root))
+        assert os.path.exists(cache_path(root))
+        cached = best_of(lambda root=root: read_snapshot(root, path=db_path(root)))
+
+        print(
+            f"{count:>10} {uncached:>9.3f}s {cached:>9.3f}s {uncached / cached:>7.1f}x"
+        )
@@ -0,0 +1,52 @@
+"""
+Creates synthetic collections of documents for the benchmarks.
+"""
+
+import datetime
+import random
+
+from docstore.models import Dimensions, Document, File, Thumbnail
+
+
+def create_documents(count: int, *, seed: int = 0) -> list[Document]:
+    """
+    Returns ``count`` documents that look roughly like a real collection:
+    most documents have one file, a few have several, and the tags are
+    drawn from a vocabulary of a few hundred values.
+    """
+    rand = random.Random(seed)
+
+    tags = [f"tag{i}" for i in range(300)] + [f"by:Author {i}" for i in range(50)]
+    start = datetime.datetime(2010, 1, 1)
+
+    documents = []
+
+    for i in range(count):
+        date_saved = start + datetime.timedelta(minutes=rand.randint(0, 5_000_000))
+        file_count = rand.choice([1] * 9 + [2, 3])
+
+        documents.append(
+            Document(
+                title=f"Document {i}",
+                date_saved=date_saved,
+                tags=rand.sample(tags, rand.randint(1, 5)),
+                files=[
+                    File(
+                        filename=f"document-{i}-{j}.pdf",
+                        path=f"files/d/document-{i}-{j}.pdf",
+                        size=rand.randint(10_000, 10_000_000),
+                        checksum=f"sha256:{rand.getrandbits(256):064x}",
+                        source_url=f"https://example{rand.randint(0, 20)}.org/{i}",
+                        date_saved=date_saved,
+                        thumbnail=Thumbnail(
+                            path=f"thumbnails/d/document-{i}-{j}.pdf.png",
+                            dimensions=Dimensions(rand.randint(200, 400), 400),
+                            tint_color=rand.choice(["#007f7f", "#000000", "#d01c11"]),
+                        ),
+                    )
+                    for j in range(file_count)
+                ],
+            )
+        )
+
+    return documents
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+"""
+Measure how much memory it takes to hold a collection of documents,
+using tracemalloc.
+
+This compares the models in docstore.models with a baseline that
+stores documents the way we used to: model classes with a per-instance
+``__dict__``, and a new string or datetime for every value we parse.
+
+Usage: python benchmarks/memory.py
+"""
+
+import datetime
+import json
+import tracemalloc
+import typing
+
+import attr
+from fake_documents import create_documents
+
+from docstore.models import (
+    Dimensions,
+    Document,
+    File,
+    Thumbnail,
+    ThumbnailVariant,
+    from_json,
+    to_json,
+)
+
+
+def unslotted(cls: type) -> type:
+    """
+    Returns a copy of one of the model classes without slots, so every
+    instance has its own ``__dict__``.
+    """
+    return attr.make_class(
+        cls.__name__, [f.name for f in attr.fields(cls)], slots=False
+    )
+
+
+BaselineDimensions = unslotted(Dimensions)
+BaselineThumbnailVariant = unslotted(ThumbnailVariant)
+BaselineThumbnail = unslotted(Thumbnail)
+BaselineFile = unslotted(File)
+BaselineDocument = unslotted(Document)
+
+
+def structure_baseline(d: dict[str, typing.Any]) -> typing.Any:
+    """
+    Like ``structure_document``, but without interning the tags and
+    tint colours or sharing datetimes between a document and its files.
+    """
+    parse_datetime = datetime.datetime.fromisoformat
+
+    return BaselineDocument(
+        title=d["title"],
+        id=d["id"],
+        date_saved=parse_datetime(d["date_saved"]),
+        tags=d["tags"],
+        files=[
+            BaselineFile(
+                filename=f["filename"],
+                path=f["path"],
+                size=f["size"],
+                checksum=f["checksum"],
+                thumbnail=BaselineThumbnail(
+                    path=f["thumbnail"]["path"],
+                    dimensions=BaselineDimensions(**f["thumbnail"]["dimensions"]),
+                    tint_color=f["thumbnail"]["tint_color"],
+                    variants=[
+                        BaselineThumbnailVariant(
+                            path=v["path"],
+                            format=v["format"],
+                            dimensions=BaselineDimensions(**v["dimensions"]),
+                        )
+                        for v in f["thumbnail"]["variants"]
+                    ],
+                ),
+                source_url=f["source_url"],
+                date_saved=parse_datetime(f["date_saved"]),
+                id=f["id"],
+            )
+            for f in d["files"]
+        ],
+    )
+
+
+def measure(load: typing.Callable[[], list[typing.Any]]) -> int:
+    """
+    Returns the memory held by the documents returned from ``load``.
+    """
+    tracemalloc.start()
+    documents = load()
+
+    # The intermediate dicts from parsing the JSON have been freed by now,
+    # so this only counts the memory held by the documents.
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    del documents
+
+    return current
+
+
+if __name__ == "__main__":
+    count = 100_000
+    documents = create_documents(count)
+    json_string = to_json(documents)
+
+    file_count = sum(len(doc.files) for doc in documents)
+    del documents
+
+    baseline = measure(
+        lambda: [structure_baseline(d) for d in json.loads(json_string)["documents"]]
+    )
+    current = measure(lambda: from_json(json_string))
+
+    print(f"documents: {count}")
+    print(f"files:     {file_count}")
+    print()
+    print(f"{'':>20} {'baseline':>10} {'models':>10}")
+    print(
+        f"{'total memory (MiB)':>20} "
+        f"{baseline / 1024 / 1024:>10.1f} {current / 1024 / 1024:>10.1f}"
+    )
+    print(
+        f"{'bytes per document':>20} {baseline / count:>10.0f} {current / count:>10.0f}"
+    )
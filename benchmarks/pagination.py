@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+"""
+Compare the time to pick the first page of documents by sorting every
+matching document, and with the cached sort orders and top-k selection
+in DocumentIndex.
+
+Usage: python benchmarks/pagination.py
+"""
+
+import functools
+import time
+
+from fake_documents import create_documents
+
+from docstore.indexes import SORT_ORDERS, DocumentIndex
+
+PAGE_SIZE = 100
+
+
+def best_of(func, *, repeat: int = 5) -> float:  # type: ignore
+    timings = []
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    return min(timings)
+
+
+if __name__ == "__main__":
+    print(
+        f"{'documents':>10} {'matching':>10} {'sorted':>10} {'top-k':>10} {'speedup':>8}"
+    )
+
+    for count in (1_000, 10_000, 100_000):
+        index = DocumentIndex(create_documents(count))
+        sort_key, reverse = SORT_ORDERS["date (newest first)"]
+
+        # Every document, a broad filter, and a narrow filter
+        for documents in (
+            index.documents,
+            index.documents[::2],
+            index.documents_with_tags({"tag1"}),
+        ):
+            full_sort = best_of(
+                functools.partial(sorted, documents, key=sort_key, reverse=reverse)
+            )
+
+            # Build the cached sort order before timing
+            index.top_documents(documents, sort_by="date (newest first)", count=1)
+            top_k = best_of(
+                functools.partial(
+                    index.top_documents,
+                    documents,
+                    sort_by="date (newest first)",
+                    count=PAGE_SIZE,
+                )
+            )
+
+            print(
+                f"{count:>10} {len(documents):>10} {full_sort:>9.4f}s {top_k:>9.4f}s "
+                f"{full_sort / top_k:>7.1f}x"
+            )
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+"""
+Compare the time to place a large file in the store, with each of the
+ways ``normalised_filename_copy`` can put it there.
+
+The time includes computing the SHA-256 checksum, which we need for
+every new file however it's placed.  For large files, this is most of
+the time spent storing a new document.
+
+Usage: python benchmarks/placement.py [SIZE_IN_MB]
+"""
+
+import hashlib
+import os
+import pathlib
+import shutil
+import sys
+import tempfile
+import time
+
+from docstore.documents import sha256
+from docstore.file_normalisation import normalised_filename_copy
+
+
+def copy_then_hash(src: str, dst: str) -> None:
+    """
+    How we used to store files: copy through Python with the default
+    buffer size, then read the copy again to hash it.
+    """
+    with open(dst, "xb") as out_file, open(src, "rb") as infile:
+        shutil.copyfileobj(infile, out_file)
+
+    h = hashlib.sha256()
+    with open(dst, "rb") as infile:
+        for byte_block in iter(lambda: infile.read(4096), b""):
+            h.update(byte_block)
+
+    _ = os.stat(dst).st_size
+
+
+def time_placement(src: str, out_dir: str, func) -> float:  # type: ignore
+    dst = os.path.join(out_dir, "dst.bin")
+
+    timings = []
+
+    for _ in range(3):
+        if os.path.exists(dst):
+            os.unlink(dst)
+
+        start = time.perf_counter()
+        func(src, dst)
+        timings.append(time.perf_counter() - start)
+
+    os.unlink(dst)
+    return min(timings)
+
+
+if __name__ == "__main__":
+    try:
+        size_mb = int(sys.argv[1])
+    except IndexError:
+        size_mb = 1024
+
+    tmp_dir = tempfile.mkdtemp()
+    src = os.path.join(tmp_dir, "src.bin")
+
+    with open(src, "wb") as out_file:
+        out_file.writelines(os.urandom(1024 * 1024) for _ in range(size_mb))
+
+    methods = {
+        "copy, then hash (old)": copy_then_hash,
+        "copy and hash in one pass": lambda src, dst: normalised_filename_copy(
+            src=src, dst=dst
+        ),
+        "hash, then clone/kernel copy": lambda src, dst: normalised_filename_copy(
+            src=src, dst=dst, checksum=sha256(pathlib.Path(src))
+        ),
+        "hash, then hard link": lambda src, dst: normalised_filename_copy(
+            src=src, dst=dst, link=True, checksum=sha256(pathlib.Path(src))
+        ),
+    }
+
+    result = normalised_filename_copy(
+        src=src, dst=os.path.join(tmp_dir, "probe.bin"), checksum="sha256:probe"
+    )
+    print(
+        f"Placing a {size_mb} MB file; without linking, this filesystem uses "
+        f"{result['method']!r}\n"
+    )
+
+    for label, func in methods.items():
+        print(f"{label:<30} {time_placement(src, tmp_dir, func):6.2f}s")
+
+    shutil.rmtree(tmp_dir)
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+"""
+Time how long it takes to create a thumbnail of each type of file,
+and which thumbnailer was used.
+
+Thumbnailers that aren't installed (e.g. pdftoppm, ffmpeg) are skipped,
+and the file falls back to the next one in ``THUMBNAILERS``.
+
+For JPEGs, this also compares the in-process Pillow thumbnailer with
+decoding the whole image at full size, which is what it would do
+without ``draft()`` and ``reducing_gap``.
+
+Usage: python benchmarks/thumbnails.py
+"""
+
+import functools
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+from PIL import Image
+
+from docstore.thumbnails import (
+    create_thumbnail,
+    get_file_type,
+    get_thumbnailer_timings,
+    reset_thumbnailer_timings,
+)
+
+
+def best_of(func, *, repeat: int = 5) -> float:  # type: ignore
+    timings = []
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    return min(timings)
+
+
+def full_size_jpeg_thumbnail(path: str, out_path: str) -> None:
+    im = Image.open(path)
+    im.load()
+    im.thumbnail((400, 400))
+    im.save(out_path)
+
+
+def create_sample_files(tmp_dir: str) -> list[str]:
+    photo = Image.effect_mandelbrot((6000, 4000), (-2, -1.5, 1, 1.5), 100)
+
+    jpeg_path = os.path.join(tmp_dir, "photo.jpg")
+    photo.convert("RGB").save(jpeg_path, quality=90)
+
+    png_path = os.path.join(tmp_dir, "scan.png")
+    photo.save(png_path)
+
+    paths = [
+        jpeg_path,
+        png_path,
+        "tests/files/Rotating_earth_(large)_singleframe.gif",
+        "tests/files/Newtons_cradle.gif",
+        "tests/files/snakes.pdf",
+        "tests/files/credits.txt",
+    ]
+
+    if shutil.which("ffmpeg"):
+        video_path = os.path.join(tmp_dir, "video.mp4")
+        subprocess.check_call(
+            [
+                "ffmpeg",
+                "-loglevel",
+                "error",
+                "-f",
+                "lavfi",
+                "-i",
+                "testsrc=duration=5:size=1920x1080:rate=30",
+                "-pix_fmt",
+                "yuv420p",
+                video_path,
+            ]
+        )
+        paths.append(video_path)
+
+    return paths
+
+
+if __name__ == "__main__":
+    tmp_dir = tempfile.mkdtemp()
+
+    print(f"{'file':<42} {'type':<13} {'time':>8}  thumbnailer")
+
+    for path in create_sample_files(tmp_dir):
+        reset_thumbnailer_timings()
+
+        elapsed = best_of(functools.partial(create_thumbnail, path, max_size=400))
+
+        used = [
+            name
+            for name, timings in get_thumbnailer_timings().items()
+            if timings["calls"] > timings["failures"]
+        ]
+
+        print(
+            f"{os.path.basename(path):<42} {get_file_type(path):<13} "
+            f"{elapsed:7.3f}s  {', '.join(used)}"
+        )
+
+    jpeg_path = os.path.join(tmp_dir, "photo.jpg")
+    full_size = best_of(
+        lambda: full_size_jpeg_thumbnail(jpeg_path, os.path.join(tmp_dir, "full.png"))
+    )
+    print(f"\nphoto.jpg, decoded at full size (no draft): {full_size:.3f}s")
+
+    shutil.rmtree(tmp_dir)
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+"""
+Compare the in-process k-means in docstore.tint_colors with the external
+``dominant_colours`` tool we used to run as a subprocess, for choosing
+the tint colour of the images in tests/files.
+
+If ``dominant_colours`` isn't installed, only the in-process times
+are shown.
+
+Usage: python benchmarks/tint_colors.py
+"""
+
+import functools
+import glob
+import os
+import shutil
+import time
+
+from docstore.tint_colors import (
+    Color,
+    _dominant_colors_from_subprocess,
+    choose_tint_color_for_file,
+    choose_tint_color_from_dominant_colors,
+)
+
+
+def best_of(func, *, repeat: int = 5) -> float:  # type: ignore
+    timings = []
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    return min(timings)
+
+
+def choose_tint_color_with_subprocess(path: str) -> Color:
+    return choose_tint_color_from_dominant_colors(
+        dominant_colors=_dominant_colors_from_subprocess(path, max_colors=12),
+        background_color=(1, 1, 1),
+    )
+
+
+def as_hex(color: Color) -> str:
+    r, g, b = (int(c * 255) for c in color)
+    return f"#{r:02x}{g:02x}{b:02x}"
+
+
+if __name__ == "__main__":
+    has_subprocess = shutil.which("dominant_colours") is not None
+
+    print(f"{'file':<42} {'in-process':>18} {'subprocess':>18}")
+
+    for path in sorted(glob.glob("tests/files/*.png") + glob.glob("tests/files/*.gif")):
+        in_process = (
+            f"{best_of(functools.partial(choose_tint_color_for_file, path)):.3f}s"
+        )
+        in_process += f" {as_hex(choose_tint_color_for_file(path))}"
+
+        if has_subprocess:
+            subprocess_time = best_of(
+                functools.partial(choose_tint_color_with_subprocess, path)
+            )
+            subprocess_result = (
+                f"{subprocess_time:.3f}s "
+                f"{as_hex(choose_tint_color_with_subprocess(path))}"
+            )
+        else:
+            subprocess_result = "(not installed)"
+
+        print(f"{os.path.basename(path):<42} {in_process:>18} {subprocess_result:>18}")
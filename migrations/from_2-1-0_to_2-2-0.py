@@ -10,11 +10,14 @@ import datetime
 import filecmp
 import json
 import os
+import pathlib
 import shutil
 import sys
 
 import tqdm
 
+from docstore.derivative_cache import get_derivatives
+from docstore.documents import THUMBNAIL_SIZE
 from docstore.git import current_commit
 from docstore.tint_colors import choose_tint_color
 
@@ -37,6 +40,24 @@ if __name__ == "__main__":
     # Backfill the thumbnail dimensions
     for doc in tqdm.tqdm(documents["documents"]):
         for f in doc["files"]:
+            # If we've already chosen a tint colour for a file with the
+            # same contents, reuse it rather than running k-means again.
+            #
+            # We don't save new tint colours in the cache: these files
+            # have thumbnails from older versions of docstore, and the
+            # cache should only have thumbnails from the current version.
+            cache_key = {
+                "checksum": f["checksum"],
+                "extension": os.path.splitext(f["path"])[1],
+                "max_size": THUMBNAIL_SIZE,
+            }
+
+            cached = get_derivatives(pathlib.Path(root), **cache_key)
+
+            if cached is not None:
+                f["thumbnail"]["tint_color"] = cached["tint_color"]
+                continue
+
             tint_color = choose_tint_color(
                 thumbnail_path=os.path.join(root, f["thumbnail"]["path"]),
                 file_path=os.path.join(root, f["path"]),
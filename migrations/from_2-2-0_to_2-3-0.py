@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+"""
+DB schema migration: v2.2.0 ~> v2.3.0
+
+*   Record the smaller variants (e.g. WebP) on Thumbnail instances.
+
+Existing thumbnails don't have any variants; run
+
+    docstore regenerate-thumbnails
+
+after this migration to create them.
+
+For instances that use the SQLite backend, this creates the new
+table for the variants.
+
+"""
+
+import filecmp
+import json
+import os
+import pathlib
+import shutil
+import sys
+
+from docstore import journal, sqlite_store
+from docstore.documents import write_documents
+from docstore.models import structure_document
+
+OLD_DB_SCHEMA = "v2.2.0"
+NEW_DB_SCHEMA = "v2.3.0"
+
+
+def add_empty_variants(doc: dict) -> None:  # type: ignore
+    for f in doc["files"]:
+        f["thumbnail"].setdefault("variants", [])
+
+
+if __name__ == "__main__":
+    try:
+        root = sys.argv[1]
+    except IndexError:
+        root = "."
+
+    if os.path.exists(sqlite_store.sqlite_path(pathlib.Path(root))):
+        sqlite_store.create_schema(sqlite_store.sqlite_path(pathlib.Path(root)))
+        print("Run `docstore regenerate-thumbnails` to create the thumbnail variants")
+        sys.exit(0)
+
+    documents_path = os.path.join(root, "documents.json")
+    backup_path = os.path.join(root, f"documents.{OLD_DB_SCHEMA}.json.bak")
+
+    if not os.path.exists(documents_path):
+        sys.exit(f"There is no documents.json in {root}; nothing to migrate")
+
+    with open(documents_path) as infile:
+        documents = json.load(infile)
+    assert documents["docstore"]["db_schema"] == OLD_DB_SCHEMA
+
+    for doc in documents["documents"]:
+        add_empty_variants(doc)
+
+    # Any changes in the journal were written with the old schema, so
+    # fold them into the new snapshot.
+    operations, _ = journal.read_operations(pathlib.Path(root))
+
+    for op in operations:
+        if "document" in op:
+            add_empty_variants(op["document"])
+
+    new_documents = journal.apply_operations(
+        [structure_document(doc) for doc in documents["documents"]], operations
+    )
+
+    if os.path.exists(backup_path) and not filecmp.cmp(
+        backup_path, documents_path, shallow=False
+    ):
+        raise RuntimeError("Have you already started a migration of this version?")
+
+    shutil.copyfile(documents_path, backup_path)
+
+    # Write the new database, which also clears the journal
+    write_documents(root=pathlib.Path(root), documents=new_documents)
+
+    print("Run `docstore regenerate-thumbnails` to create the thumbnail variants")
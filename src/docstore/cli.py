@@ -34,13 +34,14 @@ def _require_existing_instance(inner):  # type: ignore
 
     @functools.wraps(inner)
     def wrapper(*args, **kwargs):  # type: ignore
-        from docstore.documents import db_path
+        from docstore.documents import db_path, uses_sqlite
 
         root = click.get_current_context().obj
 
         if (
             root == "."
             and not os.path.exists(db_path(pathlib.Path(".")))
+            and not uses_sqlite(pathlib.Path("."))
             and not any(ag == "--root" or ag.startswith("--root=") for ag in sys.argv)
         ):  # pragma: no cover
             click.echo(
@@ -65,6 +66,41 @@ def _require_existing_instance(inner):  # type: ignore
 )
 @click.option("--debug", default=False, is_flag=True, help="Run in debug mode.")
 @click.option("--profile", default=False, is_flag=True, help="Run a profiler.")
+@click.option(
+    "--watch/--no-watch",
+    default=True,
+    help="Reload the documents in the background when they change.",
+    show_default=True,
+)
+@click.option(
+    "--worker/--no-worker",
+    default=True,
+    help="Create deferred thumbnails in the background.",
+    show_default=True,
+)
+@click.option(
+    "--lazy_thumbnails",
+    is_flag=True,
+    help="Create missing thumbnails and size variants when they're first requested.",
+)
+@click.option(
+    "--render_workers",
+    default=4,
+    help="How many thumbnails to create at once with --lazy_thumbnails.",
+    show_default=True,
+)
+@click.option(
+    "--page_cache_entries",
+    default=128,
+    help="How many rendered pages to cache (0 to disable the cache).",
+    show_default=True,
+)
+@click.option(
+    "--page_cache_bytes",
+    default=32 * 1024 * 1024,
+    help="The maximum size of the rendered page cache (bytes).",
+    show_default=True,
+)
 @click.pass_obj
 def serve(
     root: pathlib.Path,
@@ -74,10 +110,32 @@ def serve(
     profile: bool,
     title: str,
     thumbnail_width: int,
+    watch: bool,
+    worker: bool,
+    lazy_thumbnails: bool,
+    render_workers: int,
+    page_cache_entries: int,
+    page_cache_bytes: int,
 ) -> None:  # pragma: no cover
     from docstore.server import create_app, run_profiler, run_server
+    from docstore.watcher import DocumentWatcher
+    from docstore.worker import ThumbnailWorker
+
+    app = create_app(
+        root=root,
+        title=title,
+        thumbnail_width=thumbnail_width,
+        lazy_thumbnails=lazy_thumbnails,
+        render_workers=render_workers,
+        page_cache_entries=page_cache_entries,
+        page_cache_bytes=page_cache_bytes,
+    )
+
+    if watch:
+        DocumentWatcher(root).start()
 
-    app = create_app(root=root, title=title, thumbnail_width=thumbnail_width)
+    if worker:
+        ThumbnailWorker(root).start()
 
     if profile:
         run_profiler(app, host=host, port=port)
@@ -85,25 +143,50 @@ def serve(
         run_server(app, host=host, port=port, debug=debug)
 
 
+_on_duplicate_option = click.option(
+    "--on_duplicate",
+    type=click.Choice(["link", "warn", "skip"]),
+    default="link",
+    help="What to do with files that are already stored: reuse the stored "
+    "copy (link), reuse it with a warning (warn), or don't store them (skip).",
+    show_default=True,
+)
+
+
+_defer_thumbnails_option = click.option(
+    "--defer_thumbnails",
+    is_flag=True,
+    help="Store new files with a placeholder thumbnail, and create the real "
+    "thumbnail later with `docstore worker` or `docstore serve`.",
+)
+
+
 def _add_document(
     root: pathlib.Path,
     path: pathlib.Path,
     title: str | None,
     tags: str | None,
     source_url: str | None,
+    on_duplicate: typing.Literal["link", "warn", "skip"],
+    defer_thumbnails: bool = False,
 ) -> None:
-    from docstore.documents import store_new_document
-
-    document = store_new_document(
-        root=root,
-        path=path,
-        title=title or "",
-        tags=[t.strip() for t in (tags or "").split(",") if t.strip()],
-        source_url=source_url,
-        date_saved=datetime.datetime.now(),
-    )
-
-    print(document.id)
+    from docstore.documents import DuplicateFileError, store_new_document
+
+    try:
+        document = store_new_document(
+            root=root,
+            path=path,
+            title=title or "",
+            tags=[t.strip() for t in (tags or "").split(",") if t.strip()],
+            source_url=source_url,
+            date_saved=datetime.datetime.now(),
+            on_duplicate=on_duplicate,
+            defer_thumbnails=defer_thumbnails,
+        )
+    except DuplicateFileError as err:
+        print(f"Skipping {err}", file=sys.stderr)
+    else:
+        print(document.id)
 
 
 @main.command(help="Store a file in docstore")
@@ -121,11 +204,19 @@ def _add_document(
     prompt="How should the file be tagged?",
 )
 @click.option("--source_url", help="Where was this file downloaded from?.")
+@_on_duplicate_option
+@_defer_thumbnails_option
 @click.pass_obj
 @_require_existing_instance  # type: ignore
-def add(root, path, title, tags, source_url):
+def add(root, path, title, tags, source_url, on_duplicate, defer_thumbnails):
     return _add_document(
-        root=root, path=path, title=title, tags=tags, source_url=source_url
+        root=root,
+        path=path,
+        title=title,
+        tags=tags,
+        source_url=source_url,
+        on_duplicate=on_duplicate,
+        defer_thumbnails=defer_thumbnails,
     )
 
 
@@ -136,6 +227,8 @@ def add(root, path, title, tags, source_url):
 @click.option("--title", help="The title of the file.")
 @click.option("--tags", help="The tags to apply to the file.")
 @click.option("--source_url", help="Where was this file downloaded from?.")
+@_on_duplicate_option
+@_defer_thumbnails_option
 @click.pass_obj
 @_require_existing_instance  # type: ignore
 def add_from_url(
@@ -144,16 +237,189 @@ def add_from_url(
     title: str | None,
     tags: str | None,
     source_url: str | None,
+    on_duplicate: typing.Literal["link", "warn", "skip"],
+    defer_thumbnails: bool,
 ) -> None:  # pragma: no cover
     from docstore.downloads import download_file
 
     path = download_file(url)
 
     return _add_document(
-        root=root, path=path, title=title, tags=tags, source_url=source_url
+        root=root,
+        path=path,
+        title=title,
+        tags=tags,
+        source_url=source_url,
+        on_duplicate=on_duplicate,
+        defer_thumbnails=defer_thumbnails,
     )
 
 
+@main.command(
+    help="Store many files in docstore. SOURCE can be a directory, a glob, "
+    "or a JSONL manifest with a path, title, tags and source_url on each line."
+)
+@click.argument("source", nargs=1, required=True)
+@click.option("--tags", default="", help="Tags to apply to every file.")
+@click.option("--source_url", help="Where were these files downloaded from?")
+@click.option(
+    "--jobs",
+    default=1,
+    type=click.IntRange(min=1),
+    help="How many files to process at once.",
+    show_default=True,
+)
+@_on_duplicate_option
+@_defer_thumbnails_option
+@click.pass_obj
+@_require_existing_instance  # type: ignore
+def add_many(
+    root: pathlib.Path,
+    source: str,
+    tags: str,
+    source_url: str | None,
+    jobs: int,
+    on_duplicate: typing.Literal["link", "warn", "skip"],
+    defer_thumbnails: bool,
+) -> None:
+    from docstore.documents import DuplicateFileError, store_new_documents_in_parallel
+    from docstore.ingest_sources import find_new_documents
+    import tqdm
+
+    try:
+        new_documents = find_new_documents(
+            source,
+            tags=[t.strip() for t in tags.split(",") if t.strip()],
+            source_url=source_url,
+        )
+    except ValueError as err:
+        sys.exit(str(err))
+
+    with tqdm.tqdm(total=len(new_documents), unit="file") as progress_bar:
+        results = store_new_documents_in_parallel(
+            root=root,
+            new_documents=new_documents,
+            date_saved=datetime.datetime.now(),
+            jobs=jobs,
+            on_progress=progress_bar.update,
+            on_duplicate=on_duplicate,
+            defer_thumbnails=defer_thumbnails,
+        )
+
+    for doc in results["stored"]:
+        print(doc.id)
+
+    errors = [
+        f for f in results["failed"] if not isinstance(f["error"], DuplicateFileError)
+    ]
+
+    for failure in results["failed"]:
+        if isinstance(failure["error"], DuplicateFileError):
+            print(f"Skipping {failure['error']}", file=sys.stderr)
+        else:
+            print(
+                f"Unable to store {failure['new_document']['path']}: {failure['error']}",
+                file=sys.stderr,
+            )
+
+    if errors:
+        sys.exit(1)
+
+
+@main.command(
+    help="Create new thumbnails for the stored files. By default this only "
+    "creates the smaller variants for thumbnails that don't have them yet."
+)
+@click.option(
+    "--jobs",
+    default=1,
+    type=click.IntRange(min=1),
+    help="How many files to process at once.",
+    show_default=True,
+)
+@click.option(
+    "--all",
+    "recreate",
+    is_flag=True,
+    help="Create a new thumbnail and tint colour for every file.",
+)
+@click.pass_obj
+@_require_existing_instance  # type: ignore
+def regenerate_thumbnails(root: pathlib.Path, jobs: int, recreate: bool) -> None:
+    from docstore.documents import regenerate_thumbnails
+    import tqdm
+
+    with tqdm.tqdm(unit="file") as progress_bar:
+        results = regenerate_thumbnails(
+            root,
+            jobs=jobs,
+            recreate=recreate,
+            on_progress=progress_bar.update,
+        )
+
+    print(f"Regenerated {len(results['updated'])} thumbnails")
+
+    for failure in results["failed"]:
+        print(
+            f"Unable to regenerate thumbnail for {failure['file'].path}: "
+            f"{failure['error']}",
+            file=sys.stderr,
+        )
+
+    if results["failed"]:
+        sys.exit(1)
+
+
+@main.command(help="Create the thumbnails for files stored with --defer_thumbnails")
+@click.option(
+    "--jobs",
+    default=1,
+    type=click.IntRange(min=1),
+    help="How many thumbnails to create at once.",
+    show_default=True,
+)
+@click.option(
+    "--once",
+    is_flag=True,
+    help="Exit once there are no jobs left, rather than waiting for more.",
+)
+@click.option(
+    "--poll_interval",
+    default=5.0,
+    help="How often to check for new jobs (seconds).",
+    show_default=True,
+)
+@click.option(
+    "--retry_failed",
+    is_flag=True,
+    help="Retry the jobs that failed too many times.",
+)
+@click.pass_obj
+@_require_existing_instance  # type: ignore
+def worker(
+    root: pathlib.Path, jobs: int, once: bool, poll_interval: float, retry_failed: bool
+) -> None:
+    from docstore import job_queue
+    from docstore.worker import ThumbnailWorker
+
+    if retry_failed:
+        retried = job_queue.retry_failed_jobs(root)
+        print(f"Retrying {len(retried)} failed jobs", file=sys.stderr)
+
+    thumbnail_worker = ThumbnailWorker(root, jobs=jobs, poll_interval=poll_interval)
+
+    if once:
+        results = thumbnail_worker.run_once()
+
+        if results is None or results["failed"]:
+            sys.exit(1)
+    else:  # pragma: no cover
+        try:
+            thumbnail_worker.run()
+        except KeyboardInterrupt:
+            pass
+
+
 @main.command(help="Migrate a V1 docstore")
 @click.option(
     "--v1_path",
@@ -189,13 +455,28 @@ def migrate(root: pathlib.Path, v1_path: pathlib.Path) -> None:  # pragma: no co
             print(doc.get("filename", os.path.basename(doc["file_identifier"])))
 
 
+@main.command(help="Convert between the JSON and SQLite databases")
+@click.option(
+    "--to",
+    help="The backend to convert to.",
+    type=click.Choice(["json", "sqlite"]),
+    required=True,
+)
+@click.pass_obj
+def migrate_backend(root: pathlib.Path, to: typing.Literal["json", "sqlite"]) -> None:
+    from docstore.documents import migrate_backend as _migrate_backend
+
+    _migrate_backend(root, to=to)
+    print(f"Converted docstore instance at {root} to {to}")
+
+
 @main.command(help="Delete one or more documents")
 @click.argument("doc_ids", nargs=-1)
 @click.pass_obj
 def delete(root: pathlib.Path, doc_ids: list[str]) -> None:
-    from docstore.documents import db_path, delete_document
+    from docstore.documents import db_path, delete_document, uses_sqlite
 
-    if not os.path.exists(db_path(root)):
+    if not os.path.exists(db_path(root)) and not uses_sqlite(root):
         sys.exit(f"There is no docstore instance at {root}!")
 
     for d_id in doc_ids:
@@ -238,9 +519,9 @@ def merge(root: pathlib.Path, doc_ids: list[str], yes: bool) -> None:
     if len(doc_ids) == 1:
         return
 
-    from docstore.documents import read_documents
+    from docstore.documents import read_index
 
-    documents = {d.id: d for d in read_documents(root)}
+    documents = read_index(root).by_id
 
     documents_to_merge = [documents[d_id] for d_id in doc_ids]
 
@@ -0,0 +1,176 @@
+"""
+A cache of the thumbnails and tint colours we've already created.
+
+Creating a thumbnail and choosing a tint colour are the slowest parts of
+storing a new file, and their output only depends on the contents of
+the file.  Rather than running them again for a file we've seen before
+(e.g. if it's deleted and stored again, or when backfilling thumbnails
+in a migration), we look up the results here.
+
+Entries are keyed on the SHA-256 checksum of the file, its extension
+(which decides how it gets thumbnailed), the thumbnail size, and the
+versions of the thumbnail and tint colour code.  Each entry is a
+directory under ``derivatives/`` in the root, with a copy of the thumbnail
+and its variants (usually hard links, so they take no extra space) and
+a small JSON file with the dimensions and tint colour.
+
+It's always safe to delete the ``derivatives`` directory; the cache
+will be rebuilt as new files are stored.
+"""
+
+import json
+import os
+import pathlib
+import secrets
+import shutil
+import typing
+
+from docstore.models import Dimensions
+from docstore.thumbnails import THUMBNAIL_VERSION, VariantResult
+from docstore.tint_colors import TINT_COLOR_VERSION
+
+
+class CachedDerivatives(typing.TypedDict):
+    thumbnail_path: str
+    dimensions: Dimensions
+    tint_color: str
+    variants: list[VariantResult]
+
+
+def cache_dir(root: pathlib.Path) -> pathlib.Path:
+    """
+    Returns the path to the derivatives cache.
+    """
+    return pathlib.Path(root) / "derivatives"
+
+
+def _entry_path(
+    root: pathlib.Path, *, checksum: str, extension: str, max_size: int
+) -> pathlib.Path:
+    digest = checksum.removeprefix("sha256:")
+    key = "-".join(
+        [
+            digest,
+            extension.lower().lstrip(".") or "none",
+            str(max_size),
+            f"t{THUMBNAIL_VERSION}",
+            f"c{TINT_COLOR_VERSION}",
+        ]
+    )
+
+    return cache_dir(root) / digest[:2] / key
+
+
+def get_derivatives(
+    root: pathlib.Path, *, checksum: str, extension: str, max_size: int
+) -> CachedDerivatives | None:
+    """
+    Look up the thumbnail and tint colour for a file, or return None
+    if they aren't in the cache.
+    """
+    entry = _entry_path(root, checksum=checksum, extension=extension, max_size=max_size)
+
+    try:
+        with open(entry / "derivatives.json") as infile:
+            info = json.load(infile)
+
+        thumbnail_path = entry / info["thumbnail_name"]
+
+        variants: list[VariantResult] = [
+            {
+                "path": str(entry / v["name"]),
+                "format": v["format"],
+                "dimensions": Dimensions(**v["dimensions"]),
+            }
+            for v in info["variants"]
+        ]
+
+        if not all(
+            os.path.exists(p) for p in [thumbnail_path] + [v["path"] for v in variants]
+        ):
+            return None
+
+        return {
+            "thumbnail_path": str(thumbnail_path),
+            "dimensions": Dimensions(**info["dimensions"]),
+            "tint_color": info["tint_color"],
+            "variants": variants,
+        }
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def _link_or_copy(path: str, out_dir: pathlib.Path) -> str:
+    """
+    Put a copy of ``path`` in ``out_dir``, and return its name.
+    """
+    name = os.path.basename(path)
+
+    try:
+        os.link(path, out_dir / name)
+    except OSError:
+        shutil.copyfile(path, out_dir / name)
+
+    return name
+
+
+def save_derivatives(
+    root: pathlib.Path,
+    *,
+    checksum: str,
+    extension: str,
+    max_size: int,
+    thumbnail_path: str,
+    dimensions: Dimensions,
+    tint_color: str,
+    variants: list[VariantResult],
+) -> None:
+    """
+    Save the thumbnail, its variants and the tint colour for a file
+    in the cache.
+    """
+    entry = _entry_path(root, checksum=checksum, extension=extension, max_size=max_size)
+
+    if entry.exists():
+        return
+
+    # Build the entry in a temporary directory and rename it into place,
+    # so nobody ever sees a half-written entry.
+    tmp_entry = entry.with_name(f"{entry.name}.{secrets.token_hex(4)}.tmp")
+
+    try:
+        os.makedirs(tmp_entry)
+
+        thumbnail_name = _link_or_copy(thumbnail_path, tmp_entry)
+
+        variant_info = [
+            {
+                "name": _link_or_copy(v["path"], tmp_entry),
+                "format": v["format"],
+                "dimensions": {
+                    "width": v["dimensions"].width,
+                    "height": v["dimensions"].height,
+                },
+            }
+            for v in variants
+        ]
+
+        with open(tmp_entry / "derivatives.json", "w") as out_file:
+            json.dump(
+                {
+                    "thumbnail_name": thumbnail_name,
+                    "dimensions": {
+                        "width": dimensions.width,
+                        "height": dimensions.height,
+                    },
+                    "tint_color": tint_color,
+                    "variants": variant_info,
+                },
+                out_file,
+            )
+
+        os.rename(tmp_entry, entry)
+    except OSError:
+        # Another process may have saved the same entry first, or we
+        # can't write to the cache; either way, carry on without it.
+        shutil.rmtree(tmp_entry, ignore_errors=True)
@@ -1,24 +1,50 @@
+import collections
+import concurrent.futures
+import contextlib
 import datetime
+import fcntl
 import hashlib
 import json
 import os
 import pathlib
+import secrets
 import shutil
+import sys
+import tempfile
+import threading
 import typing
+from collections.abc import Callable, Iterator
 
-import cattr
+import attr
 
-from docstore.file_normalisation import normalised_filename_copy
+from docstore import (
+    derivative_cache,
+    job_queue,
+    journal,
+    snapshot_cache,
+    sqlite_store,
+)
+from docstore.file_normalisation import COPY_BUFFER_SIZE, normalised_filename_copy
+from docstore.indexes import DocumentIndex
+from docstore.lazy_thumbnails import lazy_variants
 from docstore.models import (
     DocstoreEncoder,
     Document,
     File,
     Thumbnail,
-    from_json,
+    ThumbnailVariant,
     to_json,
+    unstructure_document,
 )
 from docstore.text_utils import slugify
-from docstore.thumbnails import create_thumbnail, get_dimensions
+from docstore.thumbnails import (
+    GENERIC_THUMBNAIL_PATH,
+    VariantResult,
+    create_thumbnail,
+    create_thumbnail_variants,
+    get_dimensions,
+    variant_suffix,
+)
 from docstore.tint_colors import choose_tint_color
 
 
@@ -29,64 +55,727 @@ def db_path(root: pathlib.Path) -> pathlib.Path:
     return root / "documents.json"
 
 
+def uses_sqlite(root: pathlib.Path) -> bool:
+    """
+    Returns True if this docstore instance uses the SQLite backend
+    rather than the JSON database.
+    """
+    return os.path.exists(sqlite_store.sqlite_path(root))
+
+
+SnapshotVersion: typing.TypeAlias = tuple[str, int, int, int] | None
+
+
 class CachedDocuments(typing.TypedDict):
-    last_modified: float
-    contents: list[Document]
+    snapshot_version: SnapshotVersion
+    journal_offset: int
+    index: DocumentIndex
 
 
-_cached_documents: CachedDocuments = {
-    "last_modified": -1,
-    "contents": [],
-}
+# The cache holds one entry per docstore root.  Entries are never modified
+# in place: when the documents change, a new entry is created and swapped
+# in, so a thread that's still using the old entry sees a consistent view.
+_cached_documents: dict[pathlib.Path, CachedDocuments] = {}
+
+# Only one thread at a time reloads the documents for a given root.
+_reload_locks: dict[pathlib.Path, threading.Lock] = collections.defaultdict(
+    threading.Lock
+)
+
+
+def _snapshot_version(root: pathlib.Path) -> SnapshotVersion:
+    """
+    Returns a value that changes whenever the snapshot of the documents
+    is changed, or None if there's no snapshot yet.
+    """
+    if uses_sqlite(root):
+        path = sqlite_store.sqlite_path(root)
+        return ("sqlite", os.stat(path).st_ino, sqlite_store.data_version(path), 0)
+
+    try:
+        stat = os.stat(db_path(root))
+    except FileNotFoundError:
+        return None
+    else:
+        return ("json", stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+def _index_version(snapshot_version: SnapshotVersion, journal_offset: int) -> str:
+    """
+    Returns a short string that identifies a version of the documents,
+    e.g. for cache keys.
+    """
+    h = hashlib.sha256(repr((snapshot_version, journal_offset)).encode("utf8"))
+    return h.hexdigest()[:16]
+
+
+def _journal_size(root: pathlib.Path) -> int:
+    try:
+        return os.stat(journal.journal_path(root)).st_size
+    except FileNotFoundError:
+        return 0
 
 
 def read_documents(root: pathlib.Path) -> list[Document]:
     """
     Get a list of all the documents.
+
+    The returned list is shared with the cache, so callers shouldn't
+    modify it -- use the functions in this module instead.
+    """
+    return read_index(root).documents
+
+
+def read_index(root: pathlib.Path) -> DocumentIndex:
     """
+    Get all the documents, plus lookup tables for finding documents
+    and files by ID, path, thumbnail, checksum or tag.
+
+    If another thread is already reloading the documents for this root,
+    this returns the previous version rather than waiting for the reload.
+    """
+    return _read_cached_documents(root, wait_for_reload=False)["index"]
+
+
+def read_latest_index(root: pathlib.Path) -> DocumentIndex:
+    """
+    Like ``read_index``, but always waits for the latest version of the
+    documents.  Use this before changing the documents.
+    """
+    return _read_cached_documents(root, wait_for_reload=True)["index"]
+
+
+def _read_latest_document(root: pathlib.Path, doc_id: str) -> Document:
+    """
+    Get the latest version of a single document.
+
+    With the SQLite backend, this only reads the one document rather
+    than reloading the whole collection after every change.
+    """
+    if uses_sqlite(root):
+        doc = sqlite_store.read_document(sqlite_store.sqlite_path(root), doc_id)
+        if doc is None:
+            raise KeyError(doc_id)
+        return doc
+
+    return read_latest_index(root).by_id[doc_id]
+
+
+def _is_up_to_date(root: pathlib.Path, cached: CachedDocuments | None) -> bool:
+    return (
+        cached is not None
+        and cached["snapshot_version"] == _snapshot_version(root)
+        and cached["journal_offset"] == _journal_size(root)
+    )
+
+
+def _read_cached_documents(
+    root: pathlib.Path, *, wait_for_reload: bool
+) -> CachedDocuments:
     # JSON parsing is somewhat expensive.  By caching the result rather than
     # going to disk each time, we see a ~10x speedup in returning responses
     # from the server.
+    cache_key = pathlib.Path(os.path.abspath(root))
+
+    cached = _cached_documents.get(cache_key)
+
+    if cached is not None and _is_up_to_date(root, cached):
+        return cached
+
+    # If the documents have changed, only one thread needs to reload them.
+    # Other threads keep using the previous version until the new one is
+    # ready, rather than all re-parsing the same file at once.
+    lock = _reload_locks[cache_key]
+
+    if cached is not None and not wait_for_reload:
+        if not lock.acquire(blocking=False):
+            return cached
+    else:
+        lock.acquire()
+
     try:
-        if (
-            _cached_documents["last_modified"] is not None
-            and os.stat(db_path(root)).st_mtime <= _cached_documents["last_modified"]
-        ):
-            return _cached_documents["contents"]
-    except FileNotFoundError:
-        pass
+        # Another thread may have reloaded the documents while we were
+        # waiting for the lock.
+        cached = _cached_documents.get(cache_key)
+
+        if cached is not None and _is_up_to_date(root, cached):
+            return cached
+
+        new_cached = _load_documents(root, previous=cached)
+        _cached_documents[cache_key] = new_cached
+        return new_cached
+    finally:
+        lock.release()
+
+
+def _load_documents(
+    root: pathlib.Path, *, previous: CachedDocuments | None
+) -> CachedDocuments:
+    snapshot_version = _snapshot_version(root)
+
+    # If the snapshot hasn't changed, we only need to replay any
+    # operations that have been appended to the journal since we last looked.
+    if (
+        previous is not None
+        and previous["snapshot_version"] == snapshot_version
+        and _journal_size(root) > previous["journal_offset"]
+    ):
+        operations, offset = journal.read_operations(
+            root, offset=previous["journal_offset"]
+        )
+
+        return {
+            "snapshot_version": snapshot_version,
+            "journal_offset": offset,
+            "index": DocumentIndex(
+                journal.apply_operations(previous["index"].documents, operations),
+                version=_index_version(snapshot_version, offset),
+            ),
+        }
+
+    if uses_sqlite(root):
+        snapshot = sqlite_store.read_documents(sqlite_store.sqlite_path(root))
+        operations, offset = [], 0
+    else:
+        try:
+            snapshot = snapshot_cache.read_snapshot(root, path=db_path(root))
+        except FileNotFoundError:
+            snapshot = []
+
+        operations, offset = journal.read_operations(root)
+
+    return {
+        "snapshot_version": snapshot_version,
+        "journal_offset": offset,
+        "index": DocumentIndex(
+            journal.apply_operations(snapshot, operations),
+            version=_index_version(snapshot_version, offset),
+        ),
+    }
+
+
+def _write_atomically(
+    path: pathlib.Path, contents: str, *, fsync_directory: bool
+) -> None:
+    """
+    Replace the file at ``path`` with ``contents``.
+
+    Anybody reading the file sees either the old contents or the new
+    contents, never a partially written file -- even if we crash halfway
+    through writing.
+    """
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
 
     try:
-        with open(db_path(root)) as infile:
-            result = from_json(infile.read())
-    except FileNotFoundError:
-        return []
+        with open(tmp_path, "w") as out_file:
+            out_file.write(contents)
+            out_file.flush()
+            os.fsync(out_file.fileno())
 
-    _cached_documents["last_modified"] = os.stat(db_path(root)).st_mtime
-    _cached_documents["contents"] = result
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
 
-    return result
+    # The rename is only durable once the directory entry is on disk.
+    if fsync_directory:
+        dir_fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
 
 
-def write_documents(*, root: pathlib.Path, documents: list[Document]) -> None:
-    json_string = to_json(documents)
+def lock_path(root: pathlib.Path) -> pathlib.Path:
+    """
+    Returns the path to the lock file that serialises changes to the database.
+    """
+    return root / "documents.lock"
+
+
+# How many times each thread has entered ``lock_documents`` for each root.
+_held_locks = threading.local()
+
+
+@contextlib.contextmanager
+def lock_documents(root: pathlib.Path) -> Iterator[None]:
+    """
+    Hold an exclusive lock on the documents in ``root``.
+
+    Anything that reads the documents, decides what to change, and then
+    records that change should do so while holding this lock, or a
+    concurrent writer (another thread, another ``docstore add``, or the
+    web app) could make a change in between that gets lost.
+
+    The lock is an advisory ``flock()`` on a file in the root, so it
+    works across processes.  It's reentrant within a single thread.
+    """
+    key = pathlib.Path(os.path.abspath(root))
+
+    depths: collections.Counter[pathlib.Path] = _held_locks.__dict__.setdefault(
+        "depths", collections.Counter()
+    )
+
+    if depths[key] > 0:
+        depths[key] += 1
+        try:
+            yield
+        finally:
+            depths[key] -= 1
+        return
 
     os.makedirs(root, exist_ok=True)
 
-    with open(db_path(root), "w") as out_file:
-        out_file.write(json_string)
+    with open(lock_path(root), "a") as lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        depths[key] += 1
+
+        try:
+            yield
+        finally:
+            depths[key] -= 1
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def write_documents(
+    *,
+    root: pathlib.Path,
+    documents: list[Document],
+    fsync_directory: bool = True,
+) -> None:
+    """
+    Write a new snapshot of all the documents, replacing the journal.
+
+    The new snapshot is written to a temporary file and renamed into place,
+    so a crash or a concurrent reader never sees a truncated database.
+    """
+    if uses_sqlite(root):
+        sqlite_store.write_documents(sqlite_store.sqlite_path(root), documents)
+        return
+
+    json_string = to_json(documents)
+
+    # Hold the lock so nobody appends to the journal between us writing
+    # the snapshot and clearing the journal.
+    with lock_documents(root):
+        _write_atomically(db_path(root), json_string, fsync_directory=fsync_directory)
+        journal.clear_journal(root)
+
+
+def compact_documents(root: pathlib.Path) -> None:
+    """
+    Fold any operations in the journal into a new snapshot.
+    """
+    if uses_sqlite(root):
+        return
+
+    with lock_documents(root):
+        write_documents(root=root, documents=read_latest_index(root).documents)
+
+
+def _record_operations(root: pathlib.Path, operations: list[journal.Operation]) -> None:
+    """
+    Save some changes to the documents.
+
+    Usually this appends to the journal, which is much cheaper than
+    rewriting the whole database.  If there's no snapshot yet, we
+    write one straight away so ``documents.json`` always exists in a
+    docstore instance.
+
+    With the SQLite backend, the changes go straight into the database.
+    """
+    with lock_documents(root):
+        if uses_sqlite(root):
+            sqlite_store.apply_operations(sqlite_store.sqlite_path(root), operations)
+            return
+
+        if not os.path.exists(db_path(root)):
+            documents = journal.apply_operations(
+                read_latest_index(root).documents, operations
+            )
+            write_documents(root=root, documents=documents)
+            return
+
+        journal.append_operations(root, operations)
+
+        if journal.needs_compaction(root):
+            compact_documents(root)
 
 
 def sha256(path: pathlib.Path) -> str:
     h = hashlib.sha256()
     with open(path, "rb") as infile:
-        for byte_block in iter(lambda: infile.read(4096), b""):
+        for byte_block in iter(lambda: infile.read(COPY_BUFFER_SIZE), b""):
             h.update(byte_block)
 
     return "sha256:%s" % h.hexdigest()
 
 
-def store_new_document(
+class NewDocument(typing.TypedDict):
+    path: pathlib.Path
+    title: str
+    tags: list[str]
+    source_url: str | None
+
+
+# The maximum width/height of the thumbnail for a new file.
+THUMBNAIL_SIZE = 400
+
+
+# The tint colour for a placeholder thumbnail, before we've created the
+# real one.  This grey has a contrast ratio of 4.5:1 with the white
+# background, the same as a real tint colour.
+PLACEHOLDER_TINT_COLOR = "#767676"
+
+
+# What to do if we're asked to store a file that's already in the store:
+#
+#   - "link": store it as a new document, but reuse the existing copy,
+#     thumbnail and tint colour rather than creating new ones
+#   - "warn": the same as "link", but print a warning
+#   - "skip": don't store it, and leave the original file where it is
+#
+DuplicatePolicy: typing.TypeAlias = typing.Literal["link", "warn", "skip"]
+
+
+class DuplicateFileError(Exception):
+    """
+    Thrown when we skip storing a file because it's already in the store.
+    """
+
+    def __init__(self, path: pathlib.Path, *, existing: File) -> None:
+        self.path = path
+        self.existing = existing
+        super().__init__(f"{path} is already stored as {existing.path}")
+
+
+def _find_duplicate(
+    root: pathlib.Path, *, checksum: str, batch: typing.Mapping[str, File] | None = None
+) -> File | None:
+    """
+    Returns a stored file with this checksum, if there is one.
+
+    ``batch`` maps checksums to files prepared earlier in the same batch,
+    which aren't in the database yet.
+    """
+    if uses_sqlite(root):
+        candidates = sqlite_store.read_files_with_checksum(
+            sqlite_store.sqlite_path(root), checksum
+        )
+    else:
+        candidates = read_latest_index(root).files_by_checksum.get(checksum, [])
+
+    if batch is not None and checksum in batch:
+        candidates = [batch[checksum]] + candidates
+
+    for f in candidates:
+        if all(
+            os.path.exists(os.path.join(root, p))
+            for p in [f.path] + _thumbnail_paths(f.thumbnail)
+        ):
+            return f
+
+    return None
+
+
+def _thumbnail_paths(thumbnail: Thumbnail) -> list[str]:
+    """
+    Returns the paths to a thumbnail and all its variants.
+    """
+    return [thumbnail.path] + [v.path for v in thumbnail.variants]
+
+
+def _lazy_variant_paths(thumbnail: Thumbnail) -> list[str]:
+    """
+    Returns the paths where the web app may have created variants of
+    a thumbnail on request (see ``lazy_thumbnails``).  These aren't
+    recorded in the database, but they go when the thumbnail goes.
+    """
+    return [path for path, _, _ in lazy_variants(thumbnail)]
+
+
+def _variant_suffix(variant: ThumbnailVariant | VariantResult) -> str:
+    """
+    Returns the end of the filename for a thumbnail variant, e.g. ``_200w.webp``.
+    """
+    if isinstance(variant, ThumbnailVariant):
+        width, image_format = variant.dimensions.width, variant.format
+    else:
+        width, image_format = variant["dimensions"].width, variant["format"]
+
+    return variant_suffix(width=width, image_format=image_format)
+
+
+def _link_thumbnail(
+    root: pathlib.Path,
+    *,
+    thumbnail_path: str,
+    out_path: str,
+    suffix: str | None = None,
+) -> str:
+    """
+    Hard link an existing thumbnail into place as the thumbnail for
+    the file at ``out_path``, and return its path relative to the root.
+
+    The thumbnail is named after the file, plus ``suffix`` -- by default,
+    the extension of the thumbnail.
+    """
+    if suffix is None:
+        suffix = os.path.splitext(thumbnail_path)[1]
+
+    thumbnail_name = os.path.splitext(os.path.basename(out_path))[0] + suffix
+
+    thumbnail_copy = normalised_filename_copy(
+        src=thumbnail_path,
+        dst=os.path.join(root, "thumbnails", thumbnail_name[0], thumbnail_name),
+        link=True,
+        checksum=sha256(pathlib.Path(thumbnail_path)),
+    )
+
+    return os.path.relpath(thumbnail_copy["path"], root)
+
+
+def _cached_thumbnail(
+    root: pathlib.Path, *, out_path: str, checksum: str
+) -> Thumbnail | None:
+    """
+    If we've seen a file with the same contents before, link the thumbnail
+    and variants from the derivatives cache into place for the file at
+    ``out_path``, and return them.  Otherwise, return None.
+    """
+    cached = derivative_cache.get_derivatives(
+        root,
+        checksum=checksum,
+        extension=os.path.splitext(out_path)[1],
+        max_size=THUMBNAIL_SIZE,
+    )
+
+    if cached is None:
+        return None
+
+    return Thumbnail(
+        path=_link_thumbnail(
+            root, thumbnail_path=cached["thumbnail_path"], out_path=out_path
+        ),
+        dimensions=cached["dimensions"],
+        tint_color=cached["tint_color"],
+        variants=_link_variants(root, variants=cached["variants"], out_path=out_path),
+    )
+
+
+def _create_thumbnail(root: pathlib.Path, *, out_path: str, checksum: str) -> Thumbnail:
+    """
+    Create a thumbnail for a newly stored file, and choose its tint colour.
+
+    If we've seen a file with the same contents before, we reuse the
+    thumbnail and tint colour from the derivatives cache instead.
+    """
+    cached = _cached_thumbnail(root, out_path=out_path, checksum=checksum)
+
+    if cached is not None:
+        return cached
+
+    extension = os.path.splitext(out_path)[1]
+
+    created = create_thumbnail(out_path, max_size=THUMBNAIL_SIZE)
+    thumbnail_name = os.path.basename(created["path"])
+
+    # Another file may already have a thumbnail with this name -- e.g.
+    # ``foo.png`` and ``foo.pdf`` -- so we mustn't overwrite it.
+    try:
+        thumb_out_path = normalised_filename_copy(
+            src=created["path"],
+            dst=os.path.join(root, "thumbnails", thumbnail_name[0], thumbnail_name),
+            link=True,
+        )["path"]
+    finally:
+        shutil.rmtree(os.path.dirname(created["path"]))
+
+    variants: list[ThumbnailVariant] = []
+
+    try:
+        tint_color = choose_tint_color(
+            thumbnail_path=thumb_out_path, file_path=out_path
+        )
+
+        created_variants = create_thumbnail_variants(thumb_out_path)
+
+        try:
+            variants = _link_variants(
+                root, variants=created_variants, out_path=out_path
+            )
+        finally:
+            _remove_created_variants(created_variants)
+    except BaseException:
+        for p in [thumb_out_path] + [os.path.join(root, v.path) for v in variants]:
+            os.unlink(p)
+        raise
+
+    hex_tint_color = "#%02x%02x%02x" % tuple(
+        int(component * 255) for component in tint_color
+    )
+
+    thumbnail = Thumbnail(
+        path=os.path.relpath(thumb_out_path, root),
+        dimensions=created["dimensions"],
+        tint_color=hex_tint_color,
+        variants=variants,
+    )
+
+    derivative_cache.save_derivatives(
+        root,
+        checksum=checksum,
+        extension=extension,
+        max_size=THUMBNAIL_SIZE,
+        thumbnail_path=thumb_out_path,
+        dimensions=thumbnail.dimensions,
+        tint_color=thumbnail.tint_color,
+        variants=[
+            {
+                "path": os.path.join(root, v.path),
+                "format": v.format,
+                "dimensions": v.dimensions,
+            }
+            for v in variants
+        ],
+    )
+
+    return thumbnail
+
+
+def _placeholder_thumbnail(root: pathlib.Path, *, out_path: str) -> Thumbnail:
+    """
+    Create a placeholder thumbnail for the file at ``out_path``, to use
+    until we create the real one.
+
+    Each file gets its own copy of the placeholder, so it can be replaced
+    or deleted like any other thumbnail.  It has a random name, so it never
+    takes the name of a real thumbnail (or its variants) for another file
+    with the same name.
+    """
+    tmp_path = os.path.join(tempfile.mkdtemp(), "placeholder.png")
+    shutil.copyfile(GENERIC_THUMBNAIL_PATH, tmp_path)
+
+    try:
+        path = _link_thumbnail(
+            root,
+            thumbnail_path=tmp_path,
+            out_path=out_path,
+            suffix=f"_placeholder_{secrets.token_hex(4)}.png",
+        )
+    finally:
+        shutil.rmtree(os.path.dirname(tmp_path))
+
+    return Thumbnail(
+        path=path,
+        dimensions=get_dimensions(GENERIC_THUMBNAIL_PATH),
+        tint_color=PLACEHOLDER_TINT_COLOR,
+    )
+
+
+def _remove_created_variants(variants: list[VariantResult]) -> None:
+    """
+    Delete the temporary directory that ``create_thumbnail_variants``
+    saved these variants in.
+    """
+    if variants:
+        shutil.rmtree(os.path.dirname(variants[0]["path"]))
+
+
+def _link_variants(
+    root: pathlib.Path, *, variants: list[VariantResult], out_path: str
+) -> list[ThumbnailVariant]:
+    """
+    Hard link the variants of a thumbnail into place, as the variants for
+    the file at ``out_path``.
+    """
+    return [
+        ThumbnailVariant(
+            path=_link_thumbnail(
+                root,
+                thumbnail_path=v["path"],
+                out_path=out_path,
+                suffix=_variant_suffix(v),
+            ),
+            format=v["format"],
+            dimensions=v["dimensions"],
+        )
+        for v in variants
+    ]
+
+
+def _link_existing_copy(root: pathlib.Path, *, existing: File, out_path: str) -> None:
+    """
+    Replace the newly stored file at ``out_path`` with a hard link to
+    the stored copy of an existing file with the same contents.
+    """
+    # We link to a temporary name and rename it into place, so nobody
+    # else can take ``out_path`` in the meantime.
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+
+    try:
+        os.link(os.path.join(root, existing.path), tmp_path)
+        os.replace(tmp_path, out_path)
+    except OSError:
+        # We still have our own copy of the file, which is fine.
+        pass
+
+
+def _has_placeholder_thumbnail(root: pathlib.Path, f: File) -> bool:
+    """
+    Returns True if we haven't created the real thumbnail for a file yet.
+
+    Files prepared earlier in the same batch don't have their jobs queued
+    yet, but we can still spot their placeholder by its tint colour.
+    """
+    return f.thumbnail.tint_color == PLACEHOLDER_TINT_COLOR or job_queue.has_job(
+        root, file_id=f.id
+    )
+
+
+def _reuse_thumbnail(root: pathlib.Path, *, existing: File, out_path: str) -> Thumbnail:
+    """
+    Reuse the stored copy and thumbnail of an existing file for a
+    newly stored file with the same contents.
+
+    Both the new copy and the new thumbnail are hard links to the
+    existing files, so they don't take up any extra space, but each
+    document can still be deleted without affecting the other.
+    """
+    _link_existing_copy(root, existing=existing, out_path=out_path)
+
+    return attr.evolve(
+        existing.thumbnail,
+        path=_link_thumbnail(
+            root,
+            thumbnail_path=os.path.join(root, existing.thumbnail.path),
+            out_path=out_path,
+        ),
+        variants=[
+            attr.evolve(
+                v,
+                path=_link_thumbnail(
+                    root,
+                    thumbnail_path=os.path.join(root, v.path),
+                    out_path=out_path,
+                    suffix=_variant_suffix(v),
+                ),
+            )
+            for v in existing.thumbnail.variants
+        ],
+    )
+
+
+class PreparedDocument(typing.TypedDict):
+    document: Document
+    # Jobs to create the real thumbnails for any placeholders
+    jobs: list[job_queue.Job]
+
+
+def _prepare_document(
     *,
     root: pathlib.Path,
     path: pathlib.Path,
@@ -94,7 +783,26 @@ def store_new_document(
     tags: list[str],
     source_url: str | None,
     date_saved: datetime.datetime,
-) -> Document:
+    on_duplicate: DuplicatePolicy = "link",
+    defer_thumbnails: bool = False,
+    batch: typing.Mapping[str, File] | None = None,
+) -> PreparedDocument:
+    """
+    Copy a file into the store and create its thumbnail, and return
+    the new document -- but don't record it in the database yet.
+
+    ``batch`` has the files prepared earlier in the same batch, by checksum,
+    so we spot duplicates before they've been recorded.
+
+    If ``defer_thumbnails`` is True and we don't already have a thumbnail
+    for this file, it gets a placeholder thumbnail instead.  The caller
+    should queue a job to create the real thumbnail once the document
+    has been recorded.
+    """
+    # All the slow work -- copying the file, creating the thumbnail,
+    # choosing a tint colour and hashing -- happens here, before we take
+    # the lock in ``_record_operations``, so several processes can add
+    # documents in parallel.
     filename = os.path.basename(path)
 
     # Files are sharded by the first letter of their filename,
@@ -103,51 +811,693 @@ def store_new_document(
 
     dst = os.path.join(root, "files", shard, filename)
 
-    out_path = normalised_filename_copy(src=str(path), dst=dst)
+    # We delete the original once it's been stored, so it's safe to
+    # hard link it into place rather than copying it.
+    copy_result = normalised_filename_copy(src=str(path), dst=dst, link=True)
+    out_path = copy_result["path"]
 
-    thumbnail_path = create_thumbnail(out_path)
-    thumbnail_name = os.path.basename(thumbnail_path)
-    thumb_out_path = os.path.join(root, "thumbnails", thumbnail_name[0], thumbnail_name)
-    os.makedirs(os.path.dirname(thumb_out_path), exist_ok=True)
-    shutil.move(thumbnail_path, thumb_out_path)
+    # If anything goes wrong, clean up the file we've already stored
+    # rather than leaving it orphaned in the store.
+    try:
+        existing = _find_duplicate(root, checksum=copy_result["checksum"], batch=batch)
+        is_placeholder = False
 
-    tint_color = choose_tint_color(thumbnail_path=thumb_out_path, file_path=out_path)
+        if existing is not None and on_duplicate == "skip":
+            raise DuplicateFileError(path, existing=existing)
 
-    hex_tint_color = "#%02x%02x%02x" % tuple(
-        int(component * 255) for component in tint_color
+        if existing is not None and on_duplicate == "warn":
+            print(
+                f"Warning: {path} is already stored as {existing.path}",
+                file=sys.stderr,
+            )
+
+        # If the existing file is still waiting for its real thumbnail,
+        # we share its stored copy but not its placeholder -- otherwise
+        # nothing would ever replace ours.
+        if existing is not None and _has_placeholder_thumbnail(root, existing):
+            _link_existing_copy(root, existing=existing, out_path=out_path)
+            existing = None
+
+        if existing is not None:
+            thumbnail = _reuse_thumbnail(root, existing=existing, out_path=out_path)
+        elif defer_thumbnails:
+            cached = _cached_thumbnail(
+                root, out_path=out_path, checksum=copy_result["checksum"]
+            )
+
+            if cached is not None:
+                thumbnail = cached
+            else:
+                thumbnail = _placeholder_thumbnail(root, out_path=out_path)
+                is_placeholder = True
+        else:
+            thumbnail = _create_thumbnail(
+                root, out_path=out_path, checksum=copy_result["checksum"]
+            )
+    except BaseException:
+        os.unlink(out_path)
+        raise
+
+    new_file = File(
+        filename=filename,
+        path=os.path.relpath(out_path, root),
+        size=copy_result["size"],
+        checksum=copy_result["checksum"],
+        source_url=source_url,
+        thumbnail=thumbnail,
+        date_saved=date_saved,
     )
 
-    new_document = Document(
-        title=title,
+    document = Document(title=title, date_saved=date_saved, tags=tags, files=[new_file])
+
+    return {
+        "document": document,
+        "jobs": (
+            [job_queue.new_job(doc_id=document.id, file_id=new_file.id)]
+            if is_placeholder
+            else []
+        ),
+    }
+
+
+def _record_prepared_documents(
+    root: pathlib.Path, prepared: list[PreparedDocument]
+) -> None:
+    """
+    Record some prepared documents, then queue the jobs to create
+    their thumbnails.
+    """
+    _record_operations(root, [journal.add_operation(p["document"]) for p in prepared])
+
+    # The jobs are only queued once the documents are recorded, so
+    # a worker never sees a job for a document that doesn't exist yet.
+    job_queue.enqueue_jobs(root, [job for p in prepared for job in p["jobs"]])
+
+
+def _discard_prepared_document(root: pathlib.Path, document: Document) -> None:
+    """
+    Remove the stored files for a document that was never recorded.
+    """
+    for f in document.files:
+        for p in [f.path] + _thumbnail_paths(f.thumbnail):
+            try:
+                os.unlink(os.path.join(root, p))
+            except FileNotFoundError:
+                pass
+
+
+def store_new_document(
+    *,
+    root: pathlib.Path,
+    path: pathlib.Path,
+    title: str,
+    tags: list[str],
+    source_url: str | None,
+    date_saved: datetime.datetime,
+    on_duplicate: DuplicatePolicy = "link",
+    defer_thumbnails: bool = False,
+) -> Document:
+    (new_document,) = store_new_documents(
+        root=root,
+        new_documents=[
+            {"path": path, "title": title, "tags": tags, "source_url": source_url}
+        ],
         date_saved=date_saved,
-        tags=tags,
-        files=[
-            File(
-                filename=filename,
-                path=os.path.relpath(out_path, root),
-                size=os.stat(out_path).st_size,
-                checksum=sha256(pathlib.Path(out_path)),
-                source_url=source_url,
-                thumbnail=Thumbnail(
-                    path=os.path.relpath(thumb_out_path, root),
-                    dimensions=get_dimensions(thumb_out_path),
-                    tint_color=hex_tint_color,
-                ),
+        on_duplicate=on_duplicate,
+        defer_thumbnails=defer_thumbnails,
+    )
+
+    return new_document
+
+
+def store_new_documents(
+    *,
+    root: pathlib.Path,
+    new_documents: list[NewDocument],
+    date_saved: datetime.datetime,
+    on_duplicate: DuplicatePolicy = "link",
+    defer_thumbnails: bool = False,
+) -> list[Document]:
+    """
+    Store a batch of new documents.
+
+    Every file is copied into the store and thumbnailed first, then all
+    the new documents are recorded with a single write to the database.
+    If any file fails (including a duplicate with ``on_duplicate="skip"``),
+    nothing is recorded.
+
+    If ``defer_thumbnails`` is True, new files get a placeholder thumbnail
+    and a job to create the real one later (see ``process_thumbnail_jobs``).
+    """
+    prepared: list[PreparedDocument] = []
+    batch: dict[str, File] = {}
+
+    try:
+        for new_doc in new_documents:
+            p = _prepare_document(
+                root=root,
                 date_saved=date_saved,
+                on_duplicate=on_duplicate,
+                defer_thumbnails=defer_thumbnails,
+                batch=batch,
+                **new_doc,
             )
-        ],
+            prepared.append(p)
+
+            for f in p["document"].files:
+                batch.setdefault(f.checksum, f)
+
+        _record_prepared_documents(root, prepared)
+    except BaseException:
+        for p in prepared:
+            _discard_prepared_document(root, p["document"])
+        raise
+
+    # Don't delete the original files until they've been successfully
+    # recorded and thumbnails created.
+    for new_doc in new_documents:
+        os.unlink(new_doc["path"])
+
+    return [p["document"] for p in prepared]
+
+
+class IngestFailure(typing.TypedDict):
+    new_document: NewDocument
+    error: Exception
+
+
+class IngestResults(typing.TypedDict):
+    stored: list[Document]
+    failed: list[IngestFailure]
+
+
+T = typing.TypeVar("T")
+
+
+def _run_in_parallel(
+    func: Callable[..., T], calls: list[dict[str, typing.Any]], *, jobs: int
+) -> Iterator[tuple[int, T | Exception]]:
+    """
+    Call ``func`` once with each set of keyword arguments in ``calls``,
+    running up to ``jobs`` calls at once in separate processes.
+
+    Yields the position of each call in ``calls`` as it finishes, along
+    with either its result or the error it threw.
+    """
+    if jobs == 1:
+        for i, kwargs in enumerate(calls):
+            outcome: T | Exception
+
+            try:
+                outcome = func(**kwargs)
+            except Exception as err:  # noqa: BLE001
+                outcome = err
+
+            yield i, outcome
+        return
+
+    executor = concurrent.futures.ProcessPoolExecutor(max_workers=jobs)
+
+    try:
+        futures = {executor.submit(func, **kwargs): i for i, kwargs in enumerate(calls)}
+
+        for fut in concurrent.futures.as_completed(futures):
+            try:
+                outcome = fut.result()
+            except Exception as err:  # noqa: BLE001
+                outcome = err
+
+            yield futures[fut], outcome
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+
+def _prepare_documents_in_parallel(
+    *,
+    root: pathlib.Path,
+    new_documents: list[NewDocument],
+    date_saved: datetime.datetime,
+    jobs: int,
+    on_duplicate: DuplicatePolicy,
+    defer_thumbnails: bool,
+) -> Iterator[tuple[NewDocument, PreparedDocument | Exception]]:
+    """
+    Prepare each of the new documents, and yield them as they finish,
+    along with either the prepared document or the error that stopped it.
+    """
+    calls = [
+        {
+            "root": root,
+            "date_saved": date_saved,
+            "on_duplicate": on_duplicate,
+            "defer_thumbnails": defer_thumbnails,
+            **new_doc,
+        }
+        for new_doc in new_documents
+    ]
+
+    for i, outcome in _run_in_parallel(_prepare_document, calls, jobs=jobs):
+        yield new_documents[i], outcome
+
+
+def _deduplicate_prepared_document(
+    root: pathlib.Path,
+    prepared: PreparedDocument,
+    *,
+    path: pathlib.Path,
+    batch: typing.Mapping[str, File],
+    on_duplicate: DuplicatePolicy,
+) -> PreparedDocument:
+    """
+    Check a document prepared in parallel against the files prepared
+    earlier in the same batch, which it couldn't see while it was being
+    prepared, and apply the ``on_duplicate`` policy if it's a duplicate.
+    """
+    (new_file,) = prepared["document"].files
+    existing = batch.get(new_file.checksum)
+
+    if existing is None:
+        return prepared
+
+    if on_duplicate == "skip":
+        _discard_prepared_document(root, prepared["document"])
+        raise DuplicateFileError(path, existing=existing)
+
+    if on_duplicate == "warn":
+        print(
+            f"Warning: {path} is already stored as {existing.path}",
+            file=sys.stderr,
+        )
+
+    # As in ``_prepare_document``, we don't share a placeholder: keep
+    # our own thumbnail, and the job to create it if it's a placeholder too.
+    if _has_placeholder_thumbnail(root, existing):
+        _link_existing_copy(
+            root, existing=existing, out_path=os.path.join(root, new_file.path)
+        )
+        return prepared
+
+    # Swap the thumbnail we just created for links to the existing one.
+    for p in _thumbnail_paths(new_file.thumbnail):
+        os.unlink(os.path.join(root, p))
+
+    thumbnail = _reuse_thumbnail(
+        root, existing=existing, out_path=os.path.join(root, new_file.path)
     )
 
-    documents = read_documents(root)
-    documents.append(new_document)
+    return {
+        "document": attr.evolve(
+            prepared["document"],
+            files=[attr.evolve(new_file, thumbnail=thumbnail)],
+        ),
+        "jobs": [],
+    }
+
+
+def store_new_documents_in_parallel(
+    *,
+    root: pathlib.Path,
+    new_documents: list[NewDocument],
+    date_saved: datetime.datetime,
+    jobs: int,
+    commit_every: int = 100,
+    on_progress: Callable[[], object] | None = None,
+    on_duplicate: DuplicatePolicy = "link",
+    defer_thumbnails: bool = False,
+) -> IngestResults:
+    """
+    Store a large batch of new documents, preparing up to ``jobs`` files
+    at once in separate processes.
 
-    write_documents(root=root, documents=documents)
+    Unlike ``store_new_documents``, a file that fails doesn't stop the
+    rest of the batch -- it's reported in the ``failed`` list instead.
+    Duplicates skipped with ``on_duplicate="skip"`` are reported there
+    as a ``DuplicateFileError``.
+    The finished documents are recorded by this process alone, every
+    ``commit_every`` documents, and each original file is deleted once
+    its document has been recorded.
 
-    # Don't delete the original file until it's been successfully recorded
-    # and a thumbnail created.
-    os.unlink(path)
+    ``on_progress`` is called once for every file, whether it succeeds or fails.
+    """
+    results: IngestResults = {"stored": [], "failed": []}
+    pending: list[tuple[NewDocument, PreparedDocument]] = []
+    batch: dict[str, File] = {}
 
-    return new_document
+    def commit() -> None:
+        _record_prepared_documents(root, [p for _, p in pending])
+
+        for new_doc, p in pending:
+            os.unlink(new_doc["path"])
+            results["stored"].append(p["document"])
+
+        pending.clear()
+
+    try:
+        for new_doc, outcome in _prepare_documents_in_parallel(
+            root=root,
+            new_documents=new_documents,
+            date_saved=date_saved,
+            jobs=jobs,
+            on_duplicate=on_duplicate,
+            defer_thumbnails=defer_thumbnails,
+        ):
+            if not isinstance(outcome, Exception):
+                try:
+                    outcome = _deduplicate_prepared_document(
+                        root,
+                        outcome,
+                        path=new_doc["path"],
+                        batch=batch,
+                        on_duplicate=on_duplicate,
+                    )
+                except DuplicateFileError as err:
+                    outcome = err
+
+            if isinstance(outcome, Exception):
+                results["failed"].append({"new_document": new_doc, "error": outcome})
+            else:
+                pending.append((new_doc, outcome))
+
+                for f in outcome["document"].files:
+                    batch.setdefault(f.checksum, f)
+
+            if len(pending) >= commit_every:
+                commit()
+
+            if on_progress is not None:
+                on_progress()
+
+        if pending:
+            commit()
+    except BaseException:
+        for _, p in pending:
+            _discard_prepared_document(root, p["document"])
+        raise
+
+    return results
+
+
+def _needs_variants(f: File) -> bool:
+    """
+    Returns True if a file's thumbnail should have variants, but doesn't
+    (e.g. it was stored before we created them).  Video thumbnails never
+    have variants.
+    """
+    return f.thumbnail.path.endswith(".png") and not f.thumbnail.variants
+
+
+def _regenerate_thumbnail(root: pathlib.Path, *, f: File, recreate: bool) -> Thumbnail:
+    """
+    Create a new thumbnail for a stored file.
+
+    If ``recreate`` is False, we keep the existing thumbnail and tint
+    colour, and only create the variants.  Otherwise we create everything
+    from the original file, reusing the derivatives cache if we can.
+    """
+    out_path = os.path.join(root, f.path)
+
+    if recreate:
+        return _create_thumbnail(root, out_path=out_path, checksum=f.checksum)
+
+    created = create_thumbnail_variants(os.path.join(root, f.thumbnail.path))
+
+    try:
+        variants = _link_variants(root, variants=created, out_path=out_path)
+    finally:
+        _remove_created_variants(created)
+
+    return attr.evolve(f.thumbnail, variants=variants)
+
+
+class ThumbnailUpdate(typing.TypedDict):
+    doc_id: str
+    file: File
+    thumbnail: Thumbnail
+
+
+def _record_new_thumbnails(
+    root: pathlib.Path, updates: list[ThumbnailUpdate]
+) -> list[ThumbnailUpdate]:
+    """
+    Record new thumbnails for some stored files, and return the updates
+    that were recorded.
+
+    If a file has been deleted, merged into another document or otherwise
+    changed since we read it, its update is skipped.
+    """
+    with lock_documents(root):
+        index = read_latest_index(root)
+
+        changed: dict[str, Document] = {}
+        recorded: list[ThumbnailUpdate] = []
+
+        for u in updates:
+            doc = changed.get(u["doc_id"]) or index.by_id.get(u["doc_id"])
+
+            if doc is None or u["file"] not in doc.files:
+                continue
+
+            changed[doc.id] = attr.evolve(
+                doc,
+                files=[
+                    attr.evolve(f, thumbnail=u["thumbnail"]) if f == u["file"] else f
+                    for f in doc.files
+                ],
+            )
+            recorded.append(u)
+
+        if changed:
+            _record_operations(
+                root, [journal.update_operation(doc) for doc in changed.values()]
+            )
+
+    return recorded
+
+
+def _remove_unused_thumbnails(
+    root: pathlib.Path, *, old: Thumbnail, new: Thumbnail
+) -> None:
+    """
+    Delete the files in ``old`` which aren't used by ``new``, including
+    any variants of ``old`` that were created on request.
+    """
+    unused = set(_thumbnail_paths(old) + _lazy_variant_paths(old)) - set(
+        _thumbnail_paths(new)
+    )
+
+    for p in unused:
+        try:
+            os.unlink(os.path.join(root, p))
+        except FileNotFoundError:
+            pass
+
+
+def _commit_new_thumbnails(
+    root: pathlib.Path, updates: list[ThumbnailUpdate]
+) -> list[ThumbnailUpdate]:
+    """
+    Record new thumbnails, then delete whichever thumbnail files are no
+    longer used -- the old thumbnails for the updates that were recorded,
+    and the new thumbnails for the updates that were skipped.
+
+    Returns the updates that were recorded.
+    """
+    recorded = _record_new_thumbnails(root, updates)
+
+    for u in updates:
+        if u in recorded:
+            _remove_unused_thumbnails(root, old=u["file"].thumbnail, new=u["thumbnail"])
+        else:
+            _remove_unused_thumbnails(root, old=u["thumbnail"], new=u["file"].thumbnail)
+
+    return recorded
+
+
+class RegenerateFailure(typing.TypedDict):
+    file: File
+    error: Exception
+
+
+class RegenerateResults(typing.TypedDict):
+    updated: list[File]
+    failed: list[RegenerateFailure]
+
+
+def regenerate_thumbnails(
+    root: pathlib.Path,
+    *,
+    jobs: int = 1,
+    recreate: bool = False,
+    commit_every: int = 100,
+    on_progress: Callable[[], object] | None = None,
+) -> RegenerateResults:
+    """
+    Create new thumbnails for the files in the store, working on up to
+    ``jobs`` files at once in separate processes.
+
+    By default, this only creates variants for thumbnails that don't
+    have them.  If ``recreate`` is True, every file gets a new thumbnail,
+    variants and tint colour.
+
+    The new thumbnails are recorded every ``commit_every`` files, and the
+    old thumbnail files are deleted once they're no longer used.
+    ``on_progress`` is called once for every file, whether it succeeds or fails.
+    """
+    files = [
+        (doc.id, f)
+        for doc in read_latest_index(root).documents
+        for f in doc.files
+        if recreate or _needs_variants(f)
+    ]
+
+    results: RegenerateResults = {"updated": [], "failed": []}
+    pending: list[ThumbnailUpdate] = []
+
+    def commit() -> None:
+        recorded = _commit_new_thumbnails(root, pending)
+        results["updated"].extend(u["file"] for u in recorded)
+        pending.clear()
+
+    calls = [{"root": root, "f": f, "recreate": recreate} for _, f in files]
+
+    try:
+        for i, outcome in _run_in_parallel(_regenerate_thumbnail, calls, jobs=jobs):
+            doc_id, f = files[i]
+
+            if isinstance(outcome, Thumbnail):
+                pending.append({"doc_id": doc_id, "file": f, "thumbnail": outcome})
+            else:
+                results["failed"].append({"file": f, "error": outcome})
+
+            if len(pending) >= commit_every:
+                commit()
+
+            if on_progress is not None:
+                on_progress()
+
+        if pending:
+            commit()
+    except BaseException:
+        for u in pending:
+            _remove_unused_thumbnails(root, old=u["thumbnail"], new=u["file"].thumbnail)
+        raise
+
+    return results
+
+
+# If a worker claimed a job this long ago (in seconds) and hasn't
+# finished it, we assume the worker died and put the job back in the queue.
+STALE_JOB_TIMEOUT = 60 * 60
+
+
+class ThumbnailJobResults(typing.TypedDict):
+    updated: list[File]
+    # Jobs that failed, and will be retried later
+    retrying: list[job_queue.Job]
+    # Jobs that failed too many times, and were moved to the dead-letter list
+    failed: list[job_queue.Job]
+
+
+def process_thumbnail_jobs(
+    root: pathlib.Path,
+    *,
+    jobs: int = 1,
+    batch_size: int = 100,
+    max_attempts: int = 3,
+    retry_delay: float = 60,
+) -> ThumbnailJobResults:
+    """
+    Create the thumbnails for files that were stored with a placeholder,
+    until there are no jobs left that are ready to run.
+
+    Jobs are claimed ``batch_size`` at a time, with up to ``jobs`` thumbnails
+    created at once in separate processes, and the new thumbnails for each
+    batch are recorded together.  A job that fails is retried after
+    ``retry_delay`` seconds (doubling after each failure), and moves to
+    the dead-letter list after ``max_attempts`` failures.
+    """
+    results: ThumbnailJobResults = {"updated": [], "retrying": [], "failed": []}
+
+    job_queue.recover_stale_jobs(root, older_than=STALE_JOB_TIMEOUT)
+
+    while True:
+        claimed = job_queue.claim_jobs(root, limit=batch_size)
+
+        if not claimed:
+            return results
+
+        # Look up the files by ID rather than their document, in case
+        # the document was merged since the job was queued.
+        stored_files = {
+            f.id: (doc.id, f)
+            for doc in read_latest_index(root).documents
+            for f in doc.files
+        }
+
+        todo: list[tuple[job_queue.Job, str, File]] = []
+
+        for job in claimed:
+            try:
+                doc_id, f = stored_files[job["file_id"]]
+            except KeyError:
+                # The file has been deleted, so there's nothing to do
+                job_queue.finish_job(root, job)
+            else:
+                todo.append((job, doc_id, f))
+
+        calls = [
+            {
+                "root": root,
+                "out_path": os.path.join(root, f.path),
+                "checksum": f.checksum,
+            }
+            for _, _, f in todo
+        ]
+
+        updates: list[tuple[job_queue.Job, ThumbnailUpdate]] = []
+
+        try:
+            for i, outcome in _run_in_parallel(_create_thumbnail, calls, jobs=jobs):
+                job, doc_id, f = todo[i]
+
+                if isinstance(outcome, Thumbnail):
+                    updates.append(
+                        (job, {"doc_id": doc_id, "file": f, "thumbnail": outcome})
+                    )
+                    continue
+
+                failed_job = job_queue.fail_job(
+                    root,
+                    job,
+                    error=str(outcome),
+                    max_attempts=max_attempts,
+                    retry_delay=retry_delay,
+                )
+
+                if job_queue.is_dead_letter(failed_job, max_attempts=max_attempts):
+                    results["failed"].append(failed_job)
+                else:
+                    results["retrying"].append(failed_job)
+
+            recorded = _commit_new_thumbnails(root, [u for _, u in updates])
+        except BaseException:
+            for _, u in updates:
+                _remove_unused_thumbnails(
+                    root, old=u["thumbnail"], new=u["file"].thumbnail
+                )
+            for job in claimed:
+                with contextlib.suppress(FileNotFoundError):
+                    job_queue.release_job(root, job)
+            raise
+
+        for job, u in updates:
+            if u in recorded:
+                job_queue.finish_job(root, job)
+                results["updated"].append(u["file"])
+            else:
+                # The file changed while we were creating its thumbnail,
+                # so try again with the latest version.
+                job_queue.release_job(root, job)
 
 
 def pairwise_merge_documents(
@@ -164,57 +1514,100 @@ def pairwise_merge_documents(
     Before: 2 documents with 1 file each
     After:  1 document with 2 files
     """
-    documents = read_documents(root)
-    assert doc2 in documents
-    documents.remove(doc2)
+    with lock_documents(root):
+        index = read_latest_index(root)
+        assert index.by_id.get(doc2.id) == doc2
+
+        # Merge into the stored copy of the document; this will throw an error
+        # if the document has changed between starting and finishing the merge.
+        stored_doc1 = index.by_id.get(doc1.id)
+        if stored_doc1 is None or stored_doc1 != doc1:
+            raise ValueError(f"Document {doc1.id} has changed since the merge started")
 
-    # Modify the copy of the document that's about to be written; this will
-    # throw an error if the document has changed between starting and finishing
-    # the merge.
-    stored_doc1 = documents[documents.index(doc1)]
+        merged_doc = attr.evolve(
+            stored_doc1,
+            date_saved=min([stored_doc1.date_saved, doc2.date_saved]),
+            tags=new_tags,
+            title=new_title,
+            files=stored_doc1.files + doc2.files,
+        )
 
-    stored_doc1.date_saved = min([stored_doc1.date_saved, doc2.date_saved])
-    stored_doc1.tags = new_tags
-    stored_doc1.title = new_title
-    stored_doc1.files.extend(doc2.files)
-    write_documents(root=root, documents=documents)
+        _record_operations(
+            root, [journal.merge_operation(merged_doc, merged_id=doc2.id)]
+        )
 
-    return stored_doc1
+    return merged_doc
 
 
 def delete_document(root: pathlib.Path, *, doc_id: str) -> None:
-    documents = read_documents(root)
-    doc = [d for d in documents if d.id == doc_id][0]
+    with lock_documents(root):
+        doc = _read_latest_document(root, doc_id)
 
-    delete_dir = os.path.join(root, "deleted", doc.id)
-    os.makedirs(delete_dir, exist_ok=True)
+        delete_dir = os.path.join(root, "deleted", doc.id)
+        os.makedirs(delete_dir, exist_ok=True)
 
-    for f in doc.files:
-        os.rename(
-            os.path.join(root, f.path),
-            os.path.join(delete_dir, os.path.basename(f.path)),
-        )
-        os.unlink(os.path.join(root, f.thumbnail.path))
+        for f in doc.files:
+            os.rename(
+                os.path.join(root, f.path),
+                os.path.join(delete_dir, os.path.basename(f.path)),
+            )
+            for p in _thumbnail_paths(f.thumbnail):
+                os.unlink(os.path.join(root, p))
 
-    with open(os.path.join(delete_dir, "document.json"), "w") as outfile:
-        outfile.write(
-            json.dumps(
-                cattr.unstructure(doc), indent=2, sort_keys=True, cls=DocstoreEncoder
+            for p in set(_lazy_variant_paths(f.thumbnail)) - set(
+                _thumbnail_paths(f.thumbnail)
+            ):
+                with contextlib.suppress(FileNotFoundError):
+                    os.unlink(os.path.join(root, p))
+
+        with open(os.path.join(delete_dir, "document.json"), "w") as outfile:
+            outfile.write(
+                json.dumps(
+                    unstructure_document(doc),
+                    indent=2,
+                    sort_keys=True,
+                    cls=DocstoreEncoder,
+                )
             )
-        )
 
-    documents = [d for d in documents if d.id != doc_id]
-    write_documents(root=root, documents=documents)
+        _record_operations(root, [journal.delete_operation(doc_id)])
+
+
+def retag_document(root: pathlib.Path, *, doc_id: str, tags: list[str]) -> Document:
+    """
+    Replace the tags on a document.
+    """
+    with lock_documents(root):
+        doc = _read_latest_document(root, doc_id)
+        _record_operations(root, [journal.retag_operation(doc_id, tags=tags)])
+
+    return attr.evolve(doc, tags=tags)
 
 
-def find_original_filename(root: pathlib.Path, *, path: str) -> str:
+def migrate_backend(
+    root: pathlib.Path, *, to: typing.Literal["json", "sqlite"]
+) -> None:
     """
-    Returns the name of the original file stored in this path.
+    Convert a docstore instance between the JSON and SQLite backends.
+
+    The old database is kept as a ``.bak`` file next to the new one.
     """
-    documents = read_documents(root)
-    for d in documents:
-        for f in d.files:
-            if f.path == os.path.relpath(path, root):
-                return f.filename
+    with lock_documents(root):
+        if to == ("sqlite" if uses_sqlite(root) else "json"):
+            return
+
+        documents = read_latest_index(root).documents
+
+        if to == "sqlite":
+            tmp_path = sqlite_store.sqlite_path(root).with_suffix(".sqlite.tmp")
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            sqlite_store.write_documents(tmp_path, documents)
 
-    raise ValueError(f"Couldn't find file stored with path {path}")
+            compact_documents(root)
+            os.rename(db_path(root), f"{db_path(root)}.bak")
+            os.rename(tmp_path, sqlite_store.sqlite_path(root))
+        else:
+            sqlite_path = sqlite_store.sqlite_path(root)
+            os.rename(sqlite_path, f"{sqlite_path}.bak")
+            write_documents(root=root, documents=documents)
@@ -1,11 +1,220 @@
+import ctypes
+import errno
+import hashlib
+import io
 import os
 import secrets
-import shutil
+import sys
+import typing
 
 from docstore.text_utils import slugify
 
+# Files are copied in 1 MiB chunks, which is much faster than
+# the default for large scans and videos.
+COPY_BUFFER_SIZE = 1024 * 1024
 
-def normalised_filename_copy(*, src: str, dst: str) -> str:
+# From <linux/fs.h>
+FICLONE = 0x40049409
+
+
+PlacementMethod: typing.TypeAlias = typing.Literal[
+    "link", "clone", "copy_file_range", "sendfile", "copy"
+]
+
+
+class CopyResult(typing.TypedDict):
+    path: str
+    size: int
+    checksum: str
+    method: PlacementMethod
+
+
+def _hash_chunks(
+    src_file: io.BufferedReader, *, dst_file: io.BufferedWriter | None = None
+) -> tuple[int, str]:
+    """
+    Read a file in large chunks, and return its size and SHA-256 checksum.
+    If ``dst_file`` is given, the chunks are also written there.
+    """
+    h = hashlib.sha256()
+    size = 0
+
+    buffer = bytearray(COPY_BUFFER_SIZE)
+    view = memoryview(buffer)
+
+    while n := src_file.readinto(buffer):
+        h.update(view[:n])
+        if dst_file is not None:
+            dst_file.write(view[:n])
+        size += n
+
+    return size, f"sha256:{h.hexdigest()}"
+
+
+def _hard_link(src: str, dst: str) -> bool:
+    """
+    Try to hard link ``src`` to ``dst``.  This fails with FileExistsError
+    if there's already a file at ``dst``.
+    """
+    try:
+        os.link(src, dst)
+    except FileExistsError:
+        raise
+    except OSError:
+        # e.g. the two paths are on different filesystems, or the
+        # filesystem doesn't support hard links.
+        return False
+    else:
+        return True
+
+
+def _clonefile(src: str, dst: str) -> bool:
+    """
+    Try to create ``dst`` as a copy-on-write clone of ``src`` using
+    clonefile(2), which is supported by APFS on macOS.  This fails with
+    FileExistsError if there's already a file at ``dst``.
+    """
+    if sys.platform != "darwin":
+        return False
+
+    libc = ctypes.CDLL(None, use_errno=True)
+
+    if libc.clonefile(os.fsencode(src), os.fsencode(dst), 0) == 0:
+        return True
+
+    err = ctypes.get_errno()
+    if err == errno.EEXIST:
+        raise FileExistsError(err, os.strerror(err), dst)
+
+    return False
+
+
+def _reflink(src_fd: int, dst_fd: int) -> bool:
+    """
+    Try to make the (empty) ``dst_fd`` a copy-on-write clone of ``src_fd``,
+    which is supported by filesystems like Btrfs and XFS on Linux.
+    """
+    if sys.platform != "linux":
+        return False
+
+    import fcntl
+
+    try:
+        fcntl.ioctl(dst_fd, FICLONE, src_fd)
+    except OSError:
+        return False
+    else:
+        return True
+
+
+def _copy_in_kernel(src_fd: int, dst_fd: int) -> PlacementMethod | None:
+    """
+    Try to copy ``src_fd`` to ``dst_fd`` without passing the bytes
+    through Python, using copy_file_range(2) or sendfile(2).
+
+    Returns the method that worked, or None if neither is supported.
+    """
+    size = os.fstat(src_fd).st_size
+
+    copy_functions: list[tuple[PlacementMethod, typing.Callable[[int, int], int]]] = []
+
+    if hasattr(os, "copy_file_range"):
+        copy_functions.append(
+            (
+                "copy_file_range",
+                lambda offset, count: os.copy_file_range(
+                    src_fd, dst_fd, count, offset, offset
+                ),
+            )
+        )
+
+    copy_functions.append(
+        ("sendfile", lambda offset, count: os.sendfile(dst_fd, src_fd, offset, count))
+    )
+
+    for method, copy_range in copy_functions:
+        copied = 0
+
+        try:
+            while copied < size:
+                n = copy_range(copied, size - copied)
+                if n == 0:
+                    break
+                copied += n
+        except OSError:
+            pass
+
+        if copied == size:
+            return method
+
+        # Discard anything we copied before it failed, then try the next method.
+        os.ftruncate(dst_fd, 0)
+
+    return None
+
+
+def _copy_through_python(infile: io.BufferedReader, out_file: io.BufferedWriter) -> int:
+    """
+    Copy ``infile`` to ``out_file`` in large chunks, and return the size.
+    """
+    size = 0
+
+    buffer = bytearray(COPY_BUFFER_SIZE)
+    view = memoryview(buffer)
+
+    while n := infile.readinto(buffer):
+        out_file.write(view[:n])
+        size += n
+
+    return size
+
+
+def _place_file(
+    infile: io.BufferedReader, out_path: str, *, link: bool, checksum: str | None
+) -> CopyResult:
+    """
+    Put a copy of ``infile`` at ``out_path``, using the cheapest method
+    that works.  This fails with FileExistsError if there's already
+    a file at ``out_path``.
+    """
+    src = typing.cast(str, infile.name)
+    size = os.fstat(infile.fileno()).st_size
+
+    method: PlacementMethod | None = None
+
+    if link and _hard_link(src, out_path):
+        method = "link"
+    elif _clonefile(src, out_path):
+        method = "clone"
+    else:
+        with open(out_path, "xb") as out_file:
+            if _reflink(infile.fileno(), out_file.fileno()):
+                method = "clone"
+            elif checksum is None:
+                # If we don't know the checksum yet, copy the bytes through
+                # Python so we can hash them on the way -- copying any other
+                # way means reading it all again afterwards to get the checksum.
+                size, checksum = _hash_chunks(infile, dst_file=out_file)
+                method = "copy"
+            else:
+                method = _copy_in_kernel(infile.fileno(), out_file.fileno())
+
+            if method is None:
+                infile.seek(0)
+                size = _copy_through_python(infile, out_file)
+                method = "copy"
+
+    # A link or a clone doesn't read the bytes, so this is the only time
+    # we read the file.
+    if checksum is None:
+        size, checksum = _hash_chunks(infile)
+
+    return {"path": out_path, "size": size, "checksum": checksum, "method": method}
+
+
+def normalised_filename_copy(
+    *, src: str, dst: str, link: bool = False, checksum: str | None = None
+) -> CopyResult:
     """
     Copies a file from ``src`` to ``dst``.
 
@@ -22,7 +231,19 @@ def normalised_filename_copy(*, src: str, dst: str) -> str:
     e.g. if you pass dst=``Statement.pdf``, it might create files like
     ``Statement.pdf``, ``Statement_1c5e.pdf``, ``Statement_3fc9.pdf``
 
-    Returns the name of the final file.
+    Where possible, the file isn't copied byte-by-byte: we try
+    a copy-on-write clone, then copy_file_range/sendfile, and only copy
+    through Python as a last resort.  If ``link`` is True, we try a hard
+    link first -- only use this if you're about to delete ``src``, or
+    changes to ``src`` will show up in the copy.
+
+    If you already know the ``checksum`` of ``src``, pass it in so we
+    don't have to read the file.  Without a checksum, we hash a linked
+    or cloned file afterwards, or copy through Python so we can hash
+    the file in the same pass.
+
+    Returns the name of the final file, plus the size and SHA-256 checksum
+    of the contents and how the file was placed.
 
     """
     out_dir, filename = os.path.split(dst)
@@ -34,12 +255,13 @@ def normalised_filename_copy(*, src: str, dst: str) -> str:
 
     out_path = os.path.join(out_dir, name + ext)
 
-    while True:
-        try:
-            with open(out_path, "xb") as out_file:
-                with open(src, "rb") as infile:
-                    shutil.copyfileobj(infile, out_file)
-        except FileExistsError:
-            out_path = os.path.join(out_dir, name + "_" + secrets.token_hex(2) + ext)
-        else:
-            return out_path
+    # Open the source first, so we don't leave behind an empty file
+    # if it doesn't exist.
+    with open(src, "rb") as infile:
+        while True:
+            try:
+                return _place_file(infile, out_path, link=link, checksum=checksum)
+            except FileExistsError:
+                out_path = os.path.join(
+                    out_dir, name + "_" + secrets.token_hex(2) + ext
+                )
@@ -0,0 +1,191 @@
+"""
+Lookup tables for finding documents and files without scanning the
+whole collection.
+
+A ``DocumentIndex`` is built for a single, unchanging list of documents.
+When the documents change, the cache in ``docstore.documents`` creates
+a new index rather than modifying the old one.
+"""
+
+import functools
+import heapq
+import itertools
+import typing
+from collections.abc import Callable
+
+from docstore.models import Document, File
+
+SortKey: typing.TypeAlias = Callable[[Document], typing.Any]
+
+
+# The orders we can show documents in, as (sort key, reverse).  These
+# match the options in the web app (except "random", which depends on
+# a seed, so it's handled by the app).
+SORT_ORDERS: dict[str, tuple[SortKey, bool]] = {
+    "date (newest first)": (lambda d: d.date_saved, True),
+    "date (oldest first)": (lambda d: d.date_saved, False),
+    "title (A to Z)": (lambda d: d.title.lower(), False),
+    "title (Z to A)": (lambda d: d.title.lower(), True),
+}
+
+
+class DocumentIndex:
+    def __init__(
+        self, documents: list[Document], *, version: str | None = None
+    ) -> None:
+        self.documents = documents
+
+        # A value that identifies this version of the documents, which
+        # changes whenever they're modified -- or None if it's unknown.
+        self.version = version
+
+        # Sort order -> documents in that order, and doc ID -> position
+        self._sorted: dict[str, list[Document]] = {}
+        self._positions: dict[str, dict[str, int]] = {}
+
+    # Each index is built the first time it's used, so callers that only
+    # need the list of documents don't pay for indexes they never look at.
+
+    @functools.cached_property
+    def by_id(self) -> dict[str, Document]:
+        """
+        Document ID -> Document
+        """
+        return {doc.id: doc for doc in self.documents}
+
+    @functools.cached_property
+    def files_by_path(self) -> dict[str, File]:
+        """
+        Path of the stored file, relative to the root -> File
+        """
+        return {f.path: f for doc in self.documents for f in doc.files}
+
+    @functools.cached_property
+    def files_by_thumbnail_path(self) -> dict[str, File]:
+        """
+        Path of a thumbnail or one of its variants, relative to the root -> File
+        """
+        return {
+            p: f
+            for doc in self.documents
+            for f in doc.files
+            for p in [f.thumbnail.path] + [v.path for v in f.thumbnail.variants]
+        }
+
+    @functools.cached_property
+    def files_by_checksum(self) -> dict[str, list[File]]:
+        """
+        Checksum -> every File with that checksum
+        """
+        result: dict[str, list[File]] = {}
+
+        for doc in self.documents:
+            for f in doc.files:
+                result.setdefault(f.checksum, []).append(f)
+
+        return result
+
+    @functools.cached_property
+    def doc_ids_by_tag(self) -> dict[str, set[str]]:
+        """
+        Tag -> IDs of every document with that tag
+        """
+        result: dict[str, set[str]] = {}
+
+        for doc in self.documents:
+            for t in doc.tags:
+                result.setdefault(t, set()).add(doc.id)
+
+        return result
+
+    def warm(self) -> None:
+        """
+        Build the indexes that the web app uses on every request, so
+        the first request doesn't have to wait for them.
+        """
+        _ = self.by_id
+        _ = self.files_by_path
+        _ = self.doc_ids_by_tag
+        self.sorted_documents("date (newest first)")
+
+    def documents_with_tags(self, tags: set[str]) -> list[Document]:
+        """
+        Returns every document that has all of the given tags, in the
+        same order as ``documents``.
+        """
+        if not tags:
+            return self.documents
+
+        matching_ids = set.intersection(
+            *(self.doc_ids_by_tag.get(t, set()) for t in tags)
+        )
+
+        return [doc for doc in self.documents if doc.id in matching_ids]
+
+    def sorted_documents(self, sort_by: str) -> list[Document]:
+        """
+        Returns every document in one of the ``SORT_ORDERS``.
+
+        Each order is sorted the first time it's used, and then kept
+        until the documents change.
+        """
+        try:
+            return self._sorted[sort_by]
+        except KeyError:
+            pass
+
+        sort_key, reverse = SORT_ORDERS[sort_by]
+        result = sorted(self.documents, key=sort_key, reverse=reverse)
+        self._sorted[sort_by] = result
+        return result
+
+    def _sort_positions(self, sort_by: str) -> dict[str, int]:
+        try:
+            return self._positions[sort_by]
+        except KeyError:
+            pass
+
+        result = {doc.id: i for i, doc in enumerate(self.sorted_documents(sort_by))}
+        self._positions[sort_by] = result
+        return result
+
+    def top_documents(
+        self, documents: list[Document], *, sort_by: str, count: int
+    ) -> list[Document]:
+        """
+        Returns the first ``count`` of ``documents`` in one of the
+        ``SORT_ORDERS``, without sorting all of them.
+
+        This is the same as ``sorted(documents, ...)[:count]``, including
+        the order of documents with equal sort keys.
+        """
+        if documents is self.documents:
+            return self.sorted_documents(sort_by)[:count]
+
+        if len(documents) <= count:
+            sort_key, reverse = SORT_ORDERS[sort_by]
+            return sorted(documents, key=sort_key, reverse=reverse)
+
+        # If lots of documents match (e.g. a common tag), we'll find enough
+        # of them near the start of the sorted list of every document.
+        # The expected scan is ``count * len(self.documents) / len(documents)``.
+        if len(documents) ** 2 > count * len(self.documents):
+            matching_ids = {doc.id for doc in documents}
+
+            return list(
+                itertools.islice(
+                    (
+                        doc
+                        for doc in self.sorted_documents(sort_by)
+                        if doc.id in matching_ids
+                    ),
+                    count,
+                )
+            )
+
+        # Otherwise, pick the top k with a heap.  Looking up each document's
+        # position in the sorted list of every document is cheaper than
+        # comparing dates or titles.
+        positions = self._sort_positions(sort_by)
+
+        return heapq.nsmallest(count, documents, key=lambda d: positions[d.id])
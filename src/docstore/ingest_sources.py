@@ -0,0 +1,121 @@
+"""
+Find the files to store with ``docstore add-many``.
+
+The files can be described in three ways:
+
+-   a directory, in which case we store every file inside it
+-   a glob pattern, e.g. ``~/Downloads/*.pdf``
+-   a JSONL manifest, with one JSON object per line, e.g.
+
+        {"path": "scan1.pdf", "title": "Gas bill", "tags": ["bills"]}
+
+    Each line must have a ``path``, and can optionally have a ``title``,
+    ``tags`` and ``source_url``.  Relative paths are resolved relative
+    to the manifest.
+
+If a document doesn't have a title (including every document from a
+directory or a glob), its title is the filename without its extension.
+"""
+
+import glob
+import json
+import os
+import pathlib
+
+from docstore.documents import NewDocument
+
+
+def _default_title(path: str) -> str:
+    """
+    The title for a document that doesn't have one: the filename
+    without its extension.
+    """
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def _is_manifest(source: str) -> bool:
+    return source.endswith(".jsonl") and os.path.isfile(source)
+
+
+def _read_manifest(manifest_path: str) -> list[NewDocument]:
+    manifest_dir = os.path.dirname(os.path.abspath(manifest_path))
+    result: list[NewDocument] = []
+
+    with open(manifest_path) as infile:
+        for lineno, line in enumerate(infile, start=1):
+            if not line.strip():
+                continue
+
+            try:
+                entry = json.loads(line)
+                path = entry["path"]
+            except (ValueError, KeyError, TypeError):
+                raise ValueError(
+                    f"Line {lineno} of {manifest_path} should be a JSON object "
+                    f"with a 'path': {line.strip()!r}"
+                )
+
+            tags = entry.get("tags") or []
+            if isinstance(tags, str):
+                tags = tags.split(",")
+
+            result.append(
+                {
+                    "path": pathlib.Path(manifest_dir) / os.path.expanduser(path),
+                    "title": entry.get("title") or _default_title(path),
+                    "tags": [t.strip() for t in tags if t.strip()],
+                    "source_url": entry.get("source_url"),
+                }
+            )
+
+    return result
+
+
+def _find_paths(source: str) -> list[str]:
+    if os.path.isdir(source):
+        paths = [
+            os.path.join(dirpath, f)
+            for dirpath, dirnames, filenames in os.walk(source)
+            for f in filenames
+            if not f.startswith(".")
+        ]
+    else:
+        paths = [
+            p
+            for p in glob.glob(os.path.expanduser(source), recursive=True)
+            if os.path.isfile(p)
+        ]
+
+    return sorted(paths)
+
+
+def find_new_documents(
+    source: str, *, tags: list[str], source_url: str | None
+) -> list[NewDocument]:
+    """
+    Returns a description of every file to store from ``source``.
+
+    The ``tags`` are added to every document, and ``source_url`` is used
+    for any document that doesn't have its own.
+    """
+    if _is_manifest(source):
+        new_documents = _read_manifest(source)
+    else:
+        new_documents = [
+            {
+                "path": pathlib.Path(p),
+                "title": _default_title(p),
+                "tags": [],
+                "source_url": None,
+            }
+            for p in _find_paths(source)
+        ]
+
+    if not new_documents:
+        raise ValueError(f"Couldn't find any files to store in {source}")
+
+    for new_doc in new_documents:
+        new_doc["tags"] += [t for t in tags if t not in new_doc["tags"]]
+        new_doc["source_url"] = new_doc["source_url"] or source_url
+
+    return new_documents
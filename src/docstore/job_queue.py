@@ -0,0 +1,270 @@
+"""
+A persistent queue of thumbnails that we still need to create.
+
+When a file is stored with deferred thumbnails, it's recorded straight
+away with a placeholder thumbnail, and we add a job here.  A worker
+(``docstore worker``, or the background thread in ``docstore serve``)
+creates the real thumbnail later.
+
+Each job is a small JSON file under ``jobs/`` in the root, named after
+the file it's for:
+
+*   ``jobs/pending`` has the jobs waiting to run
+*   ``jobs/running`` has the jobs a worker is working on.  Workers claim
+    a job by renaming it into this directory, so two workers never run
+    the same job.
+*   ``jobs/failed`` is the dead-letter list: the jobs that failed too many
+    times.  They stay there until somebody retries them.
+
+The queue lives in plain files so it survives restarts, and it's safe
+to use from several processes at once.
+"""
+
+import json
+import os
+import pathlib
+import secrets
+import time
+import typing
+
+JobState: typing.TypeAlias = typing.Literal["pending", "running", "failed"]
+
+
+class Job(typing.TypedDict):
+    doc_id: str
+    file_id: str
+    attempts: int
+    # Unix time; the job won't be run before this (e.g. if it failed
+    # recently and we're waiting to retry it).
+    not_before: float
+    last_error: str | None
+
+
+def jobs_dir(root: pathlib.Path) -> pathlib.Path:
+    """
+    Returns the path to the job queue.
+    """
+    return root / "jobs"
+
+
+def _job_path(root: pathlib.Path, state: JobState, file_id: str) -> pathlib.Path:
+    return jobs_dir(root) / state / f"{file_id}.json"
+
+
+def _write_job(root: pathlib.Path, state: JobState, job: Job) -> None:
+    """
+    Write a job to the queue.  The job is written to a temporary file
+    and renamed into place, so workers never see a partially written job.
+    """
+    out_path = _job_path(root, state, job["file_id"])
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+
+    tmp_path = out_path.with_name(f".{out_path.name}.{secrets.token_hex(4)}.tmp")
+
+    with open(tmp_path, "w") as out_file:
+        out_file.write(json.dumps(job))
+        out_file.flush()
+        os.fsync(out_file.fileno())
+
+    os.replace(tmp_path, out_path)
+
+
+def _read_job(path: pathlib.Path) -> Job:
+    with open(path) as infile:
+        return typing.cast(Job, json.load(infile))
+
+
+def new_job(*, doc_id: str, file_id: str) -> Job:
+    return {
+        "doc_id": doc_id,
+        "file_id": file_id,
+        "attempts": 0,
+        "not_before": 0,
+        "last_error": None,
+    }
+
+
+def enqueue_jobs(root: pathlib.Path, jobs: list[Job]) -> None:
+    """
+    Add some jobs to the queue.
+    """
+    for job in jobs:
+        _write_job(root, "pending", job)
+
+
+def has_job(
+    root: pathlib.Path,
+    *,
+    file_id: str,
+    states: typing.Iterable[JobState] = ("pending", "running"),
+) -> bool:
+    """
+    Returns True if there's a job for this file in any of the given states.
+    """
+    return any(_job_path(root, state, file_id).exists() for state in states)
+
+
+def list_jobs(root: pathlib.Path, state: JobState) -> list[Job]:
+    """
+    Returns all the jobs in a given state, oldest first.
+    """
+    try:
+        entries = [
+            e
+            for e in os.scandir(jobs_dir(root) / state)
+            if e.name.endswith(".json") and not e.name.startswith(".")
+        ]
+    except FileNotFoundError:
+        return []
+
+    jobs = []
+
+    for e in sorted(entries, key=lambda e: e.stat().st_mtime):
+        try:
+            jobs.append(_read_job(pathlib.Path(e.path)))
+        except FileNotFoundError:
+            # e.g. a worker claimed it while we were listing the jobs
+            pass
+
+    return jobs
+
+
+def claim_jobs(
+    root: pathlib.Path, *, limit: int, now: float | None = None
+) -> list[Job]:
+    """
+    Claim up to ``limit`` pending jobs that are ready to run.
+
+    The caller must either ``finish_job``, ``release_job`` or ``fail_job``
+    each of the jobs it claims.
+    """
+    if now is None:
+        now = time.time()
+
+    claimed: list[Job] = []
+
+    for job in list_jobs(root, "pending"):
+        if len(claimed) >= limit:
+            break
+
+        if job["not_before"] > now:
+            continue
+
+        running_path = _job_path(root, "running", job["file_id"])
+        running_path.parent.mkdir(parents=True, exist_ok=True)
+
+        try:
+            os.rename(_job_path(root, "pending", job["file_id"]), running_path)
+        except FileNotFoundError:
+            # Another worker got there first
+            continue
+
+        # Record when we claimed the job, so ``recover_stale_jobs`` can
+        # tell if the worker running it has died.
+        os.utime(running_path)
+
+        claimed.append(_read_job(running_path))
+
+    return claimed
+
+
+def finish_job(root: pathlib.Path, job: Job) -> None:
+    """
+    Remove a job that's been completed.
+    """
+    os.unlink(_job_path(root, "running", job["file_id"]))
+
+
+def release_job(root: pathlib.Path, job: Job) -> None:
+    """
+    Put a claimed job back in the queue, without counting it as an attempt.
+    """
+    os.rename(
+        _job_path(root, "running", job["file_id"]),
+        _job_path(root, "pending", job["file_id"]),
+    )
+
+
+def fail_job(
+    root: pathlib.Path,
+    job: Job,
+    *,
+    error: str,
+    max_attempts: int,
+    retry_delay: float,
+) -> Job:
+    """
+    Record a failed attempt at a job, and return the updated job.
+
+    The job is retried later, waiting twice as long after each failure.
+    Once it's failed ``max_attempts`` times, it moves to the dead-letter list.
+    """
+    attempts = job["attempts"] + 1
+
+    failed_job: Job = {
+        **job,
+        "attempts": attempts,
+        "not_before": time.time() + retry_delay * 2 ** (attempts - 1),
+        "last_error": error,
+    }
+
+    if attempts >= max_attempts:
+        _write_job(root, "failed", failed_job)
+    else:
+        _write_job(root, "pending", failed_job)
+
+    finish_job(root, job)
+
+    return failed_job
+
+
+def is_dead_letter(job: Job, *, max_attempts: int) -> bool:
+    return job["attempts"] >= max_attempts
+
+
+def retry_failed_jobs(root: pathlib.Path) -> list[Job]:
+    """
+    Move every job on the dead-letter list back to the queue, and
+    return the jobs that were moved.
+    """
+    retried = []
+
+    for job in list_jobs(root, "failed"):
+        new_job: Job = {**job, "attempts": 0, "not_before": 0}
+        _write_job(root, "pending", new_job)
+        os.unlink(_job_path(root, "failed", job["file_id"]))
+        retried.append(new_job)
+
+    return retried
+
+
+def recover_stale_jobs(root: pathlib.Path, *, older_than: float) -> list[Job]:
+    """
+    Put back any jobs that were claimed more than ``older_than`` seconds
+    ago, and return them.  This happens if a worker dies midway through
+    a batch of jobs.
+    """
+    recovered = []
+
+    try:
+        entries = list(os.scandir(jobs_dir(root) / "running"))
+    except FileNotFoundError:
+        return []
+
+    for e in entries:
+        if not e.name.endswith(".json"):
+            continue
+
+        try:
+            if e.stat().st_mtime >= time.time() - older_than:
+                continue
+
+            job = _read_job(pathlib.Path(e.path))
+            release_job(root, job)
+        except FileNotFoundError:
+            # The worker finished it while we were looking
+            continue
+
+        recovered.append(job)
+
+    return recovered
@@ -0,0 +1,298 @@
+"""
+An append-only journal of changes to the documents database.
+
+Rather than rewriting the whole of ``documents.json`` every time a document
+is added, merged or deleted, docstore appends a small record describing the
+change to a journal file next to the database.  When the documents are read,
+the journal is replayed on top of the last snapshot in ``documents.json``.
+
+Every operation records the absolute new state of the documents it touches,
+so replaying an operation that's already in the snapshot is harmless -- this
+matters if docstore crashes between writing a new snapshot and clearing
+the journal.
+
+Once the journal gets big enough, it's folded into a new snapshot.
+This is called "compaction".
+"""
+
+import json
+import os
+import pathlib
+import typing
+
+import attr
+
+from docstore.models import (
+    DocstoreEncoder,
+    Document,
+    structure_document,
+    unstructure_document,
+)
+
+# When the journal has this many operations or bytes, it gets folded
+# into a new snapshot.
+COMPACT_AFTER_OPERATIONS = 1000
+COMPACT_AFTER_BYTES = 5 * 1024 * 1024
+
+
+class AddOperation(typing.TypedDict):
+    op: typing.Literal["add"]
+    document: dict[str, typing.Any]
+
+
+class MergeOperation(typing.TypedDict):
+    op: typing.Literal["merge"]
+    document: dict[str, typing.Any]
+    merged_id: str
+
+
+class DeleteOperation(typing.TypedDict):
+    op: typing.Literal["delete"]
+    doc_id: str
+
+
+class RetagOperation(typing.TypedDict):
+    op: typing.Literal["retag"]
+    doc_id: str
+    tags: list[str]
+
+
+class UpdateOperation(typing.TypedDict):
+    op: typing.Literal["update"]
+    document: dict[str, typing.Any]
+
+
+Operation: typing.TypeAlias = (
+    AddOperation | MergeOperation | DeleteOperation | RetagOperation | UpdateOperation
+)
+
+
+def journal_path(root: pathlib.Path) -> pathlib.Path:
+    """
+    Returns the path to the journal.
+    """
+    return root / "documents.journal"
+
+
+def _count_path(root: pathlib.Path) -> pathlib.Path:
+    """
+    Returns the path to a small file that records how many operations
+    are in the journal, so we don't have to read the whole journal to
+    decide whether to compact it.
+    """
+    return root / "documents.journal.count"
+
+
+def _read_count(root: pathlib.Path, *, journal_size: int) -> int | None:
+    """
+    Returns the number of operations in the journal, or None if we don't
+    know -- e.g. the count was never recorded, or it's for a journal of
+    a different size, because a writer crashed before it could update
+    the count.
+    """
+    try:
+        with open(_count_path(root)) as infile:
+            size, count = (int(v) for v in infile.read().split())
+    except (FileNotFoundError, ValueError):
+        return None
+
+    return count if size == journal_size else None
+
+
+def add_operation(document: Document) -> AddOperation:
+    return {"op": "add", "document": unstructure_document(document)}
+
+
+def merge_operation(document: Document, *, merged_id: str) -> MergeOperation:
+    return {
+        "op": "merge",
+        "document": unstructure_document(document),
+        "merged_id": merged_id,
+    }
+
+
+def delete_operation(doc_id: str) -> DeleteOperation:
+    return {"op": "delete", "doc_id": doc_id}
+
+
+def retag_operation(doc_id: str, *, tags: list[str]) -> RetagOperation:
+    return {"op": "retag", "doc_id": doc_id, "tags": tags}
+
+
+def update_operation(document: Document) -> UpdateOperation:
+    """
+    Replace a document with a new version.  Unlike ``add``, this does
+    nothing if the document has been deleted in the meantime.
+    """
+    return {"op": "update", "document": unstructure_document(document)}
+
+
+def _truncate_partial_line(out_file: typing.BinaryIO) -> None:
+    """
+    If the journal ends with a partial line (e.g. from a writer that
+    crashed midway through an append), cut it off -- otherwise the next
+    operation would be appended to it, and neither could be parsed.
+    """
+    end = out_file.seek(0, os.SEEK_END)
+    position = end
+
+    while position > 0:
+        chunk_start = max(position - 4096, 0)
+        out_file.seek(chunk_start)
+        chunk = out_file.read(position - chunk_start)
+
+        newline = chunk.rfind(b"\n")
+        if newline != -1:
+            position = chunk_start + newline + 1
+            break
+
+        position = chunk_start
+
+    if position != end:
+        out_file.truncate(position)
+
+
+def append_operations(root: pathlib.Path, operations: list[Operation]) -> None:
+    """
+    Appends some operations to the end of the journal.
+
+    Each operation is written as a single line of JSON, and all the
+    operations are written with a single call to ``write()``, then synced
+    to disk before this function returns.
+
+    The caller must hold the lock on the documents.
+    """
+    lines = "".join(
+        json.dumps(op, sort_keys=True, cls=DocstoreEncoder) + "\n" for op in operations
+    ).encode("utf8")
+
+    with open(journal_path(root), "a+b") as out_file:
+        _truncate_partial_line(out_file)
+        size = out_file.seek(0, os.SEEK_END)
+
+        count = _read_count(root, journal_size=size)
+
+        # If the count is missing or out of date, count the operations
+        # once; after that we keep it up to date as we append.
+        if count is None:
+            out_file.seek(0)
+            count = out_file.read(size).count(b"\n")
+
+        out_file.write(lines)
+        out_file.flush()
+        os.fsync(out_file.fileno())
+
+    # The count doesn't need to be durable: if it's lost or wrong, we
+    # notice because the journal size doesn't match, and count again.
+    with open(_count_path(root), "w") as out_file:
+        out_file.write(f"{size + len(lines)} {count + len(operations)}")
+
+
+def read_operations(
+    root: pathlib.Path, *, offset: int = 0
+) -> tuple[list[Operation], int]:
+    """
+    Reads the operations in the journal, starting ``offset`` bytes in.
+
+    Returns the operations and the offset of the end of the last complete
+    operation, so the next read can pick up from there.  A trailing
+    partial line (e.g. from a writer that crashed midway through an
+    append) is ignored.
+    """
+    try:
+        with open(journal_path(root), "rb") as infile:
+            infile.seek(offset)
+            data = infile.read()
+    except FileNotFoundError:
+        return [], 0
+
+    complete_length = data.rfind(b"\n") + 1
+
+    operations = [
+        typing.cast(Operation, json.loads(line))
+        for line in data[:complete_length].splitlines()
+        if line.strip()
+    ]
+
+    return operations, offset + complete_length
+
+
+def apply_operations(
+    documents: list[Document], operations: list[Operation]
+) -> list[Document]:
+    """
+    Replays a series of operations on top of a list of documents.
+
+    This returns a new list, and never modifies the documents in place --
+    callers may still be holding on to the original list.
+    """
+    result = list(documents)
+    positions = {doc.id: i for i, doc in enumerate(result)}
+
+    def upsert(doc: Document) -> None:
+        try:
+            result[positions[doc.id]] = doc
+        except KeyError:
+            positions[doc.id] = len(result)
+            result.append(doc)
+
+    def remove(doc_id: str) -> None:
+        try:
+            result.pop(positions.pop(doc_id))
+        except KeyError:
+            return
+
+        for i, doc in enumerate(result):
+            positions[doc.id] = i
+
+    for op in operations:
+        if op["op"] == "add":
+            upsert(structure_document(op["document"]))
+        elif op["op"] == "merge":
+            remove(op["merged_id"])
+            upsert(structure_document(op["document"]))
+        elif op["op"] == "delete":
+            remove(op["doc_id"])
+        elif op["op"] == "retag":
+            try:
+                i = positions[op["doc_id"]]
+            except KeyError:
+                continue
+            result[i] = attr.evolve(result[i], tags=op["tags"])
+        elif op["op"] == "update":
+            if op["document"]["id"] in positions:
+                upsert(structure_document(op["document"]))
+        else:  # pragma: no cover
+            raise ValueError(f"Unrecognised journal operation: {op!r}")
+
+    return result
+
+
+def needs_compaction(root: pathlib.Path) -> bool:
+    """
+    Returns True if the journal is big enough that it should be folded
+    into a new snapshot.
+    """
+    try:
+        size = os.stat(journal_path(root)).st_size
+    except FileNotFoundError:
+        return False
+
+    if size >= COMPACT_AFTER_BYTES:
+        return True
+
+    count = _read_count(root, journal_size=size)
+
+    return count is not None and count >= COMPACT_AFTER_OPERATIONS
+
+
+def clear_journal(root: pathlib.Path) -> None:
+    """
+    Deletes the journal.  Only call this once its operations have been
+    saved in a new snapshot.
+    """
+    for path in (journal_path(root), _count_path(root)):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
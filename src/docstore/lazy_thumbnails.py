@@ -0,0 +1,285 @@
+"""
+Create thumbnails when they're first requested, rather than when a file
+is stored.
+
+If the web app is asked for a thumbnail that isn't on disk, this module
+works out which file it belongs to and creates it.  That can be:
+
+*   a thumbnail or variant that's recorded in the database, but whose file
+    is missing (e.g. if the thumbnails directory was pruned)
+*   a size variant of a thumbnail that was stored without variants
+    (e.g. before we created them).  These are named with the same suffix
+    as the variants we create up front, e.g. ``thumbnails/c/cluster_200w.webp``
+    for the 200px wide WebP variant of ``thumbnails/c/cluster.png``.
+    They aren't recorded in the database, so ``documents`` deletes them
+    along with their thumbnail.
+
+New thumbnails are written into the thumbnails directory, so later
+requests are served straight from disk.  They're created in a pool with
+a fixed number of threads, so a page full of missing thumbnails can't
+overwhelm the server, and concurrent requests for the same thumbnail
+wait for a single render.
+"""
+
+import concurrent.futures
+import functools
+import os
+import pathlib
+import re
+import secrets
+import shutil
+import threading
+from collections.abc import Callable
+
+from docstore import derivative_cache
+from docstore.indexes import DocumentIndex
+from docstore.models import Dimensions, File, Thumbnail
+from docstore.thumbnails import (
+    VARIANT_SIZES,
+    create_thumbnail,
+    create_thumbnail_variants,
+    variant_dimensions,
+    variant_formats,
+    variant_suffix,
+)
+
+# Matches the path of a lazily-created variant, e.g. thumbnails/c/cluster_200w.webp
+LAZY_VARIANT_RE = re.compile(
+    r"^(?P<dirname>thumbnails/[^/]+)/(?P<stem>[^/]+)_(?P<width>\d+)w\.(?P<format>[a-z]+)$"
+)
+
+
+def lazy_variant_path(thumbnail_path: str, *, width: int, image_format: str) -> str:
+    """
+    Returns the path for a lazily-created variant of a thumbnail.
+    """
+    return os.path.splitext(thumbnail_path)[0] + variant_suffix(
+        width=width, image_format=image_format
+    )
+
+
+def lazy_variants(thumbnail: Thumbnail) -> list[tuple[str, Dimensions, str]]:
+    """
+    Returns the (path, dimensions, format) of every variant we'd create
+    lazily for a thumbnail that doesn't have any recorded variants.
+    """
+    if not thumbnail.path.endswith(".png"):
+        return []
+
+    # e.g. if the thumbnail is only 150px wide, the 200px and 400px
+    # variants would be the same image.
+    all_dimensions: list[Dimensions] = []
+
+    for size in VARIANT_SIZES:
+        dimensions = variant_dimensions(thumbnail.dimensions, size)
+
+        if dimensions not in all_dimensions:
+            all_dimensions.append(dimensions)
+
+    return [
+        (
+            lazy_variant_path(thumbnail.path, width=d.width, image_format=fmt),
+            d,
+            fmt,
+        )
+        for fmt in variant_formats()
+        for d in all_dimensions
+    ]
+
+
+def find_thumbnail_file(index: DocumentIndex, path: str) -> File | None:
+    """
+    Returns the file whose thumbnail (or a variant of it, recorded or
+    lazily-created) is at ``path``, or None if there isn't one.
+    """
+    f = index.files_by_thumbnail_path.get(path)
+
+    if f is not None:
+        return f
+
+    match = LAZY_VARIANT_RE.match(path)
+    if match is None:
+        return None
+
+    f = index.files_by_thumbnail_path.get(
+        f"{match.group('dirname')}/{match.group('stem')}.png"
+    )
+
+    if f is not None and any(v[0] == path for v in lazy_variants(f.thumbnail)):
+        return f
+    else:
+        return None
+
+
+def _copy_into_place(src: str, dst: str) -> None:
+    """
+    Copy a thumbnail to ``dst``, replacing it atomically so a concurrent
+    request never sees a partially-written file.
+    """
+    tmp_path = f"{dst}.{secrets.token_hex(4)}.tmp"
+
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    shutil.copyfile(src, tmp_path)
+    os.replace(tmp_path, dst)
+
+
+def render_thumbnail(root: pathlib.Path, f: File, *, max_size: int) -> None:
+    """
+    Create the thumbnail for a stored file, at the path recorded in
+    the database.
+    """
+    out_path = os.path.join(root, f.thumbnail.path)
+
+    cached = derivative_cache.get_derivatives(
+        root,
+        checksum=f.checksum,
+        extension=os.path.splitext(f.path)[1],
+        max_size=max_size,
+    )
+
+    if cached is not None:
+        _copy_into_place(cached["thumbnail_path"], out_path)
+        return
+
+    created = create_thumbnail(os.path.join(root, f.path), max_size=max_size)
+
+    try:
+        _copy_into_place(created["path"], out_path)
+    finally:
+        shutil.rmtree(os.path.dirname(created["path"]))
+
+
+def render_variant(
+    root: pathlib.Path,
+    f: File,
+    *,
+    dimensions: Dimensions,
+    image_format: str,
+    out_path: str,
+) -> None:
+    """
+    Create a variant of a file's thumbnail, which must already exist.
+    """
+    (variant,) = create_thumbnail_variants(
+        os.path.join(root, f.thumbnail.path),
+        sizes=[max(dimensions.width, dimensions.height)],
+        formats=[image_format],
+    )
+
+    try:
+        _copy_into_place(variant["path"], os.path.join(root, out_path))
+    finally:
+        shutil.rmtree(os.path.dirname(variant["path"]))
+
+
+class LazyThumbnailRenderer:
+    """
+    Creates missing thumbnails on request, in a pool of ``max_workers``
+    threads.
+    """
+
+    def __init__(
+        self, root: pathlib.Path, *, max_size: int, max_workers: int = 4
+    ) -> None:
+        self.root = root
+        self.max_size = max_size
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="docstore-thumbnails"
+        )
+        self._lock = threading.Lock()
+        self._in_flight: dict[str, concurrent.futures.Future[None]] = {}
+
+        # How many renders we've started, and how many requests waited
+        # for a render that was already running.
+        self.renders = 0
+        self.coalesced = 0
+
+    def _render_once(self, path: str, func: Callable[[], None]) -> None:
+        """
+        Run ``func`` in the pool to create the thumbnail at ``path``, unless
+        it's already running -- then wait for that render instead.
+        """
+        with self._lock:
+            fut = self._in_flight.get(path)
+
+            if fut is None:
+                fut = self._executor.submit(func)
+                self._in_flight[path] = fut
+                self.renders += 1
+                is_new = True
+            else:
+                self.coalesced += 1
+                is_new = False
+
+        if is_new:
+            fut.add_done_callback(lambda _: self._forget(path))
+
+        fut.result()
+
+    def _forget(self, path: str) -> None:
+        with self._lock:
+            self._in_flight.pop(path, None)
+
+    def _ensure_thumbnail(self, f: File) -> None:
+        if not os.path.exists(os.path.join(self.root, f.thumbnail.path)):
+            self._render_once(
+                f.thumbnail.path,
+                functools.partial(
+                    render_thumbnail, self.root, f, max_size=self.max_size
+                ),
+            )
+
+    def render(self, index: DocumentIndex, path: str) -> bool:
+        """
+        Create the thumbnail at ``path`` (relative to the root), and
+        return True -- or return False if it isn't a thumbnail we know
+        how to create.
+        """
+        f = index.files_by_thumbnail_path.get(path)
+
+        if f is not None and path == f.thumbnail.path:
+            self._ensure_thumbnail(f)
+            return True
+
+        if f is not None:
+            (variant,) = [v for v in f.thumbnail.variants if v.path == path]
+            dimensions, image_format = variant.dimensions, variant.format
+        else:
+            match = LAZY_VARIANT_RE.match(path)
+            if match is None:
+                return False
+
+            f = index.files_by_thumbnail_path.get(
+                f"{match.group('dirname')}/{match.group('stem')}.png"
+            )
+            if f is None:
+                return False
+
+            try:
+                _, dimensions, image_format = next(
+                    v for v in lazy_variants(f.thumbnail) if v[0] == path
+                )
+            except StopIteration:
+                # e.g. a size or format we wouldn't create
+                return False
+
+        # The variant is made from the thumbnail, so create that first
+        # if it's missing too.
+        self._ensure_thumbnail(f)
+
+        self._render_once(
+            path,
+            functools.partial(
+                render_variant,
+                self.root,
+                f,
+                dimensions=dimensions,
+                image_format=image_format,
+                out_path=path,
+            ),
+        )
+
+        return True
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True)
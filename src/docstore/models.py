@@ -1,15 +1,15 @@
 import datetime
 import json
+import sys
 import typing
 import uuid
 
 import attr
-import cattr
 
 from docstore.git import current_commit
 
 
-DB_SCHEMA = "v2.2.0"
+DB_SCHEMA = "v2.3.0"
 
 
 def _convert_to_datetime(d: datetime.datetime | str) -> datetime.datetime:
@@ -33,24 +33,40 @@ def _convert_to_dimensions(d: typing.Any) -> "Dimensions":
         return Dimensions(**d)
 
 
+def _convert_to_variants(v_list: list[typing.Any]) -> "list[ThumbnailVariant]":
+    return [
+        v if isinstance(v, ThumbnailVariant) else ThumbnailVariant(**v) for v in v_list
+    ]
+
+
 def _convert_to_file(f_list: list[typing.Any]) -> "list[File]":
     return [f if isinstance(f, File) else File(**f) for f in f_list]
 
 
-@attr.s
+@attr.s(slots=True)
 class Dimensions:
     width: int = attr.ib()
     height: int = attr.ib()
 
 
-@attr.s
+@attr.s(slots=True)
+class ThumbnailVariant:
+    path: str = attr.ib()
+    format: str = attr.ib()
+    dimensions: Dimensions = attr.ib(converter=_convert_to_dimensions)
+
+
+@attr.s(slots=True)
 class Thumbnail:
     path: str = attr.ib()
     dimensions: Dimensions = attr.ib(converter=_convert_to_dimensions)
     tint_color: str = attr.ib()
+    variants: list[ThumbnailVariant] = attr.ib(
+        factory=list, converter=_convert_to_variants
+    )
 
 
-@attr.s
+@attr.s(slots=True)
 class File:
     filename: str = attr.ib(converter=str)
     path: str = attr.ib()
@@ -64,7 +80,7 @@ class File:
     id: str = attr.ib(default=attr.Factory(lambda: str(uuid.uuid4())))
 
 
-@attr.s
+@attr.s(slots=True)
 class Document:
     title: str = attr.ib()
     id: str = attr.ib(default=attr.Factory(lambda: str(uuid.uuid4())))
@@ -75,6 +91,119 @@ class Document:
     files: list[File] = attr.ib(factory=list, converter=_convert_to_file)
 
 
+# These functions convert documents to and from plain dicts.  They produce
+# the same output as cattr.structure/unstructure, but they're much faster
+# on a large collection -- they know the exact shape of the models, so
+# they don't need to inspect the type of every field.
+#
+# If you add a field to one of the models, remember to add it here!
+
+
+def unstructure_document(doc: Document) -> dict[str, typing.Any]:
+    """
+    Converts a Document into a dict of JSON-compatible values.
+    """
+    return {
+        "title": doc.title,
+        "id": doc.id,
+        "date_saved": doc.date_saved.isoformat(),
+        "tags": list(doc.tags),
+        "files": [
+            {
+                "filename": f.filename,
+                "path": f.path,
+                "size": f.size,
+                "checksum": f.checksum,
+                "thumbnail": {
+                    "path": f.thumbnail.path,
+                    "dimensions": {
+                        "width": f.thumbnail.dimensions.width,
+                        "height": f.thumbnail.dimensions.height,
+                    },
+                    "tint_color": f.thumbnail.tint_color,
+                    "variants": [
+                        {
+                            "path": v.path,
+                            "format": v.format,
+                            "dimensions": {
+                                "width": v.dimensions.width,
+                                "height": v.dimensions.height,
+                            },
+                        }
+                        for v in f.thumbnail.variants
+                    ],
+                },
+                "source_url": f.source_url,
+                "date_saved": f.date_saved.isoformat(),
+                "id": f.id,
+            }
+            for f in doc.files
+        ],
+    }
+
+
+def structure_document(d: dict[str, typing.Any]) -> Document:
+    """
+    Converts a dict created by ``unstructure_document`` back into a Document.
+
+    When there are lots of documents in memory, most of the space is taken
+    up by small, often-repeated values.  To save memory, the tags and tint
+    colours are interned, and files that were saved at the same time as
+    their document share the same datetime instance.
+    """
+    parse_datetime = datetime.datetime.fromisoformat
+
+    date_saved = parse_datetime(d["date_saved"])
+
+    files = []
+
+    for f in d["files"]:
+        thumbnail = f["thumbnail"]
+        dimensions = thumbnail["dimensions"]
+
+        files.append(
+            File(
+                filename=f["filename"],
+                path=f["path"],
+                size=f["size"],
+                checksum=f["checksum"],
+                thumbnail=Thumbnail(
+                    path=thumbnail["path"],
+                    dimensions=Dimensions(
+                        width=dimensions["width"], height=dimensions["height"]
+                    ),
+                    tint_color=sys.intern(thumbnail["tint_color"]),
+                    variants=[
+                        ThumbnailVariant(
+                            path=v["path"],
+                            format=sys.intern(v["format"]),
+                            dimensions=Dimensions(
+                                width=v["dimensions"]["width"],
+                                height=v["dimensions"]["height"],
+                            ),
+                        )
+                        for v in thumbnail["variants"]
+                    ],
+                ),
+                source_url=f["source_url"],
+                date_saved=(
+                    date_saved
+                    if f["date_saved"] == d["date_saved"]
+                    else parse_datetime(f["date_saved"])
+                ),
+                id=f["id"],
+            )
+        )
+
+    return Document(
+        title=d["title"],
+        id=d["id"],
+        date_saved=date_saved,
+        tags=[sys.intern(t) for t in d["tags"]],
+        files=files,
+    )
+
+
 class DocstoreEncoder(json.JSONEncoder):
     def default(self, obj: typing.Any) -> typing.Any:
         if isinstance(obj, datetime.datetime):
@@ -103,7 +232,7 @@ def to_json(documents: list[Document]) -> str:
                 "commit": current_commit(),
                 "last_modified": datetime.datetime.now().isoformat(),
             },
-            "documents": cattr.unstructure(documents),
+            "documents": [unstructure_document(d) for d in documents],
         },
         indent=2,
         sort_keys=True,
@@ -117,4 +246,4 @@ def from_json(json_string: str) -> list[Document]:
     """
     parsed_structure = json.loads(json_string)
     assert parsed_structure["docstore"]["db_schema"] == DB_SCHEMA
-    return cattr.structure(parsed_structure["documents"], list[Document])
+    return [structure_document(d) for d in parsed_structure["documents"]]
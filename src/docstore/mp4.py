@@ -0,0 +1,117 @@
+"""
+Read the dimensions of a video from the header of an MP4 file, without
+spawning ffprobe.
+
+An MP4 file is a series of nested "boxes", each of which starts with
+its size and a four-character type.  The dimensions of each track are
+in its track header box, at ``moov > trak > tkhd``.
+
+See https://developer.apple.com/documentation/quicktime-file-format
+"""
+
+import os
+import struct
+import typing
+
+import attr
+
+from docstore.models import Dimensions
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class Box:
+    type: bytes
+    start: int  # offset of the box contents, after the header
+    end: int
+
+
+def _read_boxes(f: typing.BinaryIO, *, start: int, end: int) -> typing.Iterator[Box]:
+    """
+    Iterate over the boxes between ``start`` and ``end``, without
+    reading their contents.
+    """
+    offset = start
+
+    while offset + 8 <= end:
+        f.seek(offset)
+        size, box_type = struct.unpack(">I4s", f.read(8))
+        header_size = 8
+
+        if size == 1:
+            # The size doesn't fit in 32 bits, so it's in the next 8 bytes
+            (size,) = struct.unpack(">Q", f.read(8))
+            header_size = 16
+        elif size == 0:
+            # The box extends to the end of the file
+            size = end - offset
+
+        if size < header_size:
+            raise ValueError(f"Invalid MP4 box size at offset {offset}: {size}")
+
+        yield Box(type=box_type, start=offset + header_size, end=offset + size)
+        offset += size
+
+
+def _find_box(
+    f: typing.BinaryIO, box_type: bytes, *, start: int, end: int
+) -> typing.Iterator[Box]:
+    return (b for b in _read_boxes(f, start=start, end=end) if b.type == box_type)
+
+
+def _parse_tkhd(data: bytes) -> Dimensions | None:
+    """
+    Returns the dimensions in a track header box, or None if it isn't
+    a visual track (e.g. audio tracks have a width and height of 0).
+    """
+    version = data[0]
+
+    # The creation time, modification time and duration are 64-bit
+    # in version 1, and 32-bit in version 0.
+    offset = 4 + (32 if version == 1 else 20)
+
+    # Skip the reserved bytes, layer, alternate group, volume, and reserved.
+    offset += 16
+
+    matrix = struct.unpack_from(">9i", data, offset)
+    offset += 36
+
+    width, height = struct.unpack_from(">II", data, offset)
+
+    # The width and height are 16.16 fixed-point numbers
+    width, height = round(width / 65536), round(height / 65536)
+
+    if width == 0 or height == 0:
+        return None
+
+    # If the transformation matrix rotates the video by 90 or 270 degrees,
+    # it's displayed with the width and height swapped.
+    a, b, _, c, d, *_ = matrix
+    if a == 0 and d == 0 and b != 0 and c != 0:
+        width, height = height, width
+
+    return Dimensions(width=width, height=height)
+
+
+def get_mp4_dimensions(path: str) -> Dimensions:
+    """
+    Returns the dimensions of the first video track in an MP4 file.
+
+    Raises ValueError if the file doesn't have a video track, or
+    we can't parse it.
+    """
+    with open(path, "rb") as f:
+        file_size = os.fstat(f.fileno()).st_size
+
+        try:
+            for moov in _find_box(f, b"moov", start=0, end=file_size):
+                for trak in _find_box(f, b"trak", start=moov.start, end=moov.end):
+                    for tkhd in _find_box(f, b"tkhd", start=trak.start, end=trak.end):
+                        f.seek(tkhd.start)
+                        dimensions = _parse_tkhd(f.read(tkhd.end - tkhd.start))
+
+                        if dimensions is not None:
+                            return dimensions
+        except (struct.error, IndexError) as err:
+            raise ValueError(f"Unable to parse MP4 file {path}: {err}")
+
+    raise ValueError(f"Unable to find a video track in MP4 file {path}")
@@ -0,0 +1,143 @@
+"""
+A cache of rendered HTML pages for the web app.
+
+Rendering the list of documents means filtering, tallying tags, sorting
+the whole collection and rendering a big template -- but the page only
+depends on the documents and the query string.  The cache keeps the
+most recently used pages, up to a maximum number of entries and bytes.
+
+Each page is tied to a version of the documents (``DocumentIndex.version``).
+When the documents are reloaded, the version changes and every cached
+page is thrown away.
+
+Pages also expire, because they include relative dates like
+"date saved: 5 minutes ago".  Time is split into buckets of ``max_age``
+seconds, and a page is only used in the bucket it was rendered in.
+The web app puts the bucket in each page's ETag, so a browser's copy
+goes stale at the same time as ours.
+"""
+
+import collections
+import threading
+import time
+import typing
+from collections.abc import Hashable
+
+
+class CacheStats(typing.TypedDict):
+    hits: int
+    misses: int
+    entries: int
+    size: int
+
+
+class _CachedPage(typing.TypedDict):
+    html: str
+    size: int
+    # The time bucket when the page was rendered
+    bucket: int
+
+
+class PageCache:
+    """
+    An LRU cache of rendered pages, holding at most ``max_entries`` pages
+    and ``max_bytes`` bytes of HTML.
+    """
+
+    def __init__(
+        self, *, max_entries: int, max_bytes: int, max_age: float = 60
+    ) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+
+        self._lock = threading.Lock()
+        self._pages: collections.OrderedDict[Hashable, _CachedPage] = (
+            collections.OrderedDict()
+        )
+        self._size = 0
+        self._version: str | None = None
+
+        self.hits = 0
+        self.misses = 0
+
+    def time_bucket(self) -> int:
+        """
+        Returns the current time bucket.  Pages rendered in an earlier
+        bucket have expired.
+        """
+        return int(time.time() // self.max_age)
+
+    def _check_version(self, version: str) -> None:
+        # The caller must hold the lock.
+        if version != self._version:
+            self._pages.clear()
+            self._size = 0
+            self._version = version
+
+    def get(self, version: str, key: Hashable) -> str | None:
+        """
+        Returns the cached page for ``key``, or None if there isn't one.
+        """
+        with self._lock:
+            self._check_version(version)
+
+            page = self._pages.get(key)
+
+            if page is not None and page["bucket"] != self.time_bucket():
+                self._remove(key)
+                page = None
+
+            if page is None:
+                self.misses += 1
+                return None
+
+            self._pages.move_to_end(key)
+            self.hits += 1
+            return page["html"]
+
+    def put(self, version: str, key: Hashable, html: str) -> None:
+        """
+        Add a page to the cache, evicting the least recently used pages
+        if the cache is full.
+        """
+        size = len(html.encode("utf8"))
+
+        # Don't let one huge page push everything else out of the cache.
+        if size > self.max_bytes or self.max_entries <= 0:
+            return
+
+        with self._lock:
+            self._check_version(version)
+
+            if key in self._pages:
+                self._remove(key)
+
+            self._pages[key] = {
+                "html": html,
+                "size": size,
+                "bucket": self.time_bucket(),
+            }
+            self._size += size
+
+            while len(self._pages) > self.max_entries or self._size > self.max_bytes:
+                self._remove(next(iter(self._pages)))
+
+    def _remove(self, key: Hashable) -> None:
+        # The caller must hold the lock.
+        page = self._pages.pop(key)
+        self._size -= page["size"]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._pages.clear()
+            self._size = 0
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._pages),
+                "size": self._size,
+            }
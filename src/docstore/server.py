@@ -2,9 +2,11 @@ import collections
 import datetime
 import functools
 import hashlib
+import heapq
 import os
 import pathlib
 import secrets
+import sys
 import typing
 import urllib.parse
 from urllib.parse import parse_qsl, urlparse, urlencode
@@ -12,6 +14,7 @@ from urllib.parse import parse_qsl, urlparse, urlencode
 from flask import (
     Flask,
     Response as FlaskResponse,
+    abort,
     make_response,
     render_template,
     request,
@@ -20,13 +23,26 @@ from flask import (
 )
 import hyperlink
 import smartypants
+from werkzeug.http import is_resource_modified
 from werkzeug.middleware.profiler import ProfilerMiddleware
 
-from .documents import find_original_filename, read_documents
-from .models import Document
+from .documents import THUMBNAIL_SIZE, read_index
+from .indexes import SORT_ORDERS
+from .lazy_thumbnails import (
+    LazyThumbnailRenderer,
+    find_thumbnail_file,
+    lazy_variants,
+)
+from .models import Document, File, Thumbnail
+from .page_cache import PageCache
 from .tag_cloud import TagCloud
 from .tag_list import render_tag_list
 from .text_utils import hostname, pretty_date
+from .thumbnails import VARIANT_FORMATS
+
+
+# How many documents to show on each page of the web app
+PAGE_SIZE = 100
 
 
 def tags_with_prefix(document: Document, prefix: str) -> list[str]:
@@ -37,11 +53,121 @@ def tags_without_prefix(document: Document, prefix: str) -> list[str]:
     return [t for t in document.tags if not t.startswith(prefix)]
 
 
+class ThumbnailSource(typing.TypedDict):
+    type: str
+    srcset: str
+
+
+def content_version(f: File) -> str:
+    """
+    Returns a short version string for the contents of a file, which we
+    add to the URL of the file.
+
+    A path can be reused after a file is deleted, but a path plus the
+    version always refers to the same contents, so browsers can cache
+    it forever.
+    """
+    return f.checksum.split(":")[-1][:16]
+
+
+def thumbnail_version(root: pathlib.Path, thumbnail: Thumbnail) -> str | None:
+    """
+    Returns a short version string for a thumbnail, which we add to the
+    URLs of the thumbnail and its variants, or None if it isn't on disk.
+
+    This comes from the thumbnail file rather than the original file,
+    because a file's thumbnail can change -- e.g. a placeholder replaced
+    by the real thumbnail, or a thumbnail created again at the same path.
+    """
+    try:
+        stat = os.stat(os.path.join(root, thumbnail.path))
+    except FileNotFoundError:
+        return None
+
+    return hashlib.sha256(
+        f"{stat.st_ino}:{stat.st_size}:{stat.st_mtime_ns}".encode()
+    ).hexdigest()[:16]
+
+
+def thumbnail_sources(
+    thumbnail: Thumbnail, *, lazy: bool = False, version: str | None = None
+) -> list[ThumbnailSource]:
+    """
+    Returns a <source> for each format of the smaller variants of a
+    thumbnail, with the best format first, so the browser can pick
+    the smallest image that's big enough.
+
+    If ``lazy`` is True and the thumbnail doesn't have any variants,
+    this links to variants that will be created when they're requested.
+
+    If ``version`` is set, it's added to the URL of each variant.
+    """
+    query = "" if version is None else f"?v={version}"
+
+    if thumbnail.variants or not lazy:
+        all_variants = [(v.path, v.dimensions, v.format) for v in thumbnail.variants]
+    else:
+        all_variants = lazy_variants(thumbnail)
+
+    sources: list[ThumbnailSource] = []
+
+    for fmt in VARIANT_FORMATS:
+        variants = [(path, dims) for path, dims, f in all_variants if f == fmt]
+
+        if variants:
+            sources.append(
+                {
+                    "type": f"image/{fmt}",
+                    "srcset": ", ".join(
+                        f"/{path}{query} {dims.width}w" for path, dims in variants
+                    ),
+                }
+            )
+
+    return sources
+
+
 def url_without_sortby(u: str) -> str:
     url = hyperlink.URL.from_text(u)
     return str(url.remove("sortBy"))
 
 
+def _is_not_modified(
+    etag: str, *, last_modified: datetime.datetime | None = None
+) -> bool:
+    """
+    Returns True if the client already has the current version of
+    a resource, according to its If-None-Match/If-Modified-Since headers.
+    """
+    return not is_resource_modified(
+        request.environ, etag=etag, last_modified=last_modified
+    )
+
+
+def _set_cache_headers(
+    response: FlaskResponse, *, etag: str, immutable: bool = False
+) -> FlaskResponse:
+    response.set_etag(etag)
+
+    # Resources with a content version in the URL never change, so the
+    # browser doesn't need to check back.  Everything else is revalidated
+    # with the ETag on each use.
+    if immutable:
+        response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    else:
+        response.headers["Cache-Control"] = "no-cache"
+
+    return response
+
+
+def _not_modified_response(*, etag: str, immutable: bool = False) -> FlaskResponse:
+    return _set_cache_headers(FlaskResponse(status=304), etag=etag, immutable=immutable)
+
+
+def _last_modified(path: str) -> datetime.datetime:
+    return datetime.datetime.fromtimestamp(os.stat(path).st_mtime, tz=datetime.UTC)
+
+
 def serve_file(*, root: pathlib.Path, shard: str, filename: str) -> FlaskResponse:
     """
     Serves a file which has been saved in docstore.
@@ -50,23 +176,60 @@ def serve_file(*, root: pathlib.Path, shard: str, filename: str) -> FlaskRespons
     are downloaded with the original filename they were uploaded as,
     rather than the normalised filename.
 
+    The ETag is the checksum of the file, so we can tell if the client
+    has the current version without reading the file.
+
     """
     path = os.path.abspath(os.path.join(root, "files", shard, filename))
-    response = make_response(send_file(path))
 
-    original_filename = find_original_filename(root, path=path)
+    try:
+        f = read_index(root).files_by_path[f"files/{shard}/{filename}"]
+    except KeyError:
+        abort(404)
+
+    etag = f.checksum.split(":")[-1]
+    immutable = request.args.get("v") == content_version(f)
+
+    try:
+        if _is_not_modified(etag, last_modified=_last_modified(path)):
+            return _not_modified_response(etag=etag, immutable=immutable)
+    except FileNotFoundError:
+        abort(404)
+
+    response = make_response(send_file(path, etag=etag))
 
     # See https://stackoverflow.com/a/49481671/1558022 for UTF-8 encoding
-    encoded_filename = urllib.parse.quote(original_filename, encoding="utf-8")
+    encoded_filename = urllib.parse.quote(f.filename, encoding="utf-8")
     response.headers["Content-Disposition"] = f"filename*=utf-8''{encoded_filename}"
 
-    return response
+    return _set_cache_headers(response, etag=etag, immutable=immutable)
 
 
-def create_app(title: str, root: pathlib.Path, thumbnail_width: int) -> Flask:
+def create_app(
+    title: str,
+    root: pathlib.Path,
+    thumbnail_width: int,
+    lazy_thumbnails: bool = False,
+    render_workers: int = 4,
+    page_cache_entries: int = 128,
+    page_cache_bytes: int = 32 * 1024 * 1024,
+) -> Flask:
     app = Flask(__name__)
 
     app.config["THUMBNAIL_WIDTH"] = thumbnail_width
+    app.config["LAZY_THUMBNAILS"] = lazy_thumbnails
+
+    # If thumbnails are created lazily, any thumbnail that isn't on disk
+    # is created when it's first requested.
+    renderer = (
+        LazyThumbnailRenderer(root, max_size=THUMBNAIL_SIZE, max_workers=render_workers)
+        if lazy_thumbnails
+        else None
+    )
+    app.extensions["docstore_renderer"] = renderer
+
+    page_cache = PageCache(max_entries=page_cache_entries, max_bytes=page_cache_bytes)
+    app.extensions["docstore_page_cache"] = page_cache
 
     app.jinja_env.trim_blocks = True
     app.jinja_env.lstrip_blocks = True
@@ -81,18 +244,18 @@ def create_app(title: str, root: pathlib.Path, thumbnail_width: int) -> Flask:
 
     app.jinja_env.filters["tags_with_prefix"] = tags_with_prefix
     app.jinja_env.filters["tags_without_prefix"] = tags_without_prefix
+    app.jinja_env.filters["thumbnail_sources"] = lambda t, **kwargs: thumbnail_sources(
+        t, lazy=lazy_thumbnails, **kwargs
+    )
+    app.jinja_env.filters["content_version"] = content_version
+    app.jinja_env.filters["thumbnail_version"] = functools.partial(
+        thumbnail_version, root
+    )
 
     @app.route("/")
-    def list_documents() -> str:
-        request_tags = set(request.args.getlist("tag"))
-        documents = [
-            doc for doc in read_documents(root) if request_tags.issubset(set(doc.tags))
-        ]
-
-        tag_tally: dict[str, int] = collections.Counter()
-        for doc in documents:
-            for t in doc.tags:
-                tag_tally[t] += 1
+    def list_documents() -> FlaskResponse:
+        index = read_index(root)
+        query_string = tuple(parse_qsl(urlparse(request.url).query))
 
         try:
             page = int(request.args["page"])
@@ -101,13 +264,58 @@ def create_app(title: str, root: pathlib.Path, thumbnail_width: int) -> Flask:
 
         sort_by = request.args.get("sortBy", "date (newest first)")
 
-        if sort_by.startswith("date"):
-            sort_key = lambda d: d.date_saved  # noqa
-        elif sort_by.startswith("title"):
-            sort_key = lambda d: d.title.lower()  # noqa
+        # The random order depends on the seed, which changes every time
+        # somebody loads the first page.  Nobody can ask for that page
+        # again, so we don't cache it -- it would only push out pages
+        # that might be reused.
+        is_new_random_order = sort_by == "random" and page == 1
+
+        if is_new_random_order:
+            app.config["_RANDOM_SEED"] = secrets.token_bytes()
+
+        # The page includes the full URL (not just the query string),
+        # so that's part of the cache key.
+        cache_key = (
+            request.url,
+            app.config.get("_RANDOM_SEED") if sort_by == "random" else None,
+        )
+
+        if index.version is None or is_new_random_order:
+            etag = None
+        else:
+            # The page only changes when the documents change, or when
+            # the cached page expires (because of relative dates like
+            # "5 minutes ago"), so if the client has the current version
+            # we can skip rendering it.
+            page_version = (index.version, page_cache.time_bucket(), cache_key)
+            etag = hashlib.sha256(repr(page_version).encode("utf8")).hexdigest()[:32]
+
+            if _is_not_modified(etag):
+                return _not_modified_response(etag=etag)
+
+            cached_html = page_cache.get(index.version, cache_key)
+
+            if cached_html is not None:
+                return _set_cache_headers(make_response(cached_html), etag=etag)
+
+        request_tags = set(request.args.getlist("tag"))
+        documents = index.documents_with_tags(request_tags)
+
+        tag_tally: dict[str, int] = collections.Counter()
+        for doc in documents:
+            for t in doc.tags:
+                tag_tally[t] += 1
+
+        # We only need the documents up to the end of this page, so we
+        # use the precomputed sort orders or pick the top k, rather than
+        # sorting every matching document.
+        page_end = max(page, 0) * PAGE_SIZE
+
+        if sort_by in SORT_ORDERS:
+            top_documents = index.top_documents(
+                documents, sort_by=sort_by, count=page_end
+            )
         elif sort_by == "random":
-            if page == 1:
-                app.config["_RANDOM_SEED"] = secrets.token_bytes()
             seed = app.config["_RANDOM_SEED"]
 
             def sort_key(d: Document) -> str:
@@ -115,19 +323,18 @@ def create_app(title: str, root: pathlib.Path, thumbnail_width: int) -> Flask:
                 h.update(d.id.encode("utf8"))
                 h.update(seed)
                 return h.hexdigest()
-        else:
-            raise ValueError(f"Unrecognised sortBy query parameter: {sort_by}")
 
-        if sort_by in {"date (newest first)", "title (Z to A)"}:
-            sort_reverse = True
+            top_documents = heapq.nsmallest(page_end, documents, key=sort_key)
         else:
-            sort_reverse = False
+            raise ValueError(f"Unrecognised sortBy query parameter: {sort_by}")
 
         html = render_template(
             "index.html",
-            documents=sorted(documents, key=sort_key, reverse=sort_reverse),
+            documents=top_documents[max(page_end - PAGE_SIZE, 0) :],
+            document_count=len(documents),
+            page_size=PAGE_SIZE,
             request_tags=request_tags,
-            query_string=tuple(parse_qsl(urlparse(request.url).query)),
+            query_string=query_string,
             tag_tally=tag_tally,
             title=title,
             page=page,
@@ -135,13 +342,49 @@ def create_app(title: str, root: pathlib.Path, thumbnail_width: int) -> Flask:
             TagCloud=TagCloud,
         )
 
-        return html
+        if index.version is None or etag is None:
+            return make_response(html)
+
+        page_cache.put(index.version, cache_key, html)
+
+        return _set_cache_headers(make_response(html), etag=etag)
 
     @app.route("/thumbnails/<shard>/<filename>")
     def thumbnails(shard: str, filename: str) -> FlaskResponse:
-        return send_from_directory(
-            os.path.abspath(os.path.join(root, "thumbnails", shard)), filename
-        )
+        thumbnails_dir = os.path.abspath(os.path.join(root, "thumbnails", shard))
+        path = f"thumbnails/{shard}/{filename}"
+
+        index = read_index(root)
+
+        if renderer is not None and not os.path.exists(
+            os.path.join(thumbnails_dir, filename)
+        ):
+            try:
+                renderer.render(index, path)
+            except Exception as err:  # noqa: BLE001
+                # If we can't create it, the request gets a 404 below
+                print(f"Unable to create thumbnail {path}: {err}", file=sys.stderr)
+
+        # The version in the URL is the version of the thumbnail, which
+        # is shared by its variants.
+        f = find_thumbnail_file(index, path)
+        version = None if f is None else thumbnail_version(root, f.thumbnail)
+        immutable = version is not None and request.args.get("v") == version
+
+        try:
+            mtime_ns = os.stat(os.path.join(thumbnails_dir, filename)).st_mtime_ns
+        except (FileNotFoundError, NotADirectoryError):
+            abort(404)
+
+        etag = hashlib.sha256(f"{path}:{mtime_ns}".encode()).hexdigest()[:32]
+        last_modified = datetime.datetime.fromtimestamp(mtime_ns / 1e9, tz=datetime.UTC)
+
+        if _is_not_modified(etag, last_modified=last_modified):
+            return _not_modified_response(etag=etag, immutable=immutable)
+
+        response = send_from_directory(thumbnails_dir, filename, etag=etag)
+
+        return _set_cache_headers(response, etag=etag, immutable=immutable)
 
     app.add_url_rule(
         rule="/files/<shard>/<filename>",
@@ -0,0 +1,393 @@
+"""
+An optional SQLite backend for storing the documents.
+
+The JSON database has to be parsed and rewritten in full, but SQLite lets
+us insert, update or delete a single document without touching the rest
+of the collection.
+
+Changes are described with the same operations as the JSON journal
+(see ``docstore.journal``), so both backends support the same set of
+changes to the documents.
+"""
+
+import contextlib
+import datetime
+import os
+import pathlib
+import sqlite3
+import threading
+import typing
+from collections.abc import Iterator
+
+from docstore.journal import Operation
+from docstore.models import (
+    Dimensions,
+    Document,
+    File,
+    Thumbnail,
+    ThumbnailVariant,
+    structure_document,
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    date_saved TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS files (
+    id TEXT PRIMARY KEY,
+    document_id TEXT NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    filename TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    checksum TEXT NOT NULL,
+    source_url TEXT,
+    date_saved TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS thumbnails (
+    file_id TEXT PRIMARY KEY REFERENCES files(id) ON DELETE CASCADE,
+    path TEXT NOT NULL,
+    width INTEGER NOT NULL,
+    height INTEGER NOT NULL,
+    tint_color TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS thumbnail_variants (
+    file_id TEXT NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    format TEXT NOT NULL,
+    width INTEGER NOT NULL,
+    height INTEGER NOT NULL,
+    PRIMARY KEY (file_id, position)
+);
+
+CREATE TABLE IF NOT EXISTS tags (
+    document_id TEXT NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    tag TEXT NOT NULL,
+    PRIMARY KEY (document_id, position)
+);
+
+CREATE INDEX IF NOT EXISTS files_document_id ON files(document_id);
+CREATE INDEX IF NOT EXISTS files_checksum ON files(checksum);
+"""
+
+
+def sqlite_path(root: pathlib.Path) -> pathlib.Path:
+    """
+    Returns the path to the SQLite database.
+    """
+    return root / "documents.sqlite"
+
+
+@contextlib.contextmanager
+def connect(path: pathlib.Path) -> Iterator[sqlite3.Connection]:
+    """
+    Opens a connection to the database, and commits any changes when
+    the block exits.
+
+    The tables must already exist; see ``create_schema``.
+    """
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA foreign_keys = ON")
+
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def create_schema(path: pathlib.Path) -> None:
+    """
+    Create any tables and indexes that are missing from the database.
+
+    This runs when a database is created or migrated, not every time
+    we connect to it.
+    """
+    with connect(path) as conn:
+        conn.executescript(SCHEMA)
+
+
+# Path -> (inode, connection) of a long-lived connection for reading
+# ``PRAGMA data_version``.  The data version is only meaningful within
+# a single connection, so we keep reusing the same one.
+_version_connections: dict[pathlib.Path, tuple[int, sqlite3.Connection]] = {}
+_version_lock = threading.Lock()
+
+
+def data_version(path: pathlib.Path) -> int:
+    """
+    Returns a counter that changes every time the documents are modified
+    by another connection -- which includes all our writes, because they
+    use their own connections.
+
+    This is cheap enough to check on every request.  If the database is
+    replaced (e.g. by a backend migration), we open a new connection,
+    and the caller should also check the inode of the database.
+    """
+    cache_key = pathlib.Path(os.path.abspath(path))
+    inode = os.stat(path).st_ino
+
+    with _version_lock:
+        cached = _version_connections.get(cache_key)
+
+        if cached is None or cached[0] != inode:
+            if cached is not None:
+                cached[1].close()
+
+            conn = sqlite3.connect(path, check_same_thread=False)
+            _version_connections[cache_key] = (inode, conn)
+        else:
+            conn = cached[1]
+
+        return typing.cast(int, conn.execute("PRAGMA data_version").fetchone()[0])
+
+
+def _insert_document(conn: sqlite3.Connection, doc: Document) -> None:
+    conn.execute(
+        """
+        INSERT INTO documents (id, title, date_saved) VALUES (?, ?, ?)
+        ON CONFLICT(id) DO UPDATE SET
+            title = excluded.title, date_saved = excluded.date_saved
+        """,
+        (doc.id, doc.title, doc.date_saved.isoformat()),
+    )
+
+    # Replace the files and tags wholesale; a document only has a handful
+    # of each, so this is simpler than working out what changed.
+    conn.execute("DELETE FROM files WHERE document_id = ?", (doc.id,))
+    _insert_tags(conn, doc_id=doc.id, tags=doc.tags)
+
+    for position, f in enumerate(doc.files):
+        conn.execute(
+            """
+            INSERT INTO files (
+                id, document_id, position, filename, path,
+                size, checksum, source_url, date_saved
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                f.id,
+                doc.id,
+                position,
+                f.filename,
+                f.path,
+                f.size,
+                f.checksum,
+                f.source_url,
+                f.date_saved.isoformat(),
+            ),
+        )
+        conn.execute(
+            """
+            INSERT INTO thumbnails (file_id, path, width, height, tint_color)
+            VALUES (?, ?, ?, ?, ?)
+            """,
+            (
+                f.id,
+                f.thumbnail.path,
+                f.thumbnail.dimensions.width,
+                f.thumbnail.dimensions.height,
+                f.thumbnail.tint_color,
+            ),
+        )
+        conn.executemany(
+            """
+            INSERT INTO thumbnail_variants (
+                file_id, position, path, format, width, height
+            ) VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            [
+                (
+                    f.id,
+                    position,
+                    v.path,
+                    v.format,
+                    v.dimensions.width,
+                    v.dimensions.height,
+                )
+                for position, v in enumerate(f.thumbnail.variants)
+            ],
+        )
+
+
+def _insert_tags(conn: sqlite3.Connection, *, doc_id: str, tags: list[str]) -> None:
+    conn.execute("DELETE FROM tags WHERE document_id = ?", (doc_id,))
+    conn.executemany(
+        "INSERT INTO tags (document_id, position, tag) VALUES (?, ?, ?)",
+        [(doc_id, position, t) for position, t in enumerate(tags)],
+    )
+
+
+def read_documents(path: pathlib.Path) -> list[Document]:
+    """
+    Get a list of all the documents, in the order they were added.
+    """
+    with connect(path) as conn:
+        return _select_documents(conn)
+
+
+def read_document(path: pathlib.Path, doc_id: str) -> Document | None:
+    """
+    Get a single document by its ID, or None if there's no such document.
+    """
+    with connect(path) as conn:
+        documents = _select_documents(conn, doc_ids=[doc_id])
+
+    return documents[0] if documents else None
+
+
+def read_files_with_checksum(path: pathlib.Path, checksum: str) -> list[File]:
+    """
+    Get every file with this checksum, in the order they were added.
+    """
+    with connect(path) as conn:
+        doc_ids = [
+            doc_id
+            for (doc_id,) in conn.execute(
+                "SELECT DISTINCT document_id FROM files WHERE checksum = ?",
+                (checksum,),
+            )
+        ]
+        documents = _select_documents(conn, doc_ids=doc_ids)
+
+    return [f for doc in documents for f in doc.files if f.checksum == checksum]
+
+
+def _select_documents(
+    conn: sqlite3.Connection, *, doc_ids: list[str] | None = None
+) -> list[Document]:
+    """
+    Read documents from the database, in the order they were added.
+
+    If ``doc_ids`` is None, this reads every document; otherwise it only
+    reads the documents with these IDs.
+    """
+    if doc_ids is None:
+        params: tuple[str, ...] = ()
+        doc_filter = file_filter = variant_filter = tag_filter = ""
+    else:
+        params = tuple(doc_ids)
+        ids = "(" + ", ".join("?" for _ in doc_ids) + ")"
+        doc_filter = f"WHERE id IN {ids}"
+        file_filter = f"WHERE f.document_id IN {ids}"
+        variant_filter = (
+            f"WHERE file_id IN (SELECT id FROM files WHERE document_id IN {ids})"
+        )
+        tag_filter = f"WHERE document_id IN {ids}"
+
+    tags: dict[str, list[str]] = {}
+    for doc_id, tag in conn.execute(
+        f"""
+        SELECT document_id, tag FROM tags {tag_filter}
+        ORDER BY document_id, position
+        """,
+        params,
+    ):
+        tags.setdefault(doc_id, []).append(tag)
+
+    variants: dict[str, list[ThumbnailVariant]] = {}
+    for file_id, variant_path, image_format, width, height in conn.execute(
+        f"""
+        SELECT file_id, path, format, width, height FROM thumbnail_variants
+        {variant_filter}
+        ORDER BY file_id, position
+        """,
+        params,
+    ):
+        variants.setdefault(file_id, []).append(
+            ThumbnailVariant(
+                path=variant_path,
+                format=image_format,
+                dimensions=Dimensions(width=width, height=height),
+            )
+        )
+
+    files: dict[str, list[File]] = {}
+    for row in conn.execute(
+        f"""
+        SELECT
+            f.document_id, f.id, f.filename, f.path, f.size, f.checksum,
+            f.source_url, f.date_saved,
+            t.path, t.width, t.height, t.tint_color
+        FROM files f JOIN thumbnails t ON t.file_id = f.id
+        {file_filter}
+        ORDER BY f.document_id, f.position
+        """,
+        params,
+    ):
+        files.setdefault(row[0], []).append(
+            File(
+                id=row[1],
+                filename=row[2],
+                path=row[3],
+                size=row[4],
+                checksum=row[5],
+                source_url=row[6],
+                date_saved=datetime.datetime.fromisoformat(row[7]),
+                thumbnail=Thumbnail(
+                    path=row[8],
+                    dimensions=Dimensions(width=row[9], height=row[10]),
+                    tint_color=row[11],
+                    variants=variants.get(row[1], []),
+                ),
+            )
+        )
+
+    return [
+        Document(
+            id=doc_id,
+            title=title,
+            date_saved=datetime.datetime.fromisoformat(date_saved),
+            tags=tags.get(doc_id, []),
+            files=files.get(doc_id, []),
+        )
+        for doc_id, title, date_saved in conn.execute(
+            f"SELECT id, title, date_saved FROM documents {doc_filter} ORDER BY rowid",
+            params,
+        )
+    ]
+
+
+def write_documents(path: pathlib.Path, documents: list[Document]) -> None:
+    """
+    Replace all the documents in the database, creating it if necessary.
+    """
+    create_schema(path)
+
+    with connect(path) as conn:
+        conn.execute("DELETE FROM documents")
+
+        for doc in documents:
+            _insert_document(conn, doc)
+
+
+def apply_operations(path: pathlib.Path, operations: list[Operation]) -> None:
+    """
+    Apply a series of changes to the documents in a single transaction.
+    """
+    with connect(path) as conn:
+        for op in operations:
+            if op["op"] == "add":
+                _insert_document(conn, structure_document(op["document"]))
+            elif op["op"] == "merge":
+                conn.execute("DELETE FROM documents WHERE id = ?", (op["merged_id"],))
+                _insert_document(conn, structure_document(op["document"]))
+            elif op["op"] == "delete":
+                conn.execute("DELETE FROM documents WHERE id = ?", (op["doc_id"],))
+            elif op["op"] == "retag":
+                _insert_tags(conn, doc_id=op["doc_id"], tags=op["tags"])
+            elif op["op"] == "update":
+                doc = structure_document(op["document"])
+                if conn.execute(
+                    "SELECT 1 FROM documents WHERE id = ?", (doc.id,)
+                ).fetchone():
+                    _insert_document(conn, doc)
+            else:  # pragma: no cover
+                raise ValueError(f"Unrecognised operation: {op!r}")
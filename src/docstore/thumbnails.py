@@ -1,28 +1,48 @@
+import functools
+import mimetypes
 import os
 import shutil
 import subprocess
 import sys
 import tempfile
+import threading
+import time
+import typing
 
-from PIL import Image, UnidentifiedImageError
+import attr
+from PIL import Image, ImageOps, UnidentifiedImageError
 
 from docstore.models import Dimensions
+from docstore.mp4 import get_mp4_dimensions
 
+# Bump this whenever a change here would produce different thumbnails,
+# so we don't reuse thumbnails from the old code (see derivative_cache.py).
+THUMBNAIL_VERSION = 3
 
-def _is_animated_gif(path: str) -> bool:
-    """
-    Returns True if the file at ``path`` is an animated GIF.
-    """
-    try:
-        im = Image.open(path)
-    except UnidentifiedImageError:
-        # Not an image
-        return False
-    else:
-        return getattr(im, "is_animated", False)
+# The sizes of the smaller variants we create for each thumbnail.  The web
+# app shows thumbnails in a 100px or 200px box, so these cover both on
+# normal and high-density screens.
+VARIANT_SIZES = (100, 200, 400)
+
+# The formats we create variants in, best first, and the quality to use
+# for each.  Browsers that don't support any of them get the PNG thumbnail.
+VARIANT_FORMATS = {"avif": 60, "webp": 80}
 
 
-def _create_gif_thumbnail_from_ffmpeg(*, path: str, max_size: int, out_dir: str) -> str:
+class ThumbnailResult(typing.TypedDict):
+    path: str
+    dimensions: Dimensions
+
+
+class VariantResult(typing.TypedDict):
+    path: str
+    format: str
+    dimensions: Dimensions
+
+
+def _create_gif_thumbnail_from_ffmpeg(
+    *, path: str, max_size: int, out_dir: str
+) -> ThumbnailResult:
     im = Image.open(path)
 
     if im.width > im.height and im.width >= max_size:
@@ -51,10 +71,115 @@ def _create_gif_thumbnail_from_ffmpeg(*, path: str, max_size: int, out_dir: str)
         stdout=subprocess.DEVNULL,
     )
 
-    return out_path
+    # We chose the dimensions of the video, so we don't need to ask
+    # ffprobe what they are.
+    return {"path": out_path, "dimensions": Dimensions(width=width, height=height)}
+
+
+def _create_image_thumbnail(
+    *, path: str, max_size: int, out_dir: str
+) -> ThumbnailResult:
+    """
+    Create a thumbnail of an image in-process with Pillow.
+    """
+    with Image.open(path) as im:
+        # For JPEGs, this asks the decoder to scale the image down while
+        # it reads it, which is much faster than decoding every pixel of
+        # a large photo and then throwing most of them away.
+        im.draft("RGB", (max_size, max_size))
+
+        # Without in_place=True, this always returns a new image.
+        thumbnail = typing.cast(Image.Image, ImageOps.exif_transpose(im))
+
+    # Palette and bilevel images can only be resized with nearest-neighbour
+    # sampling, which looks awful, and PNG can't store some modes (e.g. CMYK).
+    if thumbnail.mode not in {"L", "LA", "RGB", "RGBA"}:
+        has_alpha = "A" in thumbnail.mode or "transparency" in thumbnail.info
+        thumbnail = thumbnail.convert("RGBA" if has_alpha else "RGB")
+
+    scale = min(max_size / thumbnail.width, max_size / thumbnail.height, 1)
+    size = (max(int(thumbnail.width * scale), 1), max(int(thumbnail.height * scale), 1))
+
+    if size != thumbnail.size:
+        # Shrink by an integer factor with reduce() first, then resample
+        # the (much smaller) result.  This is what reducing_gap does.
+        thumbnail = thumbnail.resize(
+            size, resample=Image.Resampling.LANCZOS, reducing_gap=3.0
+        )
+
+    out_path = os.path.join(out_dir, _png_name(path))
+    thumbnail.save(out_path)
+
+    return {
+        "path": out_path,
+        "dimensions": Dimensions(width=thumbnail.width, height=thumbnail.height),
+    }
+
+
+def _create_pdf_thumbnail_from_pdftoppm(
+    *, path: str, max_size: int, out_dir: str
+) -> ThumbnailResult:
+    """
+    Create a thumbnail of the first page of a PDF with pdftoppm (from Poppler).
+    """
+    out_path = os.path.join(out_dir, _png_name(path))
+
+    subprocess.check_call(
+        [
+            "pdftoppm",
+            "-f",
+            "1",
+            "-l",
+            "1",
+            "-singlefile",
+            "-png",
+            "-scale-to",
+            str(max_size),
+            path,
+            # pdftoppm adds the .png extension itself
+            out_path.removesuffix(".png"),
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        timeout=30,
+    )
+
+    return _png_result(out_path)
+
+
+def _create_video_thumbnail_from_ffmpeg(
+    *, path: str, max_size: int, out_dir: str
+) -> ThumbnailResult:
+    """
+    Create a thumbnail of a video by grabbing a single frame with ffmpeg.
+    """
+    out_path = os.path.join(out_dir, _png_name(path))
+
+    subprocess.check_call(
+        [
+            "ffmpeg",
+            "-loglevel",
+            "error",
+            "-i",
+            path,
+            # The thumbnail filter picks a representative frame from
+            # the first few seconds, rather than (say) a black title card.
+            "-vf",
+            f"thumbnail,scale={max_size}:{max_size}:force_original_aspect_ratio=decrease",
+            "-frames:v",
+            "1",
+            out_path,
+        ],
+        stdout=subprocess.DEVNULL,
+        timeout=30,
+    )
+
+    return _png_result(out_path)
 
 
-def _create_thumbnail_from_quick_look(*, path: str, max_size: int, out_dir: str) -> str:
+def _create_thumbnail_from_quick_look(
+    *, path: str, max_size: int, out_dir: str
+) -> ThumbnailResult:
     try:
         subprocess.check_call(
             ["qlmanage", "-t", path, "-s", f"{max_size}x{max_size}", "-o", out_dir],
@@ -71,37 +196,335 @@ def _create_thumbnail_from_quick_look(*, path: str, max_size: int, out_dir: str)
     try:
         result = os.path.join(out_dir, os.listdir(out_dir)[0])
     except IndexError:
-        print(f"Quick Look could not create a thumbnail for {path}", file=sys.stderr)
-        result = os.path.join(out_dir, "generic_document.png")
-        shutil.copyfile(
-            src=os.path.join(
-                os.path.dirname(os.path.abspath(__file__)),
-                "static/generic_document.png",
-            ),
-            dst=result,
-        )
+        raise ValueError("Quick Look did not create a thumbnail")
 
     if result.endswith(".png.png"):
         os.rename(result, result.replace(".png.png", ".png"))
         result = result.replace(".png.png", ".png")
 
-    return result
+    return _png_result(result)
+
 
+# A generic document icon, which we use for files we can't thumbnail
+# any other way, and as a placeholder for thumbnails we haven't created yet.
+GENERIC_THUMBNAIL_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "static/generic_document.png"
+)
 
-def create_thumbnail(path: str, *, max_size: int = 400) -> str:
+
+def _create_generic_thumbnail(
+    *, path: str, max_size: int, out_dir: str
+) -> ThumbnailResult:
     """
-    Creates a thumbnail of the file at ``path``.
+    Use a generic document icon, for files we can't thumbnail any other way.
+    """
+    result = os.path.join(out_dir, "generic_document.png")
+    shutil.copyfile(src=GENERIC_THUMBNAIL_PATH, dst=result)
+
+    return _png_result(result)
+
+
+def _png_result(path: str) -> ThumbnailResult:
+    # Pillow only reads the header of the PNG to get its size.
+    return {"path": path, "dimensions": get_dimensions(path)}
 
-    Returns the path to the new file.
+
+def _png_name(path: str) -> str:
     """
-    if _is_animated_gif(path):
-        return _create_gif_thumbnail_from_ffmpeg(
-            path=path, max_size=max_size, out_dir=tempfile.mkdtemp()
-        )
+    Returns the name of the PNG thumbnail for ``path``, e.g.
+    ``snakes.pdf`` becomes ``snakes.pdf.png`` and ``cluster.png``
+    stays as ``cluster.png``.
+    """
+    name = os.path.basename(path)
+
+    if name.lower().endswith(".png"):
+        return name
     else:
-        return _create_thumbnail_from_quick_look(
-            path=path, max_size=max_size, out_dir=tempfile.mkdtemp()
+        return name + ".png"
+
+
+FileType: typing.TypeAlias = typing.Literal[
+    "animated_gif", "image", "pdf", "video", "other"
+]
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class Thumbnailer:
+    """
+    A way to create thumbnails.
+
+    If ``executable`` is set, we skip this thumbnailer when it isn't
+    installed, rather than trying (and failing) to run it for every file.
+    """
+
+    name: str
+    create: typing.Callable[..., ThumbnailResult]
+    executable: str | None = None
+
+
+ANIMATED_GIF_FFMPEG = Thumbnailer(
+    name="ffmpeg (animated GIF)",
+    create=_create_gif_thumbnail_from_ffmpeg,
+    executable="ffmpeg",
+)
+PILLOW = Thumbnailer(name="Pillow", create=_create_image_thumbnail)
+PDFTOPPM = Thumbnailer(
+    name="pdftoppm", create=_create_pdf_thumbnail_from_pdftoppm, executable="pdftoppm"
+)
+VIDEO_FFMPEG = Thumbnailer(
+    name="ffmpeg (video)",
+    create=_create_video_thumbnail_from_ffmpeg,
+    executable="ffmpeg",
+)
+QUICK_LOOK = Thumbnailer(
+    name="Quick Look",
+    create=_create_thumbnail_from_quick_look,
+    executable="qlmanage",
+)
+GENERIC = Thumbnailer(name="generic icon", create=_create_generic_thumbnail)
+
+
+# The thumbnailers to try for each type of file, in order.  The first one
+# that succeeds wins, and the generic icon always succeeds.
+#
+# Quick Look can thumbnail almost anything, but it only exists on macOS
+# and it's much slower than the others, so we only use it as a fallback.
+THUMBNAILERS: dict[FileType, list[Thumbnailer]] = {
+    "animated_gif": [ANIMATED_GIF_FFMPEG, PILLOW, GENERIC],
+    "image": [PILLOW, QUICK_LOOK, GENERIC],
+    "pdf": [PDFTOPPM, QUICK_LOOK, GENERIC],
+    "video": [VIDEO_FFMPEG, QUICK_LOOK, GENERIC],
+    "other": [QUICK_LOOK, GENERIC],
+}
+
+
+def get_file_type(path: str) -> FileType:
+    """
+    Decide which thumbnailers to use for the file at ``path``.
+    """
+    mimetype, _ = mimetypes.guess_type(path)
+
+    if mimetype == "application/pdf":
+        return "pdf"
+
+    if mimetype is not None and mimetype.startswith("video/"):
+        return "video"
+
+    try:
+        with Image.open(path) as im:
+            if getattr(im, "is_animated", False) and im.format == "GIF":
+                return "animated_gif"
+            else:
+                return "image"
+    except (UnidentifiedImageError, OSError):
+        # Not an image, or not one Pillow can read
+        return "other"
+
+
+@functools.cache
+def _is_installed(executable: str) -> bool:
+    return shutil.which(executable) is not None
+
+
+class ThumbnailerTimings(typing.TypedDict):
+    calls: int
+    failures: int
+    total_time: float
+
+
+_timings: dict[str, ThumbnailerTimings] = {}
+_timings_lock = threading.Lock()
+
+
+def _record_timing(name: str, *, elapsed: float, failed: bool) -> None:
+    with _timings_lock:
+        timings = _timings.setdefault(
+            name, {"calls": 0, "failures": 0, "total_time": 0.0}
         )
+        timings["calls"] += 1
+        timings["failures"] += int(failed)
+        timings["total_time"] += elapsed
+
+
+def get_thumbnailer_timings() -> dict[str, ThumbnailerTimings]:
+    """
+    Returns how many times each thumbnailer has run in this process,
+    how many of those runs failed, and the total time they took.
+    """
+    with _timings_lock:
+        return {name: ThumbnailerTimings(**t) for name, t in _timings.items()}
+
+
+def reset_thumbnailer_timings() -> None:
+    with _timings_lock:
+        _timings.clear()
+
+
+def create_thumbnail(path: str, *, max_size: int = 400) -> ThumbnailResult:
+    """
+    Creates a thumbnail of the file at ``path``.
+
+    Returns the path to the new file, and its dimensions.  The file is in
+    a temporary directory of its own, which the caller should delete.
+    """
+    for thumbnailer in THUMBNAILERS[get_file_type(path)]:
+        if thumbnailer.executable is not None and not _is_installed(
+            thumbnailer.executable
+        ):
+            continue
+
+        start = time.perf_counter()
+
+        # On success, the caller deletes this directory once it's moved
+        # the thumbnail out; on failure, we delete it here.
+        out_dir = tempfile.mkdtemp()
+
+        try:
+            result = thumbnailer.create(path=path, max_size=max_size, out_dir=out_dir)
+        except Exception as err:  # noqa: BLE001
+            shutil.rmtree(out_dir)
+
+            # Any failure means we try the next thumbnailer
+            _record_timing(
+                thumbnailer.name, elapsed=time.perf_counter() - start, failed=True
+            )
+            print(
+                f"{thumbnailer.name} could not create a thumbnail for {path}: {err}",
+                file=sys.stderr,
+            )
+        except BaseException:
+            shutil.rmtree(out_dir)
+            raise
+        else:
+            _record_timing(
+                thumbnailer.name, elapsed=time.perf_counter() - start, failed=False
+            )
+            return result
+
+    raise ValueError(f"Unable to create a thumbnail for {path}")
+
+
+def _can_save(image_format: str) -> bool:
+    """
+    Returns True if Pillow can save images in this format.  e.g. AVIF
+    needs a newer Pillow, or the pillow-avif-plugin package.
+    """
+    Image.init()
+    return image_format.upper() in Image.SAVE
+
+
+def variant_formats() -> list[str]:
+    """
+    Returns the formats we can create variants in, best first.
+    """
+    return [f for f in VARIANT_FORMATS if _can_save(f)]
+
+
+def variant_suffix(*, width: int, image_format: str) -> str:
+    """
+    Returns the end of the filename for a thumbnail variant, e.g. ``_200w.webp``.
+    """
+    return f"_{width}w.{image_format}"
+
+
+def variant_dimensions(dimensions: Dimensions, size: int) -> Dimensions:
+    """
+    Returns the dimensions of a variant that fits in a ``size`` square,
+    for a thumbnail with the given dimensions.  We never scale a
+    thumbnail up.
+    """
+    scale = min(size / dimensions.width, size / dimensions.height, 1)
+
+    return Dimensions(
+        width=max(int(dimensions.width * scale), 1),
+        height=max(int(dimensions.height * scale), 1),
+    )
+
+
+def create_thumbnail_variants(
+    thumbnail_path: str,
+    *,
+    sizes: typing.Iterable[int] = VARIANT_SIZES,
+    formats: typing.Iterable[str] | None = None,
+) -> list[VariantResult]:
+    """
+    Creates smaller copies of a thumbnail in modern image formats, so
+    browsers can download the smallest image that will look sharp.
+
+    Each variant fits in a square of one of the ``sizes``, and is created
+    in each of the ``formats`` (by default, every format Pillow supports).
+    Video thumbnails don't get any variants.
+
+    The variants are all saved in one temporary directory, which the
+    caller should delete.
+    """
+    if not thumbnail_path.endswith(".png"):
+        return []
+
+    start = time.perf_counter()
+
+    name = os.path.splitext(os.path.basename(thumbnail_path))[0]
+
+    formats = variant_formats() if formats is None else list(formats)
+
+    variants: list[VariantResult] = []
+
+    out_dir = tempfile.mkdtemp()
+
+    try:
+        with Image.open(thumbnail_path) as im:
+            im.load()
+
+            if im.mode not in {"RGB", "RGBA"}:
+                has_alpha = "A" in im.mode or "transparency" in im.info
+                im = im.convert("RGBA" if has_alpha else "RGB")
+
+            created_sizes = set()
+
+            for size in sorted(sizes):
+                dimensions = variant_dimensions(Dimensions(im.width, im.height), size)
+
+                # e.g. if the thumbnail is only 150px wide, the 200px and 400px
+                # variants would be the same image.
+                if (dimensions.width, dimensions.height) in created_sizes:
+                    continue
+
+                created_sizes.add((dimensions.width, dimensions.height))
+
+                resized = im.resize(
+                    (dimensions.width, dimensions.height),
+                    resample=Image.Resampling.LANCZOS,
+                    reducing_gap=3.0,
+                )
+
+                for image_format in formats:
+                    suffix = variant_suffix(
+                        width=dimensions.width, image_format=image_format
+                    )
+                    out_path = os.path.join(out_dir, name + suffix)
+                    resized.save(
+                        out_path,
+                        format=image_format.upper(),
+                        quality=VARIANT_FORMATS[image_format],
+                    )
+
+                    variants.append(
+                        {
+                            "path": out_path,
+                            "format": image_format,
+                            "dimensions": dimensions,
+                        }
+                    )
+    except BaseException:
+        shutil.rmtree(out_dir)
+        raise
+
+    if not variants:
+        shutil.rmtree(out_dir)
+
+    _record_timing("variants", elapsed=time.perf_counter() - start, failed=False)
+
+    return variants
 
 
 def get_dimensions(path: str) -> Dimensions:
@@ -109,10 +532,16 @@ def get_dimensions(path: str) -> Dimensions:
     Returns the (width, height) of a given path.
     """
     if path.endswith(".png"):  # image thumbnail
-        im = Image.open(path)
-        return Dimensions(width=im.width, height=im.height)
+        with Image.open(path) as im:
+            return Dimensions(width=im.width, height=im.height)
 
     elif path.endswith(".mp4"):  # video thumbnail
+        try:
+            return get_mp4_dimensions(path)
+        except ValueError:
+            pass
+
+        # If we can't read the header ourselves, ask ffprobe.
         # See https://stackoverflow.com/a/29585066/1558022
         output = subprocess.check_output(
             [
@@ -1,13 +1,44 @@
-import colorsys
 import subprocess
 import typing
 
-import wcag_contrast_ratio as contrast
+import numpy as np
+from PIL import Image
 
 
 Color: typing.TypeAlias = tuple[float, float, float]
 
 
+# Bump this whenever a change here would choose different tint colours,
+# so we don't reuse tint colours from the old code (see derivative_cache.py).
+TINT_COLOR_VERSION = 2
+
+
+def _relative_luminance(colors: np.ndarray) -> np.ndarray:
+    """
+    Returns the WCAG relative luminance of an (n, 3) array of RGB colours in [0,1].
+
+    See https://www.w3.org/TR/WCAG20/#relativeluminancedef
+    """
+    linear = np.where(
+        colors <= 0.03928, colors / 12.92, ((colors + 0.055) / 1.055) ** 2.4
+    )
+    return typing.cast(np.ndarray, linear @ np.array([0.2126, 0.7152, 0.0722]))
+
+
+def _contrast_ratios(colors: np.ndarray, background_color: Color) -> np.ndarray:
+    """
+    Returns the WCAG contrast ratio of each colour in an (n, 3) array
+    against the background.
+    """
+    luminance = _relative_luminance(colors)
+    background_luminance = _relative_luminance(np.array([background_color]))
+
+    lighter = np.maximum(luminance, background_luminance)
+    darker = np.minimum(luminance, background_luminance)
+
+    return typing.cast(np.ndarray, (lighter + 0.05) / (darker + 0.05))
+
+
 def choose_tint_color_from_dominant_colors(
     dominant_colors: list[Color], background_color: Color
 ) -> Color:
@@ -17,12 +48,12 @@ def choose_tint_color_from_dominant_colors(
 
     Both ``dominant_colors`` and ``background_color`` should be tuples in [0,1].
     """
+    candidates = np.array(dominant_colors, dtype=float).reshape(-1, 3)
+
     # The minimum contrast ratio for text and background to meet WCAG AA
     # is 4.5:1, so discard any dominant colours with a lower contrast.
-    sufficient_contrast_colors: list[Color] = [
-        typing.cast(Color, tuple(col))
-        for col in dominant_colors
-        if contrast.rgb(col, background_color) >= 4.5
+    sufficient_contrast_colors = candidates[
+        _contrast_ratios(candidates, background_color) >= 4.5
     ]
 
     # If none of the dominant colours meet WCAG AA with the background,
@@ -33,20 +64,20 @@ def choose_tint_color_from_dominant_colors(
     # Note: you could modify the dominant colours until one of them
     # has sufficient contrast, but that's omitted here because it adds
     # a lot of complexity for a relatively unusual case.
-    if not sufficient_contrast_colors:
+    if len(sufficient_contrast_colors) == 0:
         return choose_tint_color_from_dominant_colors(
             dominant_colors=dominant_colors + [(0, 0, 0), (1, 1, 1)],
             background_color=background_color,
         )
 
     # Of the colors with sufficient contrast, pick the one with the
-    # highest saturation.  This is meant to optimise for colors that are
+    # highest value in HSV space, which is the largest of its RGB
+    # components.  This is meant to optimise for colors that are
     # more colourful/interesting than simple greys and browns.
-    hsv_candidates: dict[Color, Color] = {
-        rgb_col: colorsys.rgb_to_hsv(*rgb_col) for rgb_col in sufficient_contrast_colors
-    }
+    best = sufficient_contrast_colors[sufficient_contrast_colors.max(axis=1).argmax()]
 
-    return max(hsv_candidates, key=lambda rgb_col: hsv_candidates[rgb_col][2])
+    r, g, b = (float(c) for c in best)
+    return (r, g, b)
 
 
 def from_hex(hs: str | bytes) -> Color:
@@ -56,22 +87,145 @@ def from_hex(hs: str | bytes) -> Color:
     return int(hs[1:3], 16), int(hs[3:5], 16), int(hs[5:7], 16)
 
 
-def choose_tint_color_for_file(path: str) -> Color:
+def _dominant_colors_from_subprocess(path: str, *, max_colors: int) -> list[Color]:
     """
-    Returns the tint colour for a file.
-    """
-    background_color = (1, 1, 1)
+    Returns the dominant colours of an image, as found by the external
+    ``dominant_colours`` tool.
 
-    cmd = ["dominant_colours", "--no-palette", "--max-colours=12", path]
+    We don't use this any more, but it's kept so we can compare it with
+    the in-process implementation (see benchmarks/tint_colors.py).
+    """
+    cmd = ["dominant_colours", "--no-palette", f"--max-colours={max_colors}", path]
 
     dominant_colors = [
         from_hex(line) for line in subprocess.check_output(cmd).splitlines()
     ]
 
-    colors = [(r / 255, g / 255, b / 255) for r, g, b in dominant_colors]
+    return [(r / 255, g / 255, b / 255) for r, g, b in dominant_colors]
+
+
+def _load_pixels(path: str, *, max_size: int) -> np.ndarray:
+    """
+    Returns the pixels of a downsampled copy of an image, as an (n, 3)
+    array of RGB values in [0,1].
+    """
+    with Image.open(path) as im:
+        im.draft("RGB", (max_size, max_size))
+
+        # Use nearest-neighbour sampling, so we only get colours that
+        # are really in the image.  Smoother filters blend the edges of
+        # shapes with their (often transparent black) background, and
+        # invent colours that k-means can pick up.
+        im.thumbnail((max_size, max_size), resample=Image.Resampling.NEAREST)
+
+        rgba = np.asarray(im.convert("RGBA"), dtype=float).reshape(-1, 4) / 255
+
+    # Skip fully transparent pixels, which don't contribute to the colour
+    # of the image, unless that's all there is.
+    visible = rgba[rgba[:, 3] > 0]
+    if len(visible) > 0:
+        rgba = visible
+
+    return rgba[:, :3]
+
+
+def _squared_distances(pixels: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """
+    Returns an (n, k) array with the squared distance from every pixel
+    to every centroid.
+
+    This uses |p - c|^2 = |p|^2 - 2 p.c + |c|^2, which turns most of
+    the work into a single matrix multiplication.
+    """
+    distances = (
+        (pixels**2).sum(axis=1)[:, None]
+        - 2 * pixels @ centroids.T
+        + (centroids**2).sum(axis=1)[None, :]
+    )
+
+    # Rounding errors can make the distance between a pixel and itself
+    # slightly negative.
+    return typing.cast(np.ndarray, np.maximum(distances, 0))
+
+
+def _kmeans(pixels: np.ndarray, *, k: int, max_iterations: int = 20) -> np.ndarray:
+    """
+    Cluster the pixels with k-means, and return the centre of each cluster.
+    """
+    # If there are only a few distinct colours, those are the clusters.
+    # Packing each colour into a single integer makes this much faster
+    # than np.unique(pixels, axis=0).
+    packed = (pixels * 255).round().astype(np.uint32) @ np.array([1 << 16, 1 << 8, 1])
+    unique_colors, first_index = np.unique(packed, return_index=True)
+    if len(unique_colors) <= k:
+        return pixels[first_index]
+
+    # Choose the initial centres with k-means++, so they're spread out
+    # across the image.  Use a fixed seed so an image always gets the
+    # same tint colour.
+    rng = np.random.default_rng(seed=0)
+
+    centroids = np.empty((k, 3))
+    centroids[0] = pixels[rng.integers(len(pixels))]
+    nearest = _squared_distances(pixels, centroids[:1])[:, 0]
+
+    for i in range(1, k):
+        centroids[i] = pixels[rng.choice(len(pixels), p=nearest / nearest.sum())]
+        nearest = np.minimum(
+            nearest, _squared_distances(pixels, centroids[i : i + 1])[:, 0]
+        )
+
+    labels = np.full(len(pixels), -1)
+
+    for _ in range(max_iterations):
+        # |p|^2 is the same for every centroid, so we can skip it when
+        # we're only looking for the nearest one.
+        new_labels = ((centroids**2).sum(axis=1) - 2 * pixels @ centroids.T).argmin(
+            axis=1
+        )
+
+        if np.array_equal(new_labels, labels):
+            break
+
+        labels = new_labels
+
+        counts = np.bincount(labels, minlength=k)
+        sums = np.stack(
+            [np.bincount(labels, weights=pixels[:, i], minlength=k) for i in range(3)],
+            axis=1,
+        )
+
+        # If a cluster is empty, leave its centre where it is.
+        non_empty = counts > 0
+        centroids[non_empty] = sums[non_empty] / counts[non_empty, None]
+
+    return centroids[np.bincount(labels, minlength=k) > 0]
+
+
+def get_dominant_colors(
+    path: str, *, max_colors: int = 12, max_size: int = 200
+) -> list[Color]:
+    """
+    Returns the dominant colours of an image.
+
+    The image is downsampled to fit in a ``max_size`` square first --
+    that's plenty of pixels to find the dominant colours, and it keeps
+    the clustering fast.
+    """
+    centroids = _kmeans(_load_pixels(path, max_size=max_size), k=max_colors)
+
+    return [(float(r), float(g), float(b)) for r, g, b in centroids]
+
+
+def choose_tint_color_for_file(path: str) -> Color:
+    """
+    Returns the tint colour for a file.
+    """
+    background_color = (1, 1, 1)
 
     return choose_tint_color_from_dominant_colors(
-        dominant_colors=colors, background_color=background_color
+        dominant_colors=get_dominant_colors(path, max_colors=12),
+        background_color=background_color,
     )
 
 
@@ -0,0 +1,179 @@
+"""
+Reload the documents in the background whenever they change.
+
+Without this, the first request after a ``docstore add`` has to re-read
+the database and rebuild the indexes before it can respond.  The watcher
+notices the change and does that work straight away, so requests to the
+web app find the cache already warm.
+
+On Linux, the watcher uses inotify to hear about changes as soon as they
+happen.  Elsewhere (or if inotify isn't available), it falls back to
+checking the database every few seconds.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import pathlib
+import select
+import struct
+import sys
+import threading
+import time
+import typing
+from collections.abc import Callable
+
+from docstore.documents import read_latest_index
+from docstore.indexes import DocumentIndex
+
+# The files that make up the database, for either backend.
+WATCHED_NAMES = {"documents.json", "documents.journal", "documents.sqlite"}
+
+# Constants from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+
+_INOTIFY_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+# struct inotify_event { int wd; uint32_t mask, cookie, len; char name[]; }
+_INOTIFY_EVENT = struct.Struct("iIII")
+
+
+ReloadCallback: typing.TypeAlias = Callable[[DocumentIndex, float], None]
+
+
+def log_reload(index: DocumentIndex, elapsed: float) -> None:
+    """
+    The default callback: print how long the reload took.
+    """
+    print(
+        f"Reloaded {len(index.documents)} documents in {elapsed:.3f}s",
+        file=sys.stderr,
+    )
+
+
+class _Inotify:
+    """
+    A minimal wrapper around the inotify API, watching a single directory.
+    """
+
+    def __init__(self, path: pathlib.Path) -> None:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+
+        self.fd = libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        if libc.inotify_add_watch(self.fd, os.fsencode(path), _INOTIFY_MASK) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"Unable to watch {path}")
+
+    def wait(self, timeout: float) -> set[str]:
+        """
+        Wait up to ``timeout`` seconds for some events, and return the
+        names of the files that changed.
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+
+        data = os.read(self.fd, 64 * 1024)
+        names = set()
+        offset = 0
+
+        while offset < len(data):
+            _, _, _, name_len = _INOTIFY_EVENT.unpack_from(data, offset)
+            offset += _INOTIFY_EVENT.size
+            names.add(os.fsdecode(data[offset : offset + name_len].rstrip(b"\0")))
+            offset += name_len
+
+        return names
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class DocumentWatcher(threading.Thread):
+    """
+    A background thread that reloads and re-indexes the documents in
+    ``root`` whenever they change.
+
+    Every time it loads a new version of the documents, it calls
+    ``on_reload`` with the new index and how long the reload took.
+    """
+
+    def __init__(
+        self,
+        root: pathlib.Path,
+        *,
+        on_reload: ReloadCallback = log_reload,
+        poll_interval: float = 5,
+        use_inotify: bool = True,
+    ) -> None:
+        super().__init__(name=f"docstore-watcher-{root}", daemon=True)
+        self.root = root
+        self.on_reload = on_reload
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+        self._stopped = threading.Event()
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def run(self) -> None:
+        inotify: _Inotify | None = None
+
+        if self.use_inotify and sys.platform == "linux":
+            try:
+                inotify = _Inotify(self.root)
+            except (OSError, AttributeError) as err:
+                print(
+                    f"Unable to use inotify ({err}), polling for changes instead",
+                    file=sys.stderr,
+                )
+
+        try:
+            previous = self._reload_if_changed(None)
+
+            while not self._stopped.is_set():
+                # Even with inotify we check occasionally, in case we
+                # missed an event (e.g. if the root was replaced).
+                if inotify is not None:
+                    changed = inotify.wait(self.poll_interval)
+                    if changed and not (changed & WATCHED_NAMES):
+                        continue
+                else:
+                    self._stopped.wait(self.poll_interval)
+
+                if not self._stopped.is_set():
+                    previous = self._reload_if_changed(previous)
+        finally:
+            if inotify is not None:
+                inotify.close()
+
+    def _reload_if_changed(
+        self, previous: DocumentIndex | None
+    ) -> DocumentIndex | None:
+        start = time.perf_counter()
+
+        try:
+            index = read_latest_index(self.root)
+
+            if index is not previous:
+                # Build the lookup tables now, so the first request
+                # that needs them doesn't have to.
+                index.warm()
+        except Exception as err:  # noqa: BLE001
+            # e.g. a writer is halfway through replacing the database.
+            # We'll try again on the next change.
+            print(f"Unable to reload documents in {self.root}: {err}", file=sys.stderr)
+            return previous
+
+        if index is not previous:
+            self.on_reload(index, time.perf_counter() - start)
+
+        return index
@@ -0,0 +1,87 @@
+"""
+Create deferred thumbnails in the background.
+
+Files stored with ``--defer_thumbnails`` get a placeholder thumbnail and
+a job in the job queue (see job_queue.py).  The worker checks the queue
+every few seconds, and creates the real thumbnails.
+
+This runs as a thread in ``docstore serve``, or in the foreground with
+``docstore worker``.
+"""
+
+import pathlib
+import sys
+import threading
+import typing
+from collections.abc import Callable
+
+from docstore.documents import ThumbnailJobResults, process_thumbnail_jobs
+
+ResultsCallback: typing.TypeAlias = Callable[[ThumbnailJobResults], None]
+
+
+def log_results(results: ThumbnailJobResults) -> None:
+    """
+    The default callback: print what happened to each job.
+    """
+    for f in results["updated"]:
+        print(f"Created thumbnail for {f.path}", file=sys.stderr)
+
+    for job in results["retrying"]:
+        print(
+            f"Unable to create thumbnail for file {job['file_id']} "
+            f"(attempt {job['attempts']}, will retry): {job['last_error']}",
+            file=sys.stderr,
+        )
+
+    for job in results["failed"]:
+        print(
+            f"Unable to create thumbnail for file {job['file_id']} "
+            f"(giving up after {job['attempts']} attempts): {job['last_error']}",
+            file=sys.stderr,
+        )
+
+
+class ThumbnailWorker(threading.Thread):
+    """
+    A background thread that creates deferred thumbnails, checking for
+    new jobs every ``poll_interval`` seconds.
+
+    After every run that does some work, it calls ``on_results``.
+    """
+
+    def __init__(
+        self,
+        root: pathlib.Path,
+        *,
+        on_results: ResultsCallback = log_results,
+        poll_interval: float = 5,
+        jobs: int = 1,
+    ) -> None:
+        super().__init__(name=f"docstore-worker-{root}", daemon=True)
+        self.root = root
+        self.on_results = on_results
+        self.poll_interval = poll_interval
+        self.jobs = jobs
+        self._stopped = threading.Event()
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def run(self) -> None:
+        while not self._stopped.is_set():
+            self.run_once()
+            self._stopped.wait(self.poll_interval)
+
+    def run_once(self) -> ThumbnailJobResults | None:
+        try:
+            results = process_thumbnail_jobs(self.root, jobs=self.jobs)
+        except Exception as err:  # noqa: BLE001
+            # Keep the worker running; we'll try again on the next poll
+            print(f"Unable to process thumbnail jobs: {err}", file=sys.stderr)
+            return None
+
+        if any(results.values()):
+            self.on_results(results)
+
+        return results
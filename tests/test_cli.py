@@ -256,3 +256,105 @@ def test_deleting_in_empty_instance_is_error(root: pathlib.Path) -> None:
 
     assert result.exit_code == 1, result.output
     assert result.output.strip() == f"There is no docstore instance at {root}!"
+
+
+def test_migrating_backend_through_cli(root: pathlib.Path) -> None:
+    documents = [Document(title="My Document", tags=["tag1", "tag2"])]
+    write_documents(root=root, documents=documents)
+
+    runner = CliRunner()
+    result = runner.invoke(main, [f"--root={root}", "migrate-backend", "--to=sqlite"])
+    assert result.exit_code == 0, result.output
+
+    assert os.path.exists(root / "documents.sqlite")
+    assert read_documents(root) == documents
+
+
+def test_adds_many_documents(tmpdir: pathlib.Path, root: pathlib.Path) -> None:
+    os.makedirs(tmpdir / "to_add")
+    shutil.copyfile(src="tests/files/cluster.png", dst=tmpdir / "to_add/cluster.png")
+    shutil.copyfile(src="tests/files/snakes.pdf", dst=tmpdir / "to_add/snakes.pdf")
+
+    runner = CliRunner(mix_stderr=False)
+    result = runner.invoke(
+        main,
+        [f"--root={root}", "add-many", str(tmpdir / "to_add"), "--tags", "scans"],
+    )
+
+    assert result.exit_code == 0, result.stderr
+
+    documents = read_documents(root)
+    assert [doc.id for doc in documents] == result.stdout.strip().splitlines()
+    assert [doc.title for doc in documents] == ["cluster", "snakes"]
+    assert all(doc.tags == ["scans"] for doc in documents)
+
+    assert os.listdir(tmpdir / "to_add") == []
+
+
+def test_regenerates_thumbnails(tmpdir: pathlib.Path, root: pathlib.Path) -> None:
+    shutil.copyfile(src="tests/files/cluster.png", dst=tmpdir / "cluster.png")
+    doc = store_new_document(
+        root=root,
+        path=tmpdir / "cluster.png",
+        title="My document",
+        tags=[],
+        source_url=None,
+        date_saved=datetime.datetime.now(),
+    )
+
+    runner = CliRunner(mix_stderr=False)
+    result = runner.invoke(
+        main, [f"--root={root}", "regenerate-thumbnails", "--all", "--jobs=2"]
+    )
+
+    assert result.exit_code == 0, result.stderr
+    assert result.stdout == "Regenerated 1 thumbnails\n"
+
+    # The new thumbnail comes from the derivatives cache, and the old
+    # thumbnail is deleted.
+    (stored_doc,) = read_documents(root)
+    new_thumbnail = stored_doc.files[0].thumbnail
+    assert new_thumbnail.tint_color == doc.files[0].thumbnail.tint_color
+    assert len(new_thumbnail.variants) == len(doc.files[0].thumbnail.variants)
+    assert os.path.exists(root / new_thumbnail.path)
+    assert not os.path.exists(root / doc.files[0].thumbnail.path)
+
+
+def test_worker_creates_deferred_thumbnails(
+    tmpdir: pathlib.Path, root: pathlib.Path
+) -> None:
+    shutil.copyfile(src="tests/files/cluster.png", dst=tmpdir / "cluster.png")
+    write_documents(root=root, documents=[])
+
+    runner = CliRunner(mix_stderr=False)
+    result = runner.invoke(
+        main,
+        [
+            f"--root={root}",
+            "add",
+            str(tmpdir / "cluster.png"),
+            "--title=My document",
+            "--tags=",
+            "--defer_thumbnails",
+        ],
+    )
+    assert result.exit_code == 0, result.stderr
+
+    (doc,) = read_documents(root)
+    assert doc.files[0].thumbnail.tint_color == "#767676"
+
+    result = runner.invoke(main, [f"--root={root}", "worker", "--once"])
+    assert result.exit_code == 0, result.stderr
+
+    (doc,) = read_documents(root)
+    assert doc.files[0].thumbnail.tint_color == "#007f7f"
+
+
+def test_add_many_with_no_matching_files_is_error(
+    tmpdir: pathlib.Path, root: pathlib.Path
+) -> None:
+    runner = CliRunner()
+    result = runner.invoke(main, [f"--root={root}", "add-many", f"{tmpdir}/*.pdf"])
+
+    assert result.exit_code == 1
+    assert "Couldn't find any files" in result.output
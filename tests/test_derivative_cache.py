@@ -0,0 +1,114 @@
+import os
+import pathlib
+
+import pytest
+
+from docstore import derivative_cache
+from docstore.derivative_cache import get_derivatives, save_derivatives
+from docstore.models import Dimensions
+from docstore.thumbnails import THUMBNAIL_VERSION, VariantResult
+
+CHECKSUM = "sha256:683cbee0c2dda22b42fd92bda0f31e4b6b49cd8650a7924d72a14a30f11bfbe5"
+
+VARIANT: VariantResult = {
+    "path": "tests/files/cluster_segment.png",
+    "format": "webp",
+    "dimensions": Dimensions(100, 65),
+}
+
+
+def test_saves_and_retrieves_derivatives(root: pathlib.Path) -> None:
+    assert (
+        get_derivatives(root, checksum=CHECKSUM, extension=".png", max_size=400) is None
+    )
+
+    save_derivatives(
+        root,
+        checksum=CHECKSUM,
+        extension=".png",
+        max_size=400,
+        thumbnail_path="tests/files/cluster.png",
+        dimensions=Dimensions(400, 260),
+        tint_color="#007f7f",
+        variants=[VARIANT],
+    )
+
+    cached = get_derivatives(root, checksum=CHECKSUM, extension=".png", max_size=400)
+    assert cached is not None
+    assert cached["dimensions"] == Dimensions(400, 260)
+    assert cached["tint_color"] == "#007f7f"
+    assert (
+        pathlib.Path(cached["thumbnail_path"]).read_bytes()
+        == pathlib.Path("tests/files/cluster.png").read_bytes()
+    )
+
+    (variant,) = cached["variants"]
+    assert variant["format"] == "webp"
+    assert variant["dimensions"] == Dimensions(100, 65)
+    assert (
+        pathlib.Path(variant["path"]).read_bytes()
+        == pathlib.Path(VARIANT["path"]).read_bytes()
+    )
+
+
+def test_ignores_entries_with_missing_variants(root: pathlib.Path) -> None:
+    save_derivatives(
+        root,
+        checksum=CHECKSUM,
+        extension=".png",
+        max_size=400,
+        thumbnail_path="tests/files/cluster.png",
+        dimensions=Dimensions(400, 260),
+        tint_color="#007f7f",
+        variants=[VARIANT],
+    )
+
+    cached = get_derivatives(root, checksum=CHECKSUM, extension=".png", max_size=400)
+    assert cached is not None
+    os.unlink(cached["variants"][0]["path"])
+
+    assert (
+        get_derivatives(root, checksum=CHECKSUM, extension=".png", max_size=400) is None
+    )
+
+
+@pytest.mark.parametrize("extension, max_size", [(".pdf", 400), (".png", 200)])
+def test_entries_are_keyed_on_extension_and_size(
+    root: pathlib.Path, extension: str, max_size: int
+) -> None:
+    save_derivatives(
+        root,
+        checksum=CHECKSUM,
+        extension=".png",
+        max_size=400,
+        thumbnail_path="tests/files/cluster.png",
+        dimensions=Dimensions(400, 260),
+        tint_color="#007f7f",
+        variants=[],
+    )
+
+    assert (
+        get_derivatives(root, checksum=CHECKSUM, extension=extension, max_size=max_size)
+        is None
+    )
+
+
+def test_ignores_entries_from_old_thumbnail_code(
+    root: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    save_derivatives(
+        root,
+        checksum=CHECKSUM,
+        extension=".png",
+        max_size=400,
+        thumbnail_path="tests/files/cluster.png",
+        dimensions=Dimensions(400, 260),
+        tint_color="#007f7f",
+        variants=[],
+    )
+
+    monkeypatch.setattr(derivative_cache, "THUMBNAIL_VERSION", THUMBNAIL_VERSION + 1)
+
+    assert (
+        get_derivatives(root, checksum=CHECKSUM, extension=".png", max_size=400) is None
+    )
@@ -1,18 +1,36 @@
+import concurrent.futures
 import datetime
 import json
 import os
 import pathlib
+import random
 import shutil
-
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import typing
+
+import attr
+import pytest
+
+from docstore import documents as docstore_documents
+from docstore import job_queue
 from docstore.documents import (
+    PLACEHOLDER_TINT_COLOR,
+    DuplicateFileError,
     delete_document,
     pairwise_merge_documents,
+    process_thumbnail_jobs,
     read_documents,
+    regenerate_thumbnails,
     sha256,
     store_new_document,
     write_documents,
 )
-from docstore.models import Dimensions, Document, File, Thumbnail
+from docstore.models import Dimensions, Document, File, Thumbnail, ThumbnailVariant
+from docstore.thumbnails import ThumbnailResult, _png_name
 
 
 def test_sha256() -> None:
@@ -143,8 +161,18 @@ def test_store_new_document(tmpdir: pathlib.Path) -> None:
         path="thumbnails/m/my-cluster.png",
         dimensions=Dimensions(400, 260),
         tint_color="#007f7f",
+        variants=[
+            ThumbnailVariant(
+                path=f"thumbnails/m/my-cluster-{width}w.webp",
+                format="webp",
+                dimensions=Dimensions(width, height),
+            )
+            for width, height in [(100, 65), (200, 130), (400, 260)]
+        ],
     )
     assert os.path.exists(root / new_file.thumbnail.path)
+    for v in new_file.thumbnail.variants:
+        assert os.path.exists(root / v.path)
 
     assert read_documents(root) == [new_document]
 
@@ -169,7 +197,7 @@ def test_store_new_document(tmpdir: pathlib.Path) -> None:
     assert read_documents(root) == [new_document, new_document2]
 
     assert len(os.listdir(root / "files" / "m")) == 2
-    assert len(os.listdir(root / "thumbnails" / "m")) == 2
+    assert len(os.listdir(root / "thumbnails" / "m")) == 2 * (1 + 3)
 
 
 def test_deleting_document(tmpdir: pathlib.Path, root: pathlib.Path) -> None:
@@ -200,3 +228,756 @@ def test_deleting_document(tmpdir: pathlib.Path, root: pathlib.Path) -> None:
     assert json.load(open(deleted_json_path))["id"] == doc1.id
     assert not os.path.exists(root / "files" / "c" / "cluster.png")
     assert os.path.exists(root / "deleted" / doc1.id / "cluster.png")
+
+
+def test_caches_documents_for_each_root(
+    tmpdir: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    root1 = tmpdir / "root1"
+    root2 = tmpdir / "root2"
+
+    write_documents(root=root1, documents=[Document(title="Doc in root1")])
+    write_documents(root=root2, documents=[Document(title="Doc in root2")])
+
+    assert read_documents(root1)[0].title == "Doc in root1"
+    assert read_documents(root2)[0].title == "Doc in root2"
+
+    # Both roots are now cached, so going back and forth doesn't
+    # reload anything.
+    load_count = 0
+    original_load_documents = docstore_documents._load_documents
+
+    def counting_load_documents(*args: typing.Any, **kwargs: typing.Any) -> typing.Any:
+        nonlocal load_count
+        load_count += 1
+        return original_load_documents(*args, **kwargs)
+
+    monkeypatch.setattr(docstore_documents, "_load_documents", counting_load_documents)
+
+    for _ in range(3):
+        assert read_documents(root1)[0].title == "Doc in root1"
+        assert read_documents(root2)[0].title == "Doc in root2"
+
+    assert load_count == 0
+
+
+def test_only_one_thread_reloads_changed_documents(
+    root: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    old_documents = [Document(title="Old document")]
+    write_documents(root=root, documents=old_documents)
+    assert read_documents(root) == old_documents
+
+    new_documents = [Document(title="New document")]
+    write_documents(root=root, documents=new_documents)
+
+    load_count = 0
+    original_load_documents = docstore_documents._load_documents
+
+    def slow_load_documents(*args: typing.Any, **kwargs: typing.Any) -> typing.Any:
+        nonlocal load_count
+        load_count += 1
+        time.sleep(0.25)
+        return original_load_documents(*args, **kwargs)
+
+    monkeypatch.setattr(docstore_documents, "_load_documents", slow_load_documents)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
+        results = list(executor.map(lambda _: read_documents(root), range(10)))
+
+    # One thread reloads the documents; the others carry on serving
+    # the previous version in the meantime.
+    assert load_count == 1
+    assert all(r in (old_documents, new_documents) for r in results)
+    assert new_documents in results
+
+    assert read_documents(root) == new_documents
+
+
+WRITER_SCRIPT = """
+import pathlib
+import sys
+
+from docstore.documents import read_documents, retag_document, write_documents
+from docstore.models import Document
+
+root = pathlib.Path(sys.argv[1])
+
+while True:
+    documents = read_documents(root)[-200:]
+    new_documents = [Document(title="A document " * 1000) for _ in range(50)]
+    write_documents(root=root, documents=documents + new_documents)
+
+    for doc in new_documents[:5]:
+        retag_document(root, doc_id=doc.id, tags=["retagged"])
+"""
+
+
+def test_database_survives_the_writer_being_killed(
+    root: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    rand = random.Random(0)
+
+    for _ in range(20):
+        writer = subprocess.Popen([sys.executable, "-c", WRITER_SCRIPT, str(root)])
+        time.sleep(rand.uniform(0.1, 0.3))
+        writer.send_signal(signal.SIGKILL)
+        writer.wait()
+
+        # Read the documents from scratch, as a new process would.
+        monkeypatch.setattr(docstore_documents, "_cached_documents", {})
+
+        documents = read_documents(root)
+        assert all(doc.title == "A document " * 1000 for doc in documents)
+
+    assert documents
+
+
+ADDER_SCRIPT = """
+import pathlib
+import sys
+
+from docstore import journal
+from docstore.documents import _record_operations
+from docstore.models import Document
+
+root = pathlib.Path(sys.argv[1])
+name = sys.argv[2]
+
+# Compact often, so the writers are regularly rewriting the snapshot.
+journal.COMPACT_AFTER_OPERATIONS = 5
+
+for i in range(50):
+    _record_operations(root, [journal.add_operation(Document(title=f"{name}-{i}"))])
+"""
+
+
+def test_concurrent_writers_dont_lose_documents(root: pathlib.Path) -> None:
+    writers = [
+        subprocess.Popen([sys.executable, "-c", ADDER_SCRIPT, str(root), str(n)])
+        for n in range(4)
+    ]
+
+    for w in writers:
+        assert w.wait() == 0
+
+    titles = {doc.title for doc in read_documents(root)}
+    assert titles == {f"{n}-{i}" for n in range(4) for i in range(50)}
+
+
+@pytest.fixture
+def fake_thumbnails(monkeypatch: pytest.MonkeyPatch) -> list[str]:
+    """
+    Replace the thumbnail and tint colour tools with a fake that doesn't
+    need any external tools.  It fails for PDFs, and returns a list that
+    records every file it creates a thumbnail for.
+    """
+    thumbnailed: list[str] = []
+
+    def create_thumbnail(path: str, *, max_size: int = 400) -> ThumbnailResult:
+        if path.endswith(".pdf"):
+            raise ValueError("Unable to create thumbnail")
+
+        thumbnailed.append(path)
+        thumbnail_path = os.path.join(tempfile.mkdtemp(), _png_name(path))
+        shutil.copyfile("tests/files/cluster.png", thumbnail_path)
+        return {"path": thumbnail_path, "dimensions": Dimensions(500, 325)}
+
+    monkeypatch.setattr(docstore_documents, "create_thumbnail", create_thumbnail)
+    monkeypatch.setattr(
+        docstore_documents, "choose_tint_color", lambda **kwargs: (0, 0, 0)
+    )
+
+    return thumbnailed
+
+
+def test_store_new_documents_records_nothing_if_a_file_fails(
+    tmpdir: pathlib.Path, root: pathlib.Path, fake_thumbnails: list[str]
+) -> None:
+    shutil.copyfile(src="tests/files/cluster.png", dst=tmpdir / "cluster.png")
+    shutil.copyfile(src="tests/files/snakes.pdf", dst=tmpdir / "snakes.pdf")
+
+    with pytest.raises(ValueError, match="Unable to create thumbnail"):
+        docstore_documents.store_new_documents(
+            root=root,
+            new_documents=[
+                {
+                    "path": tmpdir / name,
+                    "title": name,
+                    "tags": [],
+                    "source_url": None,
+                }
+                for name in ["cluster.png", "snakes.pdf"]
+            ],
+            date_saved=datetime.datetime.now(),
+        )
+
+    # Nothing was recorded, the files we'd already stored were cleaned up,
+    # and the originals are still there.
+    assert read_documents(root) == []
+    assert all(files == [] for _, _, files in os.walk(root / "files"))
+    assert all(files == [] for _, _, files in os.walk(root / "thumbnails"))
+
+    assert os.path.exists(tmpdir / "cluster.png")
+    assert os.path.exists(tmpdir / "snakes.pdf")
+
+
+def test_storing_documents_in_parallel_skips_failures(
+    tmpdir: pathlib.Path, root: pathlib.Path
+) -> None:
+    # The failure comes from the inputs rather than a monkeypatch, because
+    # a patch wouldn't reach worker processes started with "spawn"
+    # (the default on macOS).
+    names = ["cluster1.png", "cluster2.png", "cluster3.png"]
+    for name in names:
+        shutil.copyfile(src="tests/files/cluster.png", dst=tmpdir / name)
+
+    progress: list[int] = []
+
+    results = docstore_documents.store_new_documents_in_parallel(
+        root=root,
+        new_documents=[
+            {"path": tmpdir / name, "title": name, "tags": [], "source_url": None}
+            for name in [
+                "cluster1.png",
+                "doesnotexist.png",
+                "cluster2.png",
+                "cluster3.png",
+            ]
+        ],
+        date_saved=datetime.datetime.now(),
+        jobs=2,
+        commit_every=2,
+        on_progress=lambda: progress.append(1),
+    )
+
+    assert len(progress) == 4
+
+    assert sorted(doc.title for doc in results["stored"]) == names
+    assert sorted(read_documents(root), key=lambda d: d.title) == sorted(
+        results["stored"], key=lambda d: d.title
+    )
+
+    assert len(results["failed"]) == 1
+    assert results["failed"][0]["new_document"]["path"] == tmpdir / "doesnotexist.png"
+    assert isinstance(results["failed"][0]["error"], FileNotFoundError)
+
+    # The stored files were moved out of the way
+    assert sorted(os.listdir(tmpdir)) == ["root"]
+
+
+def test_reuses_stored_copy_of_duplicate_file(
+    tmpdir: pathlib.Path, root: pathlib.Path, fake_thumbnails: list[str]
+) -> None:
+    stored = []
+
+    for title in ["First copy", "Second copy"]:
+        shutil.copyfile(src="tests/files/cluster.png", dst=tmpdir / "cluster.png")
+        stored.append(
+            store_new_document(
+                root=root,
+                path=tmpdir / "cluster.png",
+                title=title,
+                tags=[],
+                source_url=None,
+                date_saved=datetime.datetime.now(),
+            )
+        )
+
+    # We only created one thumbnail, and the second document shares
+    # the stored file, thumbnail and tint colour of the first.
+    assert len(fake_thumbnails) == 1
+
+    file1, file2 = stored[0].files[0], stored[1].files[0]
+
+    assert file1.path != file2.path
+    assert os.path.samefile(root / file1.path, root / file2.path)
+
+    assert file1.thumbnail.path != file2.thumbnail.path
+    assert os.path.samefile(root / file1.thumbnail.path, root / file2.thumbnail.path)
+    assert file1.thumbnail.tint_color == file2.thumbnail.tint_color
+    assert file1.thumbnail.dimensions == file2.thumbnail.dimensions
+
+    assert file1.checksum == file2.checksum
+    assert read_documents(root) == stored
+
+    # Deleting one document leaves the other intact
+    delete_document(root, doc_id=stored[0].id)
+    assert os.path.exists(root / file2.path)
+    assert os.path.exists(root / file2.thumbnail.path)
+
+
+def test_spots_duplicates_within_a_batch(
+    tmpdir: pathlib.Path, root: pathlib.Path, fake_thumbnails: list[str]
+) -> None:
+    shutil.copyfile(src="tests/files/cluster.png", dst=tmpdir / "cluster1.png")
+    shutil.copyfile(src="tests/files/cluster.png", dst=tmpdir / "cluster2.png")
+
+    doc1, doc2 = docstore_documents.store_new_documents(
+        root=root,
+        new_documents=[
+            {"path": tmpdir / name, "title": name, "tags": [], "source_url": None}
+            for name in ["cluster1.png", "cluster2.png"]
+        ],
+        date_saved=datetime.datetime.now(),
+    )
+
+    assert len(fake_thumbnails) == 1
+
+    file1, file2 = doc1.files[0], doc2.files[0]
+    assert os.path.samefile(root / file1.path, root / file2.path)
+    assert os.path.samefile(root / file1.thumbnail.path, root / file2.thumbnail.path)
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_spots_duplicates_within_a_parallel_batch(
+    tmpdir: pathlib.Path, root: pathlib.Path, jobs: int
+) -> None:
+    names = ["cluster1.png", "cluster2.png", "cluster3.png"]
+    for name in names:
+        shutil.copyfile(src="tests/files/cluster.png", dst=tmpdir / name)
+
+    results = docstore_documents.store_new_documents_in_parallel(
+        root=root,
+        new_documents=[
+            {"path": tmpdir / name, "title": name, "tags": [], "source_url": None}
+            for name in names
+        ],
+        date_saved=datetime.datetime.now(),
+        jobs=jobs,
+        on_duplicate="skip",
+    )
+
+    (stored,) = results["stored"]
+    assert read_documents(root) == [stored]
+
+    assert len(results["failed"]) == 2
+    for failure in results["failed"]:
+        assert isinstance(failure["error"], DuplicateFileError)
+        assert failure["error"].existing == stored.files[0]
+
+    # The skipped files are left where they were, and nothing of theirs
+    # is left behind in the store.
+    assert sorted(os.listdir(tmpdir)) == sorted(
+        ["root"]
+        + [os.path.basename(f["new_document"]["path"]) for f in results["failed"]]
+    )
+    assert os.listdir(root / "files" / "c") == [os.path.basename(stored.files[0].path)]
+    assert sorted(
+        os.path.join("thumbnails", "c", name)
+        for name in os.listdir(root / "thumbnails" / "c")
+    ) == sorted(docstore_documents._thumbnail_paths(stored.files[0].thumbnail))
+
+
+def test_can_skip_duplicate_file(
+    tmpdir: pathlib.Path, root: pathlib.Path, fake_thumbnails: list[str]
+) -> None:
+    shutil.copyfile(src="tests/files/cluster.png", dst=tmpdir / "cluster1.png")
+    shutil.copyfile(src="tests/files/cluster.png", dst=tmpdir / "cluster2.png")
+
+    doc = store_new_document(
+        root=root,
+        path=tmpdir / "cluster1.png",
+        title="First copy",
+        tags=[],
+        source_url=None,
+        date_saved=datetime.datetime.now(),
+    )
+
+    with pytest.raises(DuplicateFileError) as exc:
+        store_new_document(
+            root=root,
+            path=tmpdir / "cluster2.png",
+            title="Second copy",
+            tags=[],
+            source_url=None,
+            date_saved=datetime.datetime.now(),
+            on_duplicate="skip",
+        )
+
+    assert exc.value.existing == doc.files[0]
+
+    assert read_documents(root) == [doc]
+    assert os.path.exists(tmpdir / "cluster2.png")
+    assert os.listdir(root / "files" / "c") == ["cluster1.png"]
+
+
+def test_reuses_cached_thumbnail_for_file_stored_again(
+    tmpdir: pathlib.Path, root: pathlib.Path, fake_thumbnails: list[str]
+) -> None:
+    shutil.copyfile(src="tests/files/cluster.png", dst=tmpdir / "cluster.png")
+    doc1 = store_new_document(
+        root=root,
+        path=tmpdir / "cluster.png",
+        title="First copy",
+        tags=[],
+        source_url=None,
+        date_saved=datetime.datetime.now(),
+    )
+
+    delete_document(root, doc_id=doc1.id)
+
+    # The file is no longer in the store, but we don't need to create
+    # the thumbnail again when it comes back.
+    shutil.copyfile(src="tests/files/cluster.png", dst=tmpdir / "cluster.png")
+    doc2 = store_new_document(
+        root=root,
+        path=tmpdir / "cluster.png",
+        title="Second copy",
+        tags=[],
+        source_url=None,
+        date_saved=datetime.datetime.now(),
+    )
+
+    assert len(fake_thumbnails) == 1
+    assert doc2.files[0].thumbnail.dimensions == doc1.files[0].thumbnail.dimensions
+    assert doc2.files[0].thumbnail.tint_color == doc1.files[0].thumbnail.tint_color
+    assert os.path.exists(root / doc2.files[0].thumbnail.path)
+
+
+def test_regenerate_thumbnails_creates_missing_variants(
+    tmpdir: pathlib.Path, root: pathlib.Path
+) -> None:
+    shutil.copyfile(src="tests/files/cluster.png", dst=tmpdir / "cluster.png")
+    doc = store_new_document(
+        root=root,
+        path=tmpdir / "cluster.png",
+        title="A document stored before we had variants",
+        tags=[],
+        source_url=None,
+        date_saved=datetime.datetime.now(),
+    )
+
+    # Pretend this thumbnail was created before we had variants
+    thumbnail = doc.files[0].thumbnail
+    for v in thumbnail.variants:
+        os.unlink(root / v.path)
+    old_doc = attr.evolve(
+        doc,
+        files=[
+            attr.evolve(doc.files[0], thumbnail=attr.evolve(thumbnail, variants=[]))
+        ],
+    )
+    write_documents(root=root, documents=[old_doc])
+
+    results = regenerate_thumbnails(root)
+
+    assert results["updated"] == [old_doc.files[0]]
+    assert results["failed"] == []
+
+    (new_doc,) = read_documents(root)
+    assert new_doc.files[0].thumbnail == thumbnail
+    for v in new_doc.files[0].thumbnail.variants:
+        assert os.path.exists(root / v.path)
+
+    # Running it again has nothing left to do
+    assert regenerate_thumbnails(root)["updated"] == []
+
+
+def test_regenerate_all_thumbnails_removes_the_old_files(
+    tmpdir: pathlib.Path, root: pathlib.Path, fake_thumbnails: list[str]
+) -> None:
+    shutil.copyfile(src="tests/files/cluster.png", dst=tmpdir / "cluster.png")
+    doc = store_new_document(
+        root=root,
+        path=tmpdir / "cluster.png",
+        title="A document with an old thumbnail",
+        tags=[],
+        source_url=None,
+        date_saved=datetime.datetime.now(),
+    )
+
+    # Give the file a thumbnail at a path we won't use again
+    old_thumbnail = attr.evolve(
+        doc.files[0].thumbnail, path="thumbnails/o/old.png", variants=[]
+    )
+    os.makedirs(root / "thumbnails" / "o")
+    shutil.copyfile("tests/files/cluster.png", root / old_thumbnail.path)
+    old_doc = attr.evolve(
+        doc, files=[attr.evolve(doc.files[0], thumbnail=old_thumbnail)]
+    )
+    write_documents(root=root, documents=[old_doc])
+
+    results = regenerate_thumbnails(root, recreate=True)
+
+    assert results["updated"] == [old_doc.files[0]]
+    assert results["failed"] == []
+
+    (new_doc,) = read_documents(root)
+    new_thumbnail = new_doc.files[0].thumbnail
+    assert new_thumbnail.path != old_thumbnail.path
+    assert new_thumbnail.tint_color == old_thumbnail.tint_color
+    assert not os.path.exists(root / old_thumbnail.path)
+    assert os.path.exists(root / new_doc.files[0].thumbnail.path)
+
+
+def test_creates_deferred_thumbnails_later(
+    tmpdir: pathlib.Path, root: pathlib.Path, fake_thumbnails: list[str]
+) -> None:
+    shutil.copyfile(src="tests/files/cluster.png", dst=tmpdir / "cluster.png")
+    doc = store_new_document(
+        root=root,
+        path=tmpdir / "cluster.png",
+        title="A document with a deferred thumbnail",
+        tags=[],
+        source_url=None,
+        date_saved=datetime.datetime.now(),
+        defer_thumbnails=True,
+    )
+
+    # The document is recorded straight away with a placeholder thumbnail
+    placeholder = doc.files[0].thumbnail
+    assert fake_thumbnails == []
+    assert placeholder.tint_color == PLACEHOLDER_TINT_COLOR
+    assert os.path.exists(root / placeholder.path)
+    assert read_documents(root) == [doc]
+
+    (job,) = job_queue.list_jobs(root, "pending")
+    assert job["file_id"] == doc.files[0].id
+
+    # The worker creates the real thumbnail, and removes the placeholder
+    results = process_thumbnail_jobs(root)
+    assert results["updated"] == doc.files
+    assert results["failed"] == []
+
+    (stored_doc,) = read_documents(root)
+    thumbnail = stored_doc.files[0].thumbnail
+    assert thumbnail.tint_color == "#000000"
+    assert thumbnail.dimensions == Dimensions(500, 325)
+    assert os.path.exists(root / thumbnail.path)
+    assert not os.path.exists(root / placeholder.path)
+
+    assert job_queue.list_jobs(root, "pending") == []
+    assert job_queue.list_jobs(root, "running") == []
+
+
+def test_deferred_thumbnail_uses_the_derivatives_cache(
+    tmpdir: pathlib.Path, root: pathlib.Path, fake_thumbnails: list[str]
+) -> None:
+    for i in range(2):
+        shutil.copyfile(src="tests/files/cluster.png", dst=tmpdir / "cluster.png")
+        doc = store_new_document(
+            root=root,
+            path=tmpdir / "cluster.png",
+            title=f"Copy {i}",
+            tags=[],
+            source_url=None,
+            date_saved=datetime.datetime.now(),
+            defer_thumbnails=i > 0,
+        )
+        delete_document(root, doc_id=doc.id)
+
+    # We'd already created this thumbnail, so there's no need to wait
+    assert len(fake_thumbnails) == 1
+    assert doc.files[0].thumbnail.tint_color == "#000000"
+    assert job_queue.list_jobs(root, "pending") == []
+
+
+def test_files_with_the_same_name_get_their_own_thumbnails(
+    tmpdir: pathlib.Path, root: pathlib.Path, fake_thumbnails: list[str]
+) -> None:
+    # The placeholder for cluster.gif mustn't be overwritten by the
+    # thumbnail for cluster.png, or vice versa.
+    shutil.copyfile(src="tests/files/Newtons_cradle.gif", dst=tmpdir / "cluster.gif")
+    shutil.copyfile(src="tests/files/cluster.png", dst=tmpdir / "cluster.png")
+
+    for name, defer_thumbnails in [("cluster.gif", True), ("cluster.png", False)]:
+        store_new_document(
+            root=root,
+            path=tmpdir / name,
+            title=name,
+            tags=[],
+            source_url=None,
+            date_saved=datetime.datetime.now(),
+            defer_thumbnails=defer_thumbnails,
+        )
+
+    process_thumbnail_jobs(root)
+
+    thumbnail_paths = [
+        p
+        for doc in read_documents(root)
+        for f in doc.files
+        for p in [f.thumbnail.path] + [v.path for v in f.thumbnail.variants]
+    ]
+
+    assert len(thumbnail_paths) == len(set(thumbnail_paths))
+    assert all(os.path.exists(root / p) for p in thumbnail_paths)
+
+
+def test_cached_thumbnail_doesnt_collide_with_a_file_with_the_same_name(
+    tmpdir: pathlib.Path, root: pathlib.Path, fake_thumbnails: list[str]
+) -> None:
+    # Store and delete cluster.gif, so its thumbnail is in the derivatives
+    # cache.  When we store it again, its thumbnail comes from the cache
+    # and is named after the file -- the same as the thumbnail for cluster.png.
+    for name, src, delete in [
+        ("cluster.gif", "tests/files/Newtons_cradle.gif", True),
+        ("cluster.gif", "tests/files/Newtons_cradle.gif", False),
+        ("cluster.png", "tests/files/cluster.png", False),
+    ]:
+        shutil.copyfile(src=src, dst=tmpdir / name)
+        doc = store_new_document(
+            root=root,
+            path=tmpdir / name,
+            title=name,
+            tags=[],
+            source_url=None,
+            date_saved=datetime.datetime.now(),
+        )
+
+        if delete:
+            delete_document(root, doc_id=doc.id)
+
+    assert len(fake_thumbnails) == 2
+
+    thumbnail_paths = [
+        p
+        for doc in read_documents(root)
+        for f in doc.files
+        for p in [f.thumbnail.path] + [v.path for v in f.thumbnail.variants]
+    ]
+
+    assert len(thumbnail_paths) == len(set(thumbnail_paths))
+    assert all(os.path.exists(root / p) for p in thumbnail_paths)
+
+
+def test_reused_thumbnail_doesnt_collide_with_a_file_with_the_same_name(
+    tmpdir: pathlib.Path, root: pathlib.Path, fake_thumbnails: list[str]
+) -> None:
+    # cluster.jpeg is a duplicate of cluster.gif, so it reuses that
+    # thumbnail -- but the link is named after cluster.jpeg, the same
+    # as the thumbnail for cluster.png.
+    for name, src in [
+        ("cluster.gif", "tests/files/Newtons_cradle.gif"),
+        ("cluster.jpeg", "tests/files/Newtons_cradle.gif"),
+        ("cluster.png", "tests/files/cluster.png"),
+    ]:
+        shutil.copyfile(src=src, dst=tmpdir / name)
+        store_new_document(
+            root=root,
+            path=tmpdir / name,
+            title=name,
+            tags=[],
+            source_url=None,
+            date_saved=datetime.datetime.now(),
+        )
+
+    assert len(fake_thumbnails) == 2
+
+    thumbnail_paths = [
+        p
+        for doc in read_documents(root)
+        for f in doc.files
+        for p in [f.thumbnail.path] + [v.path for v in f.thumbnail.variants]
+    ]
+
+    assert len(thumbnail_paths) == len(set(thumbnail_paths))
+    assert all(os.path.exists(root / p) for p in thumbnail_paths)
+
+
+@pytest.mark.parametrize("defer_second", [True, False])
+def test_duplicate_of_file_with_placeholder_gets_its_own_thumbnail(
+    tmpdir: pathlib.Path,
+    root: pathlib.Path,
+    fake_thumbnails: list[str],
+    defer_second: bool,
+) -> None:
+    docs = []
+
+    for title, defer_thumbnails in [
+        ("First copy", True),
+        ("Second copy", defer_second),
+    ]:
+        shutil.copyfile(src="tests/files/cluster.png", dst=tmpdir / "cluster.png")
+        docs.append(
+            store_new_document(
+                root=root,
+                path=tmpdir / "cluster.png",
+                title=title,
+                tags=[],
+                source_url=None,
+                date_saved=datetime.datetime.now(),
+                defer_thumbnails=defer_thumbnails,
+            )
+        )
+
+    file1, file2 = docs[0].files[0], docs[1].files[0]
+
+    # The second copy still shares the stored file
+    assert os.path.samefile(root / file1.path, root / file2.path)
+
+    # ... but not the placeholder: it either gets a thumbnail straight away,
+    # or a job of its own to create one.
+    if defer_second:
+        assert file2.thumbnail.tint_color == PLACEHOLDER_TINT_COLOR
+        assert not os.path.samefile(
+            root / file1.thumbnail.path, root / file2.thumbnail.path
+        )
+        assert sorted(j["file_id"] for j in job_queue.list_jobs(root, "pending")) == (
+            sorted([file1.id, file2.id])
+        )
+    else:
+        assert file2.thumbnail.tint_color == "#000000"
+        assert [j["file_id"] for j in job_queue.list_jobs(root, "pending")] == [
+            file1.id
+        ]
+
+    process_thumbnail_jobs(root)
+
+    assert all(
+        f.thumbnail.tint_color == "#000000"
+        for doc in read_documents(root)
+        for f in doc.files
+    )
+    assert job_queue.list_jobs(root, "pending") == []
+
+
+def test_retries_failed_thumbnail_jobs(
+    tmpdir: pathlib.Path, root: pathlib.Path, fake_thumbnails: list[str]
+) -> None:
+    shutil.copyfile(src="tests/files/snakes.pdf", dst=tmpdir / "snakes.pdf")
+    doc = store_new_document(
+        root=root,
+        path=tmpdir / "snakes.pdf",
+        title="A document whose thumbnail fails",
+        tags=[],
+        source_url=None,
+        date_saved=datetime.datetime.now(),
+        defer_thumbnails=True,
+    )
+
+    results = process_thumbnail_jobs(root, max_attempts=2, retry_delay=0)
+
+    assert results["updated"] == []
+    assert [j["attempts"] for j in results["retrying"]] == [1]
+    assert [j["attempts"] for j in results["failed"]] == [2]
+    assert results["failed"][0]["last_error"] == "Unable to create thumbnail"
+
+    # The job is on the dead-letter list, and the document keeps its placeholder
+    assert job_queue.list_jobs(root, "pending") == []
+    assert job_queue.list_jobs(root, "failed") == results["failed"]
+    assert read_documents(root) == [doc]
+
+
+def test_drops_thumbnail_job_for_deleted_file(
+    tmpdir: pathlib.Path, root: pathlib.Path, fake_thumbnails: list[str]
+) -> None:
+    shutil.copyfile(src="tests/files/cluster.png", dst=tmpdir / "cluster.png")
+    doc = store_new_document(
+        root=root,
+        path=tmpdir / "cluster.png",
+        title="A document that gets deleted",
+        tags=[],
+        source_url=None,
+        date_saved=datetime.datetime.now(),
+        defer_thumbnails=True,
+    )
+    delete_document(root, doc_id=doc.id)
+
+    results = process_thumbnail_jobs(root)
+
+    assert results == {"updated": [], "retrying": [], "failed": []}
+    assert fake_thumbnails == []
+    assert job_queue.list_jobs(root, "pending") == []
+    assert job_queue.list_jobs(root, "running") == []
@@ -1,7 +1,14 @@
 import concurrent.futures
+import errno
 import os
 import pathlib
+import sys
+import typing
 
+import pytest
+
+from docstore import file_normalisation
+from docstore.documents import sha256
 from docstore.file_normalisation import normalised_filename_copy
 
 
@@ -82,3 +89,179 @@ def test_copies_multiple_files_concurrently(tmp_path: pathlib.Path) -> None:
     }
 
     assert dst_contents == {"Hello world", "Bonjour le monde", "Hallo Welt"}
+
+
+def test_returns_size_and_checksum_of_copy(tmp_path: pathlib.Path) -> None:
+    src = pathlib.Path("tests/files/cluster.png")
+    dst = tmp_path / "cluster.png"
+
+    result = normalised_filename_copy(src=str(src), dst=str(dst))
+
+    assert result["path"] == str(dst)
+    assert result["size"] == 41151
+    assert (
+        result["checksum"]
+        == "sha256:683cbee0c2dda22b42fd92bda0f31e4b6b49cd8650a7924d72a14a30f11bfbe5"
+    )
+    assert result["checksum"] == sha256(dst)
+
+
+def test_missing_source_doesnt_leave_empty_file(tmp_path: pathlib.Path) -> None:
+    dst = tmp_path / "dst.txt"
+
+    with pytest.raises(FileNotFoundError):
+        normalised_filename_copy(src=str(tmp_path / "missing.txt"), dst=str(dst))
+
+    assert not dst.exists()
+
+
+def test_can_hard_link_instead_of_copying(tmp_path: pathlib.Path) -> None:
+    src = tmp_path / "src.txt"
+    dst = tmp_path / "dst.txt"
+
+    src.write_text("Hello world")
+
+    result = normalised_filename_copy(
+        src=str(src), dst=str(dst), link=True, checksum=sha256(src)
+    )
+
+    assert result["method"] == "link"
+    assert os.path.samefile(src, dst)
+    assert result["size"] == 11
+
+
+def test_hashes_a_hard_linked_file_without_a_checksum(tmp_path: pathlib.Path) -> None:
+    src = tmp_path / "src.txt"
+    dst = tmp_path / "dst.txt"
+
+    src.write_text("Hello world")
+
+    result = normalised_filename_copy(src=str(src), dst=str(dst), link=True)
+
+    assert result["method"] == "link"
+    assert os.path.samefile(src, dst)
+    assert result["size"] == 11
+    assert result["checksum"] == sha256(src)
+
+
+def test_copies_and_hashes_in_one_pass_without_a_checksum(
+    tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    calls = []
+    hash_chunks = file_normalisation._hash_chunks
+
+    def _hash_chunks(*args: typing.Any, **kwargs: typing.Any) -> tuple[int, str]:
+        calls.append(kwargs)
+        return hash_chunks(*args, **kwargs)
+
+    monkeypatch.setattr(file_normalisation, "_hash_chunks", _hash_chunks)
+
+    # e.g. the file is on a different filesystem to the store
+    monkeypatch.setattr(file_normalisation, "_hard_link", lambda src, dst: False)
+    monkeypatch.setattr(file_normalisation, "_clonefile", lambda src, dst: False)
+    monkeypatch.setattr(file_normalisation, "_reflink", lambda src_fd, dst_fd: False)
+
+    src = tmp_path / "src.txt"
+    dst = tmp_path / "dst.txt"
+
+    src.write_text("Hello world")
+
+    result = normalised_filename_copy(src=str(src), dst=str(dst), link=True)
+
+    assert result["method"] == "copy"
+    assert not os.path.samefile(src, dst)
+    assert result["checksum"] == sha256(src)
+    assert len(calls) == 1
+
+
+def test_doesnt_reread_the_file_if_the_checksum_is_known(
+    tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    def _hash_chunks(*args: typing.Any, **kwargs: typing.Any) -> None:
+        raise AssertionError("Should not hash the file again")
+
+    monkeypatch.setattr(file_normalisation, "_hash_chunks", _hash_chunks)
+
+    src = pathlib.Path("tests/files/cluster.png")
+    dst = tmp_path / "cluster.png"
+
+    result = normalised_filename_copy(
+        src=str(src), dst=str(dst), checksum="sha256:1234"
+    )
+
+    assert result["checksum"] == "sha256:1234"
+    assert result["size"] == 41151
+    assert dst.read_bytes() == src.read_bytes()
+
+
+def test_doesnt_hard_link_by_default(tmp_path: pathlib.Path) -> None:
+    src = tmp_path / "src.txt"
+    dst = tmp_path / "dst.txt"
+
+    src.write_text("Hello world")
+
+    result = normalised_filename_copy(src=str(src), dst=str(dst))
+
+    assert result["method"] != "link"
+    assert not os.path.samefile(src, dst)
+    assert dst.read_text() == "Hello world"
+
+
+def test_hard_link_doesnt_overwrite_existing_file(tmp_path: pathlib.Path) -> None:
+    src1 = tmp_path / "src1.txt"
+    src2 = tmp_path / "src2.txt"
+    dst = tmp_path / "dst.txt"
+
+    src1.write_text("Hello world")
+    src2.write_text("Bonjour le monde")
+
+    normalised_filename_copy(
+        src=str(src1), dst=str(dst), link=True, checksum=sha256(src1)
+    )
+    result = normalised_filename_copy(
+        src=str(src2), dst=str(dst), link=True, checksum=sha256(src2)
+    )
+
+    assert result["path"] != str(dst)
+    assert dst.read_text() == "Hello world"
+    assert pathlib.Path(result["path"]).read_text() == "Bonjour le monde"
+
+
+def test_falls_back_to_copying_through_python(
+    tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(file_normalisation, "_clonefile", lambda src, dst: False)
+    monkeypatch.setattr(file_normalisation, "_reflink", lambda src_fd, dst_fd: False)
+    monkeypatch.setattr(
+        file_normalisation, "_copy_in_kernel", lambda src_fd, dst_fd: None
+    )
+
+    src = pathlib.Path("tests/files/cluster.png")
+    dst = tmp_path / "cluster.png"
+
+    result = normalised_filename_copy(src=str(src), dst=str(dst), checksum=sha256(src))
+
+    assert result["method"] == "copy"
+    assert result["size"] == 41151
+    assert dst.read_bytes() == src.read_bytes()
+
+
+@pytest.mark.skipif(
+    sys.platform != "linux", reason="sendfile() to a file is Linux-only"
+)
+def test_falls_back_to_sendfile(
+    tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    def copy_file_range(*args: typing.Any) -> int:
+        raise OSError(errno.EXDEV, "Invalid cross-device link")
+
+    monkeypatch.setattr(file_normalisation, "_reflink", lambda src_fd, dst_fd: False)
+    monkeypatch.setattr(os, "copy_file_range", copy_file_range)
+
+    src = pathlib.Path("tests/files/cluster.png")
+    dst = tmp_path / "cluster.png"
+
+    result = normalised_filename_copy(src=str(src), dst=str(dst), checksum=sha256(src))
+
+    assert result["method"] == "sendfile"
+    assert dst.read_bytes() == src.read_bytes()
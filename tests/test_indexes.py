@@ -0,0 +1,111 @@
+import datetime
+import random
+
+import pytest
+
+from docstore.indexes import SORT_ORDERS, DocumentIndex
+from docstore.models import Dimensions, Document, File, Thumbnail, ThumbnailVariant
+
+
+def create_file(path: str, checksum: str) -> File:
+    return File(
+        filename="cats.jpg",
+        path=path,
+        size=100,
+        checksum=checksum,
+        thumbnail=Thumbnail(
+            path="thumbnails/c/cats.jpg",
+            dimensions=Dimensions(400, 300),
+            tint_color="#ffffff",
+        ),
+    )
+
+
+def test_looks_up_documents_and_files() -> None:
+    f1 = create_file(path="files/c/cats1.jpg", checksum="sha256:111")
+    f2 = create_file(path="files/c/cats2.jpg", checksum="sha256:222")
+    f3 = create_file(path="files/c/cats3.jpg", checksum="sha256:111")
+
+    doc1 = Document(title="Doc1", tags=["cats"], files=[f1, f2])
+    doc2 = Document(title="Doc2", tags=["cats", "pets"], files=[f3])
+
+    index = DocumentIndex([doc1, doc2])
+
+    assert index.by_id == {doc1.id: doc1, doc2.id: doc2}
+    assert index.files_by_path["files/c/cats2.jpg"] == f2
+    assert index.files_by_checksum["sha256:111"] == [f1, f3]
+    assert index.doc_ids_by_tag == {"cats": {doc1.id, doc2.id}, "pets": {doc2.id}}
+
+
+def test_finds_documents_with_tags() -> None:
+    documents = [
+        Document(title="Doc1", tags=["cats"]),
+        Document(title="Doc2", tags=["cats", "pets"]),
+        Document(title="Doc3", tags=["dogs", "pets"]),
+    ]
+
+    index = DocumentIndex(documents)
+
+    assert index.documents_with_tags(set()) == documents
+    assert index.documents_with_tags({"cats"}) == documents[:2]
+    assert index.documents_with_tags({"pets", "cats"}) == [documents[1]]
+    assert index.documents_with_tags({"birds"}) == []
+
+
+def test_looks_up_files_by_thumbnail() -> None:
+    f = File(
+        filename="cats.jpg",
+        path="files/c/cats.jpg",
+        size=100,
+        checksum="sha256:111",
+        thumbnail=Thumbnail(
+            path="thumbnails/c/cats.png",
+            dimensions=Dimensions(400, 300),
+            tint_color="#ffffff",
+            variants=[
+                ThumbnailVariant(
+                    path="thumbnails/c/cats-100w.webp",
+                    format="webp",
+                    dimensions=Dimensions(100, 75),
+                )
+            ],
+        ),
+    )
+
+    index = DocumentIndex([Document(title="Doc1", files=[f])])
+
+    assert index.files_by_thumbnail_path == {
+        "thumbnails/c/cats.png": f,
+        "thumbnails/c/cats-100w.webp": f,
+    }
+
+
+@pytest.mark.parametrize("sort_by", list(SORT_ORDERS))
+def test_top_documents_matches_a_full_sort(sort_by: str) -> None:
+    rand = random.Random(0)
+
+    # Lots of documents share a title or date, so we check ties are
+    # in the same order as sorted().
+    documents = [
+        Document(
+            title=rand.choice(["Apple", "banana", "cherry"]),
+            date_saved=datetime.datetime(2001, 1, rand.randint(1, 5)),
+            tags=rand.sample(["cats", "dogs", "pets"], 1),
+        )
+        for _ in range(200)
+    ]
+
+    index = DocumentIndex(documents)
+    sort_key, reverse = SORT_ORDERS[sort_by]
+
+    assert index.sorted_documents(sort_by) == sorted(
+        documents, key=sort_key, reverse=reverse
+    )
+    assert index.sorted_documents(sort_by) is index.sorted_documents(sort_by)
+
+    for docs in [documents, index.documents_with_tags({"cats"})]:
+        for count in [0, 10, 50, 1000]:
+            assert (
+                index.top_documents(docs, sort_by=sort_by, count=count)
+                == sorted(docs, key=sort_key, reverse=reverse)[:count]
+            )
@@ -0,0 +1,90 @@
+import json
+import pathlib
+
+import pytest
+
+from docstore.ingest_sources import find_new_documents
+
+
+@pytest.fixture
+def files_dir(tmpdir: pathlib.Path) -> pathlib.Path:
+    files_dir = pathlib.Path(tmpdir) / "to_add"
+    (files_dir / "nested").mkdir(parents=True)
+
+    for name in ["bill.pdf", "receipt.png", "nested/letter.pdf", ".DS_Store"]:
+        (files_dir / name).write_bytes(b"hello world")
+
+    return files_dir
+
+
+def test_finds_files_in_directory(files_dir: pathlib.Path) -> None:
+    new_documents = find_new_documents(str(files_dir), tags=["scans"], source_url=None)
+
+    assert [(d["path"], d["title"], d["tags"]) for d in new_documents] == [
+        (files_dir / "bill.pdf", "bill", ["scans"]),
+        (files_dir / "nested/letter.pdf", "letter", ["scans"]),
+        (files_dir / "receipt.png", "receipt", ["scans"]),
+    ]
+
+
+def test_finds_files_matching_glob(files_dir: pathlib.Path) -> None:
+    new_documents = find_new_documents(
+        f"{files_dir}/**/*.pdf", tags=[], source_url=None
+    )
+
+    assert [d["path"] for d in new_documents] == [
+        files_dir / "bill.pdf",
+        files_dir / "nested/letter.pdf",
+    ]
+
+
+def test_reads_manifest(files_dir: pathlib.Path) -> None:
+    manifest = files_dir / "manifest.jsonl"
+    manifest.write_text(
+        "\n".join(
+            [
+                json.dumps(
+                    {"path": "bill.pdf", "title": "Gas bill", "tags": ["bills"]}
+                ),
+                json.dumps(
+                    {
+                        "path": str(files_dir / "receipt.png"),
+                        "tags": "receipts, shopping",
+                        "source_url": "https://example.org/receipt",
+                    }
+                ),
+            ]
+        )
+    )
+
+    new_documents = find_new_documents(
+        str(manifest), tags=["imported"], source_url="https://example.org"
+    )
+
+    assert new_documents == [
+        {
+            "path": files_dir / "bill.pdf",
+            "title": "Gas bill",
+            "tags": ["bills", "imported"],
+            "source_url": "https://example.org",
+        },
+        {
+            "path": files_dir / "receipt.png",
+            "title": "receipt",
+            "tags": ["receipts", "shopping", "imported"],
+            "source_url": "https://example.org/receipt",
+        },
+    ]
+
+
+def test_rejects_bad_manifest_line(files_dir: pathlib.Path) -> None:
+    manifest = files_dir / "manifest.jsonl"
+    manifest.write_text('{"title": "No path"}\n')
+
+    with pytest.raises(ValueError, match="Line 1"):
+        find_new_documents(str(manifest), tags=[], source_url=None)
+
+
+def test_rejects_source_with_no_files(tmpdir: pathlib.Path) -> None:
+    with pytest.raises(ValueError, match="Couldn't find any files"):
+        find_new_documents(f"{tmpdir}/*.pdf", tags=[], source_url=None)
@@ -0,0 +1,92 @@
+import os
+import pathlib
+import time
+
+from docstore import job_queue
+from docstore.job_queue import Job, new_job
+
+
+def test_claims_each_job_once(root: pathlib.Path) -> None:
+    jobs = [new_job(doc_id="doc", file_id=f"file{i}") for i in range(3)]
+    job_queue.enqueue_jobs(root, jobs)
+
+    first = job_queue.claim_jobs(root, limit=2)
+    second = job_queue.claim_jobs(root, limit=2)
+
+    assert len(first) == 2
+    assert len(second) == 1
+    assert sorted(j["file_id"] for j in first + second) == ["file0", "file1", "file2"]
+
+    assert job_queue.claim_jobs(root, limit=2) == []
+    assert len(job_queue.list_jobs(root, "running")) == 3
+
+    for job in first + second:
+        job_queue.finish_job(root, job)
+
+    assert job_queue.list_jobs(root, "running") == []
+
+
+def test_released_job_can_be_claimed_again(root: pathlib.Path) -> None:
+    job_queue.enqueue_jobs(root, [new_job(doc_id="doc", file_id="file")])
+
+    (job,) = job_queue.claim_jobs(root, limit=1)
+    job_queue.release_job(root, job)
+
+    assert job_queue.claim_jobs(root, limit=1) == [job]
+
+
+def test_failed_job_is_retried_later(root: pathlib.Path) -> None:
+    job_queue.enqueue_jobs(root, [new_job(doc_id="doc", file_id="file")])
+
+    (job,) = job_queue.claim_jobs(root, limit=1)
+    failed_job = job_queue.fail_job(
+        root, job, error="BOOM!", max_attempts=3, retry_delay=60
+    )
+
+    assert failed_job["attempts"] == 1
+    assert failed_job["last_error"] == "BOOM!"
+    assert not job_queue.is_dead_letter(failed_job, max_attempts=3)
+
+    # It isn't ready to run yet...
+    assert job_queue.claim_jobs(root, limit=1) == []
+
+    # ...but it is once the retry delay has passed.
+    assert job_queue.claim_jobs(root, limit=1, now=time.time() + 61) == [failed_job]
+
+
+def test_job_that_fails_too_often_is_dead_lettered(root: pathlib.Path) -> None:
+    job_queue.enqueue_jobs(root, [new_job(doc_id="doc", file_id="file")])
+
+    for attempt in range(3):
+        (job,) = job_queue.claim_jobs(root, limit=1, now=time.time() + 3600)
+        failed_job = job_queue.fail_job(
+            root, job, error=f"attempt {attempt}", max_attempts=3, retry_delay=1
+        )
+
+    assert job_queue.is_dead_letter(failed_job, max_attempts=3)
+    assert job_queue.list_jobs(root, "pending") == []
+    assert job_queue.list_jobs(root, "failed") == [failed_job]
+
+    (retried,) = job_queue.retry_failed_jobs(root)
+    assert retried["attempts"] == 0
+    assert job_queue.list_jobs(root, "failed") == []
+    assert job_queue.claim_jobs(root, limit=1) == [retried]
+
+
+def test_recovers_jobs_from_a_dead_worker(root: pathlib.Path) -> None:
+    job_queue.enqueue_jobs(
+        root, [new_job(doc_id="doc", file_id=f"file{i}") for i in range(2)]
+    )
+
+    old_job, recent_job = job_queue.claim_jobs(root, limit=2)
+
+    # Pretend one of the jobs was claimed two hours ago
+    running_path = job_queue.jobs_dir(root) / "running" / f"{old_job['file_id']}.json"
+    two_hours_ago = time.time() - 2 * 60 * 60
+    os.utime(running_path, (two_hours_ago, two_hours_ago))
+
+    recovered: list[Job] = job_queue.recover_stale_jobs(root, older_than=60 * 60)
+
+    assert recovered == [old_job]
+    assert job_queue.list_jobs(root, "pending") == [old_job]
+    assert job_queue.list_jobs(root, "running") == [recent_job]
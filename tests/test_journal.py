@@ -0,0 +1,170 @@
+import datetime
+import json
+import os
+import pathlib
+
+import attr
+import pytest
+
+from docstore import documents as docstore_documents
+from docstore import journal
+from docstore.documents import (
+    compact_documents,
+    db_path,
+    delete_document,
+    pairwise_merge_documents,
+    read_documents,
+    retag_document,
+    write_documents,
+)
+from docstore.models import Document
+
+
+def test_changes_are_appended_to_the_journal(root: pathlib.Path) -> None:
+    doc1 = Document(title="Doc1", tags=["tag1"])
+    doc2 = Document(title="Doc2", tags=["tag2"])
+    doc3 = Document(title="Doc3", tags=["tag3"])
+    write_documents(root=root, documents=[doc1, doc2, doc3])
+
+    snapshot = db_path(root).read_text()
+
+    retag_document(root, doc_id=doc1.id, tags=["tag1", "new_tag"])
+    delete_document(root, doc_id=doc3.id)
+
+    # The snapshot is untouched; the changes are in the journal
+    assert db_path(root).read_text() == snapshot
+
+    operations, _ = journal.read_operations(root)
+    assert [op["op"] for op in operations] == ["retag", "delete"]
+
+    stored_documents = {d.id: d for d in read_documents(root)}
+    assert set(stored_documents) == {doc1.id, doc2.id}
+    assert stored_documents[doc1.id].tags == ["tag1", "new_tag"]
+
+
+def test_compacting_folds_journal_into_snapshot(root: pathlib.Path) -> None:
+    doc1 = Document(title="Doc1", date_saved=datetime.datetime(2010, 1, 1))
+    doc2 = Document(title="Doc2", date_saved=datetime.datetime(2002, 2, 2))
+    write_documents(root=root, documents=[doc1, doc2])
+
+    pairwise_merge_documents(
+        root, doc1=doc1, doc2=doc2, new_title="DocMerged", new_tags=["merged"]
+    )
+    assert os.path.exists(journal.journal_path(root))
+
+    compact_documents(root)
+
+    assert not os.path.exists(journal.journal_path(root))
+
+    stored_documents = json.loads(db_path(root).read_text())["documents"]
+    assert len(stored_documents) == 1
+    assert stored_documents[0]["title"] == "DocMerged"
+    assert stored_documents[0]["tags"] == ["merged"]
+
+
+def test_compacts_after_enough_operations(
+    root: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(journal, "COMPACT_AFTER_OPERATIONS", 3)
+
+    doc = Document(title="My document")
+    write_documents(root=root, documents=[doc])
+
+    for i in range(2):
+        retag_document(root, doc_id=doc.id, tags=[f"tag{i}"])
+    assert os.path.exists(journal.journal_path(root))
+
+    retag_document(root, doc_id=doc.id, tags=["final_tag"])
+    assert not os.path.exists(journal.journal_path(root))
+
+    assert read_documents(root)[0].tags == ["final_tag"]
+
+
+def test_counts_operations_again_if_the_count_is_lost(
+    root: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(journal, "COMPACT_AFTER_OPERATIONS", 3)
+
+    doc = Document(title="My document")
+    write_documents(root=root, documents=[doc])
+
+    for i in range(2):
+        retag_document(root, doc_id=doc.id, tags=[f"tag{i}"])
+
+    os.unlink(root / "documents.journal.count")
+
+    retag_document(root, doc_id=doc.id, tags=["final_tag"])
+    assert not os.path.exists(journal.journal_path(root))
+    assert not os.path.exists(root / "documents.journal.count")
+
+
+def test_ignores_partially_written_operation(root: pathlib.Path) -> None:
+    doc = Document(title="My document")
+    write_documents(root=root, documents=[doc])
+
+    retag_document(root, doc_id=doc.id, tags=["tag1"])
+
+    with open(journal.journal_path(root), "a") as out_file:
+        out_file.write('{"op": "delete", "doc_')
+
+    assert read_documents(root)[0].tags == ["tag1"]
+
+
+def test_appends_after_a_partially_written_operation(
+    root: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    doc = Document(title="My document")
+    write_documents(root=root, documents=[doc])
+
+    retag_document(root, doc_id=doc.id, tags=["tag1"])
+
+    with open(journal.journal_path(root), "a") as out_file:
+        out_file.write('{"op": "delete", "doc_')
+
+    retag_document(root, doc_id=doc.id, tags=["tag2"])
+
+    operations, _ = journal.read_operations(root)
+    assert [op["op"] for op in operations] == ["retag", "retag"]
+
+    # Read the journal from scratch, as a new process would
+    monkeypatch.setattr(docstore_documents, "_cached_documents", {})
+    assert read_documents(root)[0].tags == ["tag2"]
+
+
+def test_replaying_journal_on_compacted_snapshot_is_safe(
+    root: pathlib.Path,
+) -> None:
+    doc1 = Document(title="Doc1", tags=["tag1"])
+    doc2 = Document(title="Doc2", tags=["tag2"])
+    write_documents(root=root, documents=[doc1, doc2])
+
+    retag_document(root, doc_id=doc1.id, tags=["retagged"])
+    pairwise_merge_documents(
+        root, doc1=doc2, doc2=read_documents(root)[0], new_title="M", new_tags=[]
+    )
+    journal_contents = journal.journal_path(root).read_text()
+    expected = read_documents(root)
+
+    # Simulate a crash after the new snapshot is written, but before the
+    # journal is cleared.
+    compact_documents(root)
+    with open(journal.journal_path(root), "w") as out_file:
+        out_file.write(journal_contents)
+
+    assert read_documents(root) == expected
+
+
+def test_update_doesnt_bring_back_a_deleted_document() -> None:
+    doc1 = Document(title="Doc1")
+    doc2 = Document(title="Doc2")
+
+    documents = journal.apply_operations(
+        [doc1, doc2],
+        [
+            journal.update_operation(attr.evolve(doc1, title="Updated")),
+            journal.delete_operation(doc2.id),
+            journal.update_operation(attr.evolve(doc2, title="Updated")),
+        ],
+    )
+
+    assert documents == [attr.evolve(doc1, title="Updated")]
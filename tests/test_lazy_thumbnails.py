@@ -0,0 +1,198 @@
+import datetime
+import os
+import pathlib
+import shutil
+import threading
+import time
+
+import attrs
+import pytest
+from PIL import Image
+
+from docstore import lazy_thumbnails
+from docstore.documents import (
+    delete_document,
+    process_thumbnail_jobs,
+    read_documents,
+    read_index,
+    store_new_document,
+    write_documents,
+)
+from docstore.lazy_thumbnails import LazyThumbnailRenderer, lazy_variants
+from docstore.models import Dimensions, Document, File, Thumbnail
+
+
+@pytest.fixture
+def doc(tmpdir: pathlib.Path, root: pathlib.Path) -> Document:
+    """
+    A stored document whose thumbnail was created without any variants.
+    """
+    shutil.copyfile("tests/files/cluster.png", str(tmpdir / "cluster.png"))
+    store_new_document(
+        root=root,
+        path=tmpdir / "cluster.png",
+        title="My test document",
+        tags=[],
+        source_url=None,
+        date_saved=datetime.datetime.now(),
+    )
+
+    (doc,) = read_documents(root)
+    f = doc.files[0]
+
+    for v in f.thumbnail.variants:
+        os.unlink(root / v.path)
+
+    doc.files = [attrs.evolve(f, thumbnail=attrs.evolve(f.thumbnail, variants=[]))]
+    write_documents(root=root, documents=[doc])
+
+    return doc
+
+
+def test_lazy_variants() -> None:
+    thumbnail = Thumbnail(
+        path="thumbnails/c/cluster.png",
+        dimensions=Dimensions(400, 300),
+        tint_color="#ffffff",
+    )
+
+    assert lazy_variants(thumbnail) == [
+        ("thumbnails/c/cluster_100w.webp", Dimensions(100, 75), "webp"),
+        ("thumbnails/c/cluster_200w.webp", Dimensions(200, 150), "webp"),
+        ("thumbnails/c/cluster_400w.webp", Dimensions(400, 300), "webp"),
+    ]
+
+
+def test_creates_a_missing_thumbnail(root: pathlib.Path, doc: Document) -> None:
+    thumbnail_path = doc.files[0].thumbnail.path
+    os.unlink(root / thumbnail_path)
+
+    renderer = LazyThumbnailRenderer(root, max_size=400)
+
+    try:
+        assert renderer.render(read_index(root), thumbnail_path)
+    finally:
+        renderer.shutdown()
+
+    with Image.open(root / thumbnail_path) as im:
+        assert im.format == "PNG"
+
+
+def test_creates_a_variant(root: pathlib.Path, doc: Document) -> None:
+    renderer = LazyThumbnailRenderer(root, max_size=400)
+
+    try:
+        assert renderer.render(read_index(root), "thumbnails/c/cluster_200w.webp")
+    finally:
+        renderer.shutdown()
+
+    with Image.open(root / "thumbnails/c/cluster_200w.webp") as im:
+        assert im.format == "WEBP"
+        assert im.width == 200
+
+
+def test_deleting_a_document_deletes_its_lazy_variants(
+    root: pathlib.Path, doc: Document
+) -> None:
+    renderer = LazyThumbnailRenderer(root, max_size=400)
+
+    try:
+        assert renderer.render(read_index(root), "thumbnails/c/cluster_200w.webp")
+    finally:
+        renderer.shutdown()
+
+    delete_document(root, doc_id=doc.id)
+
+    assert not os.path.exists(root / "thumbnails/c/cluster_200w.webp")
+
+
+def test_replacing_a_placeholder_deletes_its_lazy_variants(
+    tmpdir: pathlib.Path, root: pathlib.Path
+) -> None:
+    shutil.copyfile("tests/files/cluster.png", str(tmpdir / "cluster.png"))
+    doc = store_new_document(
+        root=root,
+        path=tmpdir / "cluster.png",
+        title="My test document",
+        tags=[],
+        source_url=None,
+        date_saved=datetime.datetime.now(),
+        defer_thumbnails=True,
+    )
+
+    # The placeholder doesn't have any variants, so the web app
+    # creates them when they're requested.
+    (path, _, _) = lazy_variants(doc.files[0].thumbnail)[0]
+
+    renderer = LazyThumbnailRenderer(root, max_size=400)
+
+    try:
+        assert renderer.render(read_index(root), path)
+    finally:
+        renderer.shutdown()
+
+    assert os.path.exists(root / path)
+
+    process_thumbnail_jobs(root)
+
+    assert not os.path.exists(root / path)
+
+
+@pytest.mark.parametrize(
+    "path",
+    [
+        "thumbnails/c/doesnotexist.png",
+        "thumbnails/c/doesnotexist_200w.webp",
+        # We don't create variants of arbitrary sizes
+        "thumbnails/c/cluster_123w.webp",
+        "thumbnails/c/cluster_200w.gif",
+    ],
+)
+def test_ignores_unknown_thumbnails(
+    root: pathlib.Path, doc: Document, path: str
+) -> None:
+    renderer = LazyThumbnailRenderer(root, max_size=400)
+
+    try:
+        assert not renderer.render(read_index(root), path)
+    finally:
+        renderer.shutdown()
+
+    assert not os.path.exists(root / path)
+
+
+def test_coalesces_concurrent_requests(
+    root: pathlib.Path, doc: Document, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    thumbnail_path = doc.files[0].thumbnail.path
+    os.unlink(root / thumbnail_path)
+
+    calls = []
+
+    def slow_render_thumbnail(root: pathlib.Path, f: File, *, max_size: int) -> None:
+        calls.append(f)
+        time.sleep(0.5)
+        shutil.copyfile("tests/files/cluster.png", root / f.thumbnail.path)
+
+    monkeypatch.setattr(lazy_thumbnails, "render_thumbnail", slow_render_thumbnail)
+
+    renderer = LazyThumbnailRenderer(root, max_size=400)
+    index = read_index(root)
+
+    threads = [
+        threading.Thread(target=renderer.render, args=(index, thumbnail_path))
+        for _ in range(5)
+    ]
+
+    try:
+        for t in threads:
+            t.start()
+
+        for t in threads:
+            t.join()
+    finally:
+        renderer.shutdown()
+
+    assert len(calls) == 1
+    assert renderer.renders == 1
+    assert os.path.exists(root / thumbnail_path)
@@ -1,10 +1,23 @@
 import datetime
+import json
 import typing
 import uuid
 
+import cattr
 import pytest
 
-from docstore.models import Dimensions, Document, File, Thumbnail, from_json, to_json
+from docstore.models import (
+    Dimensions,
+    DocstoreEncoder,
+    Document,
+    File,
+    Thumbnail,
+    ThumbnailVariant,
+    from_json,
+    structure_document,
+    to_json,
+    unstructure_document,
+)
 
 
 def is_recent(ds: datetime.datetime) -> bool:
@@ -59,3 +72,45 @@ def test_can_serialise_document_to_json() -> None:
 def test_to_json_with_bad_list_is_typeerror(documents: typing.Any) -> None:
     with pytest.raises(TypeError, match=r"Expected type List\[Document\]!"):
         to_json(documents)
+
+
+def test_codec_matches_cattrs() -> None:
+    f = File(
+        filename="cats.jpg",
+        path="files/c/cats.jpg",
+        size=100,
+        checksum="sha256:123",
+        thumbnail=Thumbnail(
+            path="thumbnails/c/cats.jpg",
+            dimensions=Dimensions(400, 300),
+            tint_color="#ffffff",
+            variants=[
+                ThumbnailVariant(
+                    path="thumbnails/c/cats_100w.webp",
+                    format="webp",
+                    dimensions=Dimensions(100, 75),
+                )
+            ],
+        ),
+        source_url="https://example.org/cats.jpg",
+    )
+    doc = Document(title="A test document", tags=["cats", "pets"], files=[f])
+
+    assert json.dumps(unstructure_document(doc), sort_keys=True) == json.dumps(
+        cattr.unstructure(doc), sort_keys=True, cls=DocstoreEncoder
+    )
+    assert structure_document(unstructure_document(doc)) == doc
+
+
+def test_structured_documents_share_repeated_values() -> None:
+    documents = from_json(
+        to_json(
+            [
+                Document(title="Doc1", tags=["shared-tag"]),
+                Document(title="Doc2", tags=["shared-tag"]),
+            ]
+        )
+    )
+
+    assert documents[0].tags[0] is documents[1].tags[0]
+    assert not hasattr(documents[0], "__dict__")
@@ -0,0 +1,119 @@
+import pathlib
+import struct
+
+import pytest
+
+from docstore.models import Dimensions
+from docstore.mp4 import get_mp4_dimensions
+from docstore.thumbnails import get_dimensions
+
+IDENTITY_MATRIX = (0x10000, 0, 0, 0, 0x10000, 0, 0, 0, 0x40000000)
+ROTATE_90_MATRIX = (0, 0x10000, 0, -0x10000, 0, 0, 0, 0, 0x40000000)
+
+
+def box(box_type: bytes, *children: bytes) -> bytes:
+    payload = b"".join(children)
+    return struct.pack(">I4s", 8 + len(payload), box_type) + payload
+
+
+def tkhd(
+    width: int,
+    height: int,
+    *,
+    version: int = 0,
+    matrix: tuple[int, ...] = IDENTITY_MATRIX,
+) -> bytes:
+    if version == 0:
+        times = struct.pack(">IIIII", 0, 0, 1, 0, 1000)
+    else:
+        times = struct.pack(">QQIIQ", 0, 0, 1, 0, 1000)
+
+    return box(
+        b"tkhd",
+        bytes([version, 0, 0, 3]),
+        times,
+        bytes(16),
+        struct.pack(">9i", *matrix),
+        struct.pack(">II", width << 16, height << 16),
+    )
+
+
+def mp4(*tracks: bytes) -> bytes:
+    return (
+        box(b"ftyp", b"isom")
+        + box(b"moov", box(b"mvhd", bytes(100)), *(box(b"trak", t) for t in tracks))
+        + box(b"mdat", bytes(1000))
+    )
+
+
+def write_mp4(tmpdir: pathlib.Path, data: bytes) -> str:
+    path = str(tmpdir / "video.mp4")
+
+    with open(path, "wb") as out_file:
+        out_file.write(data)
+
+    return path
+
+
+def test_gets_dimensions_of_video_track(tmpdir: pathlib.Path) -> None:
+    path = write_mp4(tmpdir, mp4(tkhd(400, 300)))
+
+    assert get_mp4_dimensions(path) == Dimensions(width=400, height=300)
+
+
+def test_skips_tracks_without_dimensions(tmpdir: pathlib.Path) -> None:
+    path = write_mp4(tmpdir, mp4(tkhd(0, 0), tkhd(640, 360)))
+
+    assert get_mp4_dimensions(path) == Dimensions(width=640, height=360)
+
+
+def test_gets_dimensions_from_version_1_header(tmpdir: pathlib.Path) -> None:
+    path = write_mp4(tmpdir, mp4(tkhd(1920, 1080, version=1)))
+
+    assert get_mp4_dimensions(path) == Dimensions(width=1920, height=1080)
+
+
+def test_swaps_dimensions_of_rotated_video(tmpdir: pathlib.Path) -> None:
+    path = write_mp4(tmpdir, mp4(tkhd(1920, 1080, matrix=ROTATE_90_MATRIX)))
+
+    assert get_mp4_dimensions(path) == Dimensions(width=1080, height=1920)
+
+
+def test_finds_moov_after_large_mdat(tmpdir: pathlib.Path) -> None:
+    # An mdat box with a 64-bit size, followed by the moov box -- this is
+    # what you get from ffmpeg without ``-movflags faststart``.
+    mdat = struct.pack(">I4sQ", 1, b"mdat", 16 + 5000) + bytes(5000)
+    moov = box(b"moov", box(b"trak", tkhd(400, 300)))
+
+    path = write_mp4(tmpdir, box(b"ftyp", b"isom") + mdat + moov)
+
+    assert get_mp4_dimensions(path) == Dimensions(width=400, height=300)
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        pytest.param(mp4(tkhd(0, 0)), id="no_video_track"),
+        pytest.param(mp4(tkhd(400, 300))[:60], id="truncated"),
+        pytest.param(b"not an mp4 file", id="not_mp4"),
+        pytest.param(struct.pack(">I4s", 4, b"moov"), id="invalid_box_size"),
+    ],
+)
+def test_unreadable_mp4_is_error(tmpdir: pathlib.Path, data: bytes) -> None:
+    path = write_mp4(tmpdir, data)
+
+    with pytest.raises(ValueError):
+        get_mp4_dimensions(path)
+
+
+def test_get_dimensions_reads_mp4_header(
+    tmpdir: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    path = write_mp4(tmpdir, mp4(tkhd(400, 300)))
+
+    def check_output(*args: object, **kwargs: object) -> bytes:
+        raise AssertionError("Should not run ffprobe")
+
+    monkeypatch.setattr("subprocess.check_output", check_output)
+
+    assert get_dimensions(path) == Dimensions(width=400, height=300)
@@ -0,0 +1,65 @@
+import time
+
+from docstore.page_cache import PageCache
+
+
+def test_caches_pages() -> None:
+    cache = PageCache(max_entries=10, max_bytes=1000)
+
+    assert cache.get("v1", "/") is None
+    cache.put("v1", "/", "<p>hello world</p>")
+    assert cache.get("v1", "/") == "<p>hello world</p>"
+
+    assert cache.stats() == {"hits": 1, "misses": 1, "entries": 1, "size": 18}
+
+
+def test_evicts_least_recently_used_pages() -> None:
+    cache = PageCache(max_entries=2, max_bytes=1000)
+
+    cache.put("v1", "/?page=1", "page 1")
+    cache.put("v1", "/?page=2", "page 2")
+
+    # Use page 1, so page 2 is the least recently used
+    assert cache.get("v1", "/?page=1") == "page 1"
+
+    cache.put("v1", "/?page=3", "page 3")
+
+    assert cache.get("v1", "/?page=1") == "page 1"
+    assert cache.get("v1", "/?page=2") is None
+    assert cache.get("v1", "/?page=3") == "page 3"
+
+
+def test_limits_the_size_in_bytes() -> None:
+    cache = PageCache(max_entries=10, max_bytes=10)
+
+    cache.put("v1", "a", "12345")
+    cache.put("v1", "b", "12345")
+    cache.put("v1", "c", "12345")
+    assert cache.stats()["entries"] == 2
+    assert cache.get("v1", "a") is None
+
+    # A page that's bigger than the whole cache is never stored
+    cache.put("v1", "d", "x" * 11)
+    assert cache.get("v1", "d") is None
+    assert cache.get("v1", "c") == "12345"
+
+
+def test_forgets_pages_when_the_version_changes() -> None:
+    cache = PageCache(max_entries=10, max_bytes=1000)
+
+    cache.put("v1", "/", "old page")
+    assert cache.get("v2", "/") is None
+
+    # Going back to an old version doesn't bring back the old pages
+    assert cache.get("v1", "/") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_pages_expire() -> None:
+    cache = PageCache(max_entries=10, max_bytes=1000, max_age=0.05)
+
+    cache.put("v1", "/", "page")
+    time.sleep(0.1)
+
+    assert cache.get("v1", "/") is None
+    assert cache.stats()["size"] == 0
@@ -10,8 +10,15 @@ from flask.testing import FlaskClient
 import pytest
 
 from docstore.documents import store_new_document, write_documents
-from docstore.models import Document
-from docstore.server import create_app
+from docstore.models import Dimensions, Document, Thumbnail
+from docstore.page_cache import PageCache
+from docstore.server import (
+    content_version,
+    create_app,
+    thumbnail_sources,
+    thumbnail_version,
+)
+from docstore.thumbnails import GENERIC_THUMBNAIL_PATH
 
 
 @pytest.fixture
@@ -56,6 +63,89 @@ def test_shows_documents(
     assert resp.data == open("tests/files/cluster.png", "rb").read()
 
 
+def test_serves_thumbnail_variants_with_srcset(
+    tmpdir: pathlib.Path, root: pathlib.Path, client: FlaskClient
+) -> None:
+    shutil.copyfile("tests/files/cluster.png", str(tmpdir / "cluster.png"))
+    doc = store_new_document(
+        root=root,
+        path=tmpdir / "cluster.png",
+        title="My test document",
+        tags=[],
+        source_url=None,
+        date_saved=datetime.datetime.now(),
+    )
+    version = thumbnail_version(root, doc.files[0].thumbnail)
+    assert version is not None
+
+    resp = client.get("/")
+    soup = bs4.BeautifulSoup(resp.data, "html.parser")
+
+    source = soup.select_one("picture source")
+    assert isinstance(source, bs4.Tag)
+    assert source.attrs["type"] == "image/webp"
+    assert source.attrs["srcset"] == (
+        f"/thumbnails/c/cluster-100w.webp?v={version} 100w, "
+        f"/thumbnails/c/cluster-200w.webp?v={version} 200w, "
+        f"/thumbnails/c/cluster-400w.webp?v={version} 400w"
+    )
+    assert source.attrs["sizes"] == "200px"
+
+    resp = client.get("/thumbnails/c/cluster-200w.webp")
+    assert resp.data[8:12] == b"WEBP"
+
+
+def test_links_to_lazy_variants() -> None:
+    thumbnail = Thumbnail(
+        path="thumbnails/c/cluster.png",
+        dimensions=Dimensions(400, 300),
+        tint_color="#ffffff",
+    )
+
+    assert thumbnail_sources(thumbnail) == []
+    assert thumbnail_sources(thumbnail, lazy=True) == [
+        {
+            "type": "image/webp",
+            "srcset": (
+                "/thumbnails/c/cluster_100w.webp 100w, "
+                "/thumbnails/c/cluster_200w.webp 200w, "
+                "/thumbnails/c/cluster_400w.webp 400w"
+            ),
+        }
+    ]
+
+
+def test_creates_missing_thumbnails_on_request(
+    tmpdir: pathlib.Path, root: pathlib.Path
+) -> None:
+    shutil.copyfile("tests/files/cluster.png", str(tmpdir / "cluster.png"))
+    store_new_document(
+        root=root,
+        path=tmpdir / "cluster.png",
+        title="My test document",
+        tags=[],
+        source_url=None,
+        date_saved=datetime.datetime.now(),
+    )
+    shutil.rmtree(root / "thumbnails")
+
+    app = create_app(
+        root=root, title="My test instance", thumbnail_width=200, lazy_thumbnails=True
+    )
+
+    with app.test_client() as client:
+        resp = client.get("/thumbnails/c/cluster.png")
+        assert resp.data[:8] == b"\x89\x50\x4e\x47\x0d\x0a\x1a\x0a"
+
+        resp = client.get("/thumbnails/c/cluster-200w.webp")
+        assert resp.data[8:12] == b"WEBP"
+
+        resp = client.get("/thumbnails/c/doesnotexist.png")
+        assert resp.status_code == 404
+
+    assert (root / "thumbnails/c/cluster-200w.webp").exists()
+
+
 def test_filters_documents_by_tag(root: pathlib.Path, client: FlaskClient) -> None:
     documents = [Document(title=f"Document {i}", tags=[f"tag{i}"]) for i in range(3)]
     write_documents(root=root, documents=documents)
@@ -89,6 +179,194 @@ def test_paginates_document(root: pathlib.Path, client: FlaskClient) -> None:
     assert b"Document 0" in resp_page_2.data
 
 
+def test_caches_rendered_pages(root: pathlib.Path, client: FlaskClient) -> None:
+    write_documents(root=root, documents=[Document(title="Document 1")])
+
+    resp = client.get("/")
+    assert b"Document 1" in resp.data
+
+    resp = client.get("/")
+    assert b"Document 1" in resp.data
+
+    page_cache = client.application.extensions["docstore_page_cache"]
+    assert (page_cache.hits, page_cache.misses) == (1, 1)
+
+    # When the documents change, the cached page is thrown away
+    write_documents(
+        root=root,
+        documents=[Document(title="Document 1"), Document(title="Document 2")],
+    )
+
+    resp = client.get("/")
+    assert b"Document 2" in resp.data
+    assert (page_cache.hits, page_cache.misses) == (1, 2)
+
+
+def test_random_order_is_not_cached_between_seeds(
+    root: pathlib.Path, client: FlaskClient
+) -> None:
+    write_documents(
+        root=root, documents=[Document(title=f"Document {i}") for i in range(200)]
+    )
+
+    page_cache = client.application.extensions["docstore_page_cache"]
+
+    client.get("/?sortBy=random")
+    client.get("/?sortBy=random&page=2")
+    client.get("/?sortBy=random&page=2")
+
+    # Loading the first page picks a new random order, so page 2 changes
+    client.get("/?sortBy=random")
+    client.get("/?sortBy=random&page=2")
+
+    # The first page is never cached, because nobody can load it again
+    stats = page_cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 2, 2)
+
+    resp = client.get("/?sortBy=random")
+    assert "ETag" not in resp.headers
+
+
+def test_index_supports_conditional_requests(
+    root: pathlib.Path, client: FlaskClient
+) -> None:
+    write_documents(root=root, documents=[Document(title="Document 1")])
+
+    resp = client.get("/")
+    assert resp.status_code == 200
+    etag = resp.headers["ETag"]
+    assert resp.headers["Cache-Control"] == "no-cache"
+
+    resp = client.get("/", headers={"If-None-Match": etag})
+    assert resp.status_code == 304
+    assert resp.data == b""
+
+    # A different query string is a different page
+    resp = client.get("/?tag=cats", headers={"If-None-Match": etag})
+    assert resp.status_code == 200
+
+    # When the documents change, so does the ETag
+    write_documents(
+        root=root,
+        documents=[Document(title="Document 1"), Document(title="Document 2")],
+    )
+
+    resp = client.get("/", headers={"If-None-Match": etag})
+    assert resp.status_code == 200
+    assert b"Document 2" in resp.data
+
+
+def test_files_and_thumbnails_support_conditional_requests(
+    tmpdir: pathlib.Path, root: pathlib.Path, client: FlaskClient
+) -> None:
+    shutil.copyfile("tests/files/cluster.png", str(tmpdir / "cluster.png"))
+    doc = store_new_document(
+        root=root,
+        path=tmpdir / "cluster.png",
+        title="My test document",
+        tags=[],
+        source_url=None,
+        date_saved=datetime.datetime.now(),
+    )
+    f = doc.files[0]
+
+    for url, version in [
+        (f"/{f.path}", content_version(f)),
+        (f"/{f.thumbnail.path}", thumbnail_version(root, f.thumbnail)),
+    ]:
+        resp = client.get(url)
+        assert resp.status_code == 200
+        assert resp.headers["Cache-Control"] == "no-cache"
+        etag = resp.headers["ETag"]
+
+        resp = client.get(url, headers={"If-None-Match": etag})
+        assert resp.status_code == 304
+        assert resp.headers["ETag"] == etag
+
+        # With the content version in the URL, the browser can cache
+        # the file forever.
+        resp = client.get(f"{url}?v={version}")
+        assert resp.status_code == 200
+        assert resp.headers["Cache-Control"] == "public, max-age=31536000, immutable"
+
+    # The thumbnail has its own version, so an out-of-date version isn't
+    # cached forever.
+    resp = client.get(f"/{f.thumbnail.path}?v={content_version(f)}")
+    assert resp.headers["Cache-Control"] == "no-cache"
+
+    resp = client.get(f"/{f.path}")
+    assert resp.headers["ETag"] == f'"{f.checksum.split(":")[1]}"'
+
+    resp = client.get(
+        f"/{f.path}", headers={"If-Modified-Since": resp.headers["Last-Modified"]}
+    )
+    assert resp.status_code == 304
+
+    resp = client.get("/files/c/doesnotexist.png")
+    assert resp.status_code == 404
+
+
+def test_thumbnail_version_changes_when_the_thumbnail_is_replaced(
+    tmpdir: pathlib.Path, root: pathlib.Path
+) -> None:
+    shutil.copyfile("tests/files/cluster.png", str(tmpdir / "cluster.png"))
+    doc = store_new_document(
+        root=root,
+        path=tmpdir / "cluster.png",
+        title="My test document",
+        tags=[],
+        source_url=None,
+        date_saved=datetime.datetime.now(),
+    )
+    thumbnail = doc.files[0].thumbnail
+    version = thumbnail_version(root, thumbnail)
+
+    # e.g. the thumbnail was deleted, then something else was created
+    # at the same path
+    (root / thumbnail.path).unlink()
+    assert thumbnail_version(root, thumbnail) is None
+
+    shutil.copyfile(GENERIC_THUMBNAIL_PATH, root / thumbnail.path)
+    assert thumbnail_version(root, thumbnail) not in {None, version}
+
+
+def test_index_etag_changes_when_the_cached_page_expires(
+    root: pathlib.Path, client: FlaskClient, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    write_documents(root=root, documents=[Document(title="Document 1")])
+
+    monkeypatch.setattr(PageCache, "time_bucket", lambda self: 1)
+    etag = client.get("/").headers["ETag"]
+
+    # The page includes relative dates, so once our cached copy has
+    # expired, so has the browser's.
+    monkeypatch.setattr(PageCache, "time_bucket", lambda self: 2)
+    resp = client.get("/", headers={"If-None-Match": etag})
+    assert resp.status_code == 200
+    assert resp.headers["ETag"] != etag
+
+
+def test_paginates_filtered_documents(root: pathlib.Path, client: FlaskClient) -> None:
+    documents = [
+        Document(
+            title=f"Document {i}",
+            tags=["even" if i % 2 == 0 else "odd"],
+            date_saved=datetime.datetime(2001, 1, 1) + datetime.timedelta(days=i),
+        )
+        for i in range(300)
+    ]
+    write_documents(root=root, documents=documents)
+
+    resp = client.get("/?tag=even&sortBy=date (oldest first)&page=2")
+    assert resp.status_code == 200
+
+    soup = bs4.BeautifulSoup(resp.data, "html.parser")
+    titles = [h2.text.split("(")[0].strip() for h2 in soup.select("h2.title")]
+    assert titles == [f"Document {i}" for i in range(200, 300, 2)]
+
+    assert "showing documents 101&ndash;150 of 150." in resp.data.decode("utf8")
+
+
 def test_documents_with_lots_of_tags(root: pathlib.Path, client: FlaskClient) -> None:
     documents = [Document(title=f"Document {i}", tags=[f"tag{i}"]) for i in range(200)]
 
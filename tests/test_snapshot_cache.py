@@ -0,0 +1,46 @@
+import os
+import pathlib
+
+import pytest
+
+from docstore import snapshot_cache
+from docstore.documents import db_path, write_documents
+from docstore.models import Document
+from docstore.snapshot_cache import cache_path, read_snapshot
+
+
+def test_reads_documents_from_cache(
+    root: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    documents = [Document(title="My first document")]
+    write_documents(root=root, documents=documents)
+
+    assert read_snapshot(root, path=db_path(root)) == documents
+    assert os.path.exists(cache_path(root))
+
+    def no_parsing(json_string: str) -> list[Document]:
+        raise AssertionError("Should be reading from the cache!")
+
+    monkeypatch.setattr(snapshot_cache, "from_json", no_parsing)
+
+    assert read_snapshot(root, path=db_path(root)) == documents
+
+
+def test_regenerates_stale_cache(root: pathlib.Path) -> None:
+    write_documents(root=root, documents=[Document(title="Old document")])
+    read_snapshot(root, path=db_path(root))
+
+    new_documents = [Document(title="New document")]
+    write_documents(root=root, documents=new_documents)
+
+    assert read_snapshot(root, path=db_path(root)) == new_documents
+
+
+def test_ignores_corrupted_cache(root: pathlib.Path) -> None:
+    documents = [Document(title="My first document")]
+    write_documents(root=root, documents=documents)
+
+    with open(cache_path(root), "wb") as out_file:
+        out_file.write(b"not a pickle")
+
+    assert read_snapshot(root, path=db_path(root)) == documents
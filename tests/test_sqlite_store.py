@@ -0,0 +1,144 @@
+import datetime
+import os
+import pathlib
+
+import attr
+
+from docstore import journal
+from docstore.documents import (
+    _record_operations,
+    db_path,
+    delete_document,
+    migrate_backend,
+    pairwise_merge_documents,
+    read_documents,
+    retag_document,
+    uses_sqlite,
+    write_documents,
+)
+from docstore.models import Dimensions, Document, File, Thumbnail, ThumbnailVariant
+from docstore.sqlite_store import (
+    data_version,
+    read_document,
+    read_files_with_checksum,
+    sqlite_path,
+)
+
+
+def create_document(i: int) -> Document:
+    return Document(
+        title=f"Document {i}",
+        date_saved=datetime.datetime(2020, 1, i + 1),
+        tags=[f"tag{i}", "shared"],
+        files=[
+            File(
+                filename=f"cats{i}.jpg",
+                path=f"files/c/cats{i}.jpg",
+                size=100,
+                checksum="sha256:123",
+                thumbnail=Thumbnail(
+                    path=f"thumbnails/c/cats{i}.jpg",
+                    dimensions=Dimensions(400, 300),
+                    tint_color="#ffffff",
+                    variants=[
+                        ThumbnailVariant(
+                            path=f"thumbnails/c/cats{i}-100w.webp",
+                            format="webp",
+                            dimensions=Dimensions(100, 75),
+                        )
+                    ],
+                ),
+                source_url=None if i % 2 else "https://example.org/cats.jpg",
+            )
+        ],
+    )
+
+
+def test_can_migrate_to_sqlite_and_back(root: pathlib.Path) -> None:
+    documents = [create_document(i) for i in range(3)]
+    write_documents(root=root, documents=documents)
+
+    migrate_backend(root, to="sqlite")
+
+    assert uses_sqlite(root)
+    assert not os.path.exists(db_path(root))
+    assert sorted(read_documents(root), key=lambda d: d.id) == sorted(
+        documents, key=lambda d: d.id
+    )
+
+    migrate_backend(root, to="json")
+
+    assert not uses_sqlite(root)
+    assert not os.path.exists(sqlite_path(root))
+    assert sorted(read_documents(root), key=lambda d: d.id) == sorted(
+        documents, key=lambda d: d.id
+    )
+
+
+def test_changes_are_saved_to_sqlite(root: pathlib.Path) -> None:
+    doc1, doc2 = [create_document(i) for i in range(2)]
+    doc3 = Document(title="Document 3")
+    write_documents(root=root, documents=[doc1, doc2, doc3])
+    migrate_backend(root, to="sqlite")
+
+    retag_document(root, doc_id=doc3.id, tags=["new_tag"])
+    pairwise_merge_documents(
+        root, doc1=doc1, doc2=doc2, new_title="Merged", new_tags=["merged"]
+    )
+    delete_document(root, doc_id=doc3.id)
+
+    stored_documents = read_documents(root)
+
+    assert len(stored_documents) == 1
+    assert stored_documents[0].id == doc1.id
+    assert stored_documents[0].title == "Merged"
+    assert stored_documents[0].tags == ["merged"]
+    assert stored_documents[0].files == doc1.files + doc2.files
+
+
+def test_updates_are_saved_to_sqlite(root: pathlib.Path) -> None:
+    doc1, doc2 = [create_document(i) for i in range(2)]
+    write_documents(root=root, documents=[doc1, doc2])
+    migrate_backend(root, to="sqlite")
+
+    thumbnail = attr.evolve(doc1.files[0].thumbnail, variants=[])
+    updated = attr.evolve(doc1, files=[attr.evolve(doc1.files[0], thumbnail=thumbnail)])
+
+    _record_operations(
+        root,
+        [
+            journal.update_operation(updated),
+            journal.delete_operation(doc2.id),
+            journal.update_operation(doc2),
+        ],
+    )
+
+    assert read_documents(root) == [updated]
+
+
+def test_data_version_changes_when_the_documents_change(root: pathlib.Path) -> None:
+    write_documents(root=root, documents=[create_document(0)])
+    migrate_backend(root, to="sqlite")
+
+    version = data_version(sqlite_path(root))
+    assert data_version(sqlite_path(root)) == version
+
+    retag_document(root, doc_id=read_documents(root)[0].id, tags=["new_tag"])
+
+    assert data_version(sqlite_path(root)) != version
+    assert read_documents(root)[0].tags == ["new_tag"]
+
+
+def test_can_read_single_documents_and_files(root: pathlib.Path) -> None:
+    doc1, doc2, doc3 = [create_document(i) for i in range(3)]
+    doc2 = attr.evolve(doc2, files=[attr.evolve(doc2.files[0], checksum="sha256:456")])
+    write_documents(root=root, documents=[doc1, doc2, doc3])
+    migrate_backend(root, to="sqlite")
+
+    assert read_document(sqlite_path(root), doc2.id) == doc2
+    assert read_document(sqlite_path(root), "doesnotexist") is None
+
+    assert sorted(
+        read_files_with_checksum(sqlite_path(root), "sha256:123"), key=lambda f: f.id
+    ) == sorted(doc1.files + doc3.files, key=lambda f: f.id)
+    assert read_files_with_checksum(sqlite_path(root), "sha256:789") == []
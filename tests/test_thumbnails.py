@@ -1,43 +1,61 @@
+import os
 import pathlib
+import tempfile
 
 from PIL import Image
 import pytest
 
-from docstore.thumbnails import create_thumbnail, get_dimensions
+from docstore import thumbnails
+from docstore.models import Dimensions
+from docstore.thumbnails import (
+    GENERIC,
+    ThumbnailResult,
+    Thumbnailer,
+    create_thumbnail,
+    create_thumbnail_variants,
+    get_dimensions,
+    get_file_type,
+    get_thumbnailer_timings,
+    reset_thumbnailer_timings,
+)
 
 
 @pytest.mark.parametrize(
     "filename", ["Newtons_cradle.gif", "Rotating_earth_(large).gif"]
 )
 def test_creates_thumbnail_of_animated_gif(filename: str) -> None:
-    path = create_thumbnail(f"tests/files/{filename}", max_size=400)
-    assert path.endswith(".mp4")
+    result = create_thumbnail(f"tests/files/{filename}", max_size=400)
+    assert result["path"].endswith(".mp4")
+    assert result["dimensions"] == get_dimensions(result["path"])
 
 
 def test_creates_thumbnail_of_single_frame_gif() -> None:
-    path = create_thumbnail(
+    result = create_thumbnail(
         "tests/files/Rotating_earth_(large)_singleframe.gif", max_size=400
     )
-    assert path.endswith(".png")
+    assert result["path"].endswith(".png")
 
-    im = Image.open(path)
+    im = Image.open(result["path"])
     assert im.size == (400, 400)
+    assert result["dimensions"] == Dimensions(400, 400)
 
 
 def test_creates_thumbnail_of_png() -> None:
-    path = create_thumbnail("tests/files/cluster.png", max_size=250)
-    assert path.endswith("/cluster.png")
+    result = create_thumbnail("tests/files/cluster.png", max_size=250)
+    assert result["path"].endswith("/cluster.png")
 
-    im = Image.open(path)
+    im = Image.open(result["path"])
     assert im.size == (250, 162)
+    assert result["dimensions"] == Dimensions(250, 162)
 
 
 def test_creates_thumbnail_of_pdf() -> None:
-    path = create_thumbnail("tests/files/snakes.pdf", max_size=350)
-    assert path.endswith("/snakes.pdf.png")
+    result = create_thumbnail("tests/files/snakes.pdf", max_size=350)
+    assert result["path"].endswith("/snakes.pdf.png")
 
-    im = Image.open(path)
+    im = Image.open(result["path"])
     assert im.size == (247, 350)
+    assert result["dimensions"] == Dimensions(247, 350)
 
 
 def test_creates_thumbnail_if_no_quicklook_plugin_available(
@@ -48,7 +66,113 @@ def test_creates_thumbnail_if_no_quicklook_plugin_available(
     with open(path, "wb") as outfile:
         outfile.write(b"SQLite format 3\x00")
 
-    path = create_thumbnail(path)
+    create_thumbnail(path)
+
+
+def test_creates_thumbnail_of_large_jpeg(tmpdir: pathlib.Path) -> None:
+    path = str(tmpdir / "photo.jpg")
+    Image.new("RGB", (4000, 3000), color="red").save(path)
+
+    reset_thumbnailer_timings()
+    result = create_thumbnail(path, max_size=400)
+    assert result["path"].endswith("/photo.jpg.png")
+
+    im = Image.open(result["path"])
+    assert im.size == (400, 300)
+    assert result["dimensions"] == Dimensions(400, 300)
+
+    assert get_thumbnailer_timings()["Pillow"]["calls"] == 1
+
+
+def test_thumbnail_respects_exif_orientation(tmpdir: pathlib.Path) -> None:
+    path = str(tmpdir / "rotated.jpg")
+
+    im = Image.new("RGB", (800, 600))
+    exif = im.getexif()
+    exif[0x0112] = 6  # Orientation: rotate 90 degrees
+    im.save(path, exif=exif)
+
+    thumbnail = Image.open(create_thumbnail(path, max_size=400)["path"])
+    assert thumbnail.size == (300, 400)
+
+
+@pytest.mark.parametrize(
+    ["filename", "file_type"],
+    [
+        ("cluster.png", "image"),
+        ("Rotating_earth_(large)_singleframe.gif", "image"),
+        ("Newtons_cradle.gif", "animated_gif"),
+        ("snakes.pdf", "pdf"),
+        ("credits.txt", "other"),
+    ],
+)
+def test_gets_file_type(filename: str, file_type: str) -> None:
+    assert get_file_type(f"tests/files/{filename}") == file_type
+
+
+def test_gets_file_type_of_video(tmpdir: pathlib.Path) -> None:
+    path = str(tmpdir / "movie.mp4")
+    open(path, "wb").close()
+
+    assert get_file_type(path) == "video"
+
+
+def _fail(*, path: str, max_size: int, out_dir: str) -> ThumbnailResult:
+    raise ValueError("BOOM!")
+
+
+def test_falls_back_to_next_thumbnailer_if_one_fails(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setitem(
+        thumbnails.THUMBNAILERS,
+        "image",
+        [Thumbnailer(name="broken", create=_fail), GENERIC],
+    )
+
+    reset_thumbnailer_timings()
+    result = create_thumbnail("tests/files/cluster.png")
+    assert result["path"].endswith("/generic_document.png")
+
+    timings = get_thumbnailer_timings()
+    assert timings["broken"]["calls"] == 1
+    assert timings["broken"]["failures"] == 1
+    assert timings["generic icon"]["failures"] == 0
+
+
+def test_cleans_up_after_a_thumbnailer_fails(
+    tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    monkeypatch.setitem(
+        thumbnails.THUMBNAILERS,
+        "image",
+        [Thumbnailer(name="broken", create=_fail), GENERIC],
+    )
+
+    result = create_thumbnail("tests/files/cluster.png")
+
+    # Only the directory with the thumbnail we created is left behind
+    assert os.listdir(tmp_path) == [os.path.basename(os.path.dirname(result["path"]))]
+
+
+def test_skips_thumbnailers_that_arent_installed(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setitem(
+        thumbnails.THUMBNAILERS,
+        "image",
+        [
+            Thumbnailer(name="missing", create=_fail, executable="not-a-real-program"),
+            GENERIC,
+        ],
+    )
+
+    reset_thumbnailer_timings()
+    result = create_thumbnail("tests/files/cluster.png")
+    assert result["path"].endswith("/generic_document.png")
+
+    assert "missing" not in get_thumbnailer_timings()
 
 
 def test_gets_dimensions_of_an_image() -> None:
@@ -58,8 +182,41 @@ def test_gets_dimensions_of_an_image() -> None:
 
 
 def test_gets_dimensions_of_a_video() -> None:
-    thumbnail_path = create_thumbnail("tests/files/Newtons_cradle.gif")
+    thumbnail_path = create_thumbnail("tests/files/Newtons_cradle.gif")["path"]
 
     dimensions = get_dimensions(thumbnail_path)
     assert dimensions.width == 400
     assert dimensions.height == 300
+
+
+def test_creates_thumbnail_variants() -> None:
+    variants = create_thumbnail_variants("tests/files/cluster.png", sizes=[100, 200])
+
+    assert [(v["format"], v["dimensions"]) for v in variants] == [
+        ("webp", Dimensions(100, 65)),
+        ("webp", Dimensions(200, 130)),
+    ]
+
+    for v in variants:
+        assert v["path"].endswith(f"_{v['dimensions'].width}w.webp")
+
+        im = Image.open(v["path"])
+        assert im.format == "WEBP"
+        assert Dimensions(*im.size) == v["dimensions"]
+
+
+def test_doesnt_scale_up_thumbnail_variants(tmpdir: pathlib.Path) -> None:
+    Image.new("RGB", (150, 100)).save(str(tmpdir / "small.png"))
+
+    variants = create_thumbnail_variants(
+        str(tmpdir / "small.png"), sizes=[100, 200, 400]
+    )
+
+    assert [v["dimensions"] for v in variants] == [
+        Dimensions(100, 66),
+        Dimensions(150, 100),
+    ]
+
+
+def test_video_thumbnails_dont_have_variants() -> None:
+    assert create_thumbnail_variants("tests/files/thumbnail.mp4") == []
@@ -1,15 +1,25 @@
+import pathlib
+import shutil
+
+import numpy as np
+from PIL import Image
 import pytest
+import wcag_contrast_ratio as contrast
 
 from docstore.thumbnails import create_thumbnail
 from docstore.tint_colors import (
     Color,
+    _contrast_ratios,
+    _dominant_colors_from_subprocess,
+    choose_tint_color_for_file,
     choose_tint_color_from_dominant_colors,
     choose_tint_color,
+    get_dominant_colors,
 )
 
 
 def test_choose_tint_color() -> None:
-    thumbnail_path = create_thumbnail("tests/files/Newtons_cradle.gif")
+    thumbnail_path = create_thumbnail("tests/files/Newtons_cradle.gif")["path"]
 
     tint_color = choose_tint_color(
         thumbnail_path=thumbnail_path, file_path="tests/files/Newtons_cradle.gif"
@@ -36,3 +46,76 @@ def test_selects_black_or_white_if_unsufficient_contrast(
         )
         == expected_tint
     )
+
+
+def test_chooses_the_brightest_color_with_sufficient_contrast() -> None:
+    assert choose_tint_color_from_dominant_colors(
+        dominant_colors=[(0.1, 0.1, 0.1), (0, 0, 0.6), (0.9, 0.9, 0), (0.4, 0, 0)],
+        background_color=(1, 1, 1),
+    ) == (0, 0, 0.6)
+
+
+def test_contrast_ratios_match_wcag_contrast_ratio() -> None:
+    colors = np.random.default_rng(seed=1).random((100, 3))
+    background_color = (0.9, 0.8, 0.7)
+
+    expected = [contrast.rgb(tuple(c), background_color) for c in colors]
+
+    assert np.allclose(_contrast_ratios(colors, background_color), expected)
+
+
+def test_gets_dominant_colors_of_an_image(tmpdir: pathlib.Path) -> None:
+    path = str(tmpdir / "red_and_blue.png")
+
+    im = Image.new("RGB", (100, 50), color=(255, 0, 0))
+    im.paste((0, 0, 255), (50, 0, 100, 50))
+    im.save(path)
+
+    assert sorted(get_dominant_colors(path)) == [(0, 0, 1), (1, 0, 0)]
+
+
+def test_ignores_transparent_pixels(tmpdir: pathlib.Path) -> None:
+    path = str(tmpdir / "mostly_transparent.png")
+
+    im = Image.new("RGBA", (100, 100), color=(0, 0, 0, 0))
+    im.paste((0, 128, 0, 255), (0, 0, 10, 10))
+    im.save(path)
+
+    assert get_dominant_colors(path) == [(0, 128 / 255, 0)]
+
+
+def test_tint_color_of_cluster_png() -> None:
+    # Unlike the comparison with the ``dominant_colours`` tool below, this
+    # pins the exact colour, and runs even if the tool isn't installed.
+    tint_color = choose_tint_color_for_file("tests/files/cluster.png")
+
+    r, g, b = (int(c * 255) for c in tint_color)
+    assert f"#{r:02x}{g:02x}{b:02x}" == "#007f7f"
+
+
+@pytest.mark.skipif(
+    shutil.which("dominant_colours") is None,
+    reason="dominant_colours is not installed",
+)
+@pytest.mark.parametrize(
+    "filename",
+    [
+        "cluster.png",
+        "cluster_segment.png",
+        "Newtons_cradle.gif",
+        "Rotating_earth_(large).gif",
+        "Rotating_earth_(large)_singleframe.gif",
+    ],
+)
+def test_tint_color_is_close_to_dominant_colours_tool(filename: str) -> None:
+    path = f"tests/files/{filename}"
+
+    expected = choose_tint_color_from_dominant_colors(
+        dominant_colors=_dominant_colors_from_subprocess(path, max_colors=12),
+        background_color=(1, 1, 1),
+    )
+    actual = choose_tint_color_for_file(path)
+
+    # A distance of 0.1 is about 25 in each of the 0-255 RGB components,
+    # which is hard to tell apart in a tint colour.
+    assert np.linalg.norm(np.array(actual) - np.array(expected)) < 0.1
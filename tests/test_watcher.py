@@ -0,0 +1,41 @@
+import pathlib
+import queue
+
+import pytest
+
+from docstore.documents import write_documents
+from docstore.indexes import DocumentIndex
+from docstore.models import Document
+from docstore.watcher import DocumentWatcher
+
+
+@pytest.mark.parametrize("use_inotify", [True, False])
+def test_reloads_documents_when_they_change(
+    root: pathlib.Path, use_inotify: bool
+) -> None:
+    write_documents(root=root, documents=[Document(title="Old document")])
+
+    reloads: queue.Queue[DocumentIndex] = queue.Queue()
+
+    watcher = DocumentWatcher(
+        root,
+        on_reload=lambda index, elapsed: reloads.put(index),
+        poll_interval=0.05,
+        use_inotify=use_inotify,
+    )
+    watcher.start()
+
+    try:
+        # The watcher loads the documents as soon as it starts...
+        assert [d.title for d in reloads.get(timeout=5).documents] == ["Old document"]
+
+        # ...and again whenever they change, building the indexes as it goes.
+        new_document = Document(title="New document")
+        write_documents(root=root, documents=[new_document])
+
+        index = reloads.get(timeout=5)
+        assert index.documents == [new_document]
+        assert "by_id" in index.__dict__
+    finally:
+        watcher.stop()
+        watcher.join()
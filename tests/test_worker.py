@@ -0,0 +1,37 @@
+import datetime
+import pathlib
+import queue
+import shutil
+
+from docstore.documents import ThumbnailJobResults, read_documents, store_new_document
+from docstore.worker import ThumbnailWorker
+
+
+def test_creates_deferred_thumbnails_in_the_background(
+    tmpdir: pathlib.Path, root: pathlib.Path
+) -> None:
+    runs: queue.Queue[ThumbnailJobResults] = queue.Queue()
+
+    worker = ThumbnailWorker(root, on_results=runs.put, poll_interval=0.05)
+    worker.start()
+
+    try:
+        shutil.copyfile(src="tests/files/cluster.png", dst=tmpdir / "cluster.png")
+        doc = store_new_document(
+            root=root,
+            path=tmpdir / "cluster.png",
+            title="A document with a deferred thumbnail",
+            tags=[],
+            source_url=None,
+            date_saved=datetime.datetime.now(),
+            defer_thumbnails=True,
+        )
+
+        results = runs.get(timeout=10)
+        assert results["updated"] == doc.files
+    finally:
+        worker.stop()
+        worker.join()
+
+    (stored_doc,) = read_documents(root)
+    assert stored_doc.files[0].thumbnail.tint_color == "#007f7f"